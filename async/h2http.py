@@ -0,0 +1,263 @@
+import asyncio
+import ssl
+from collections import deque
+from urllib.parse import urlsplit
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.errors import ErrorCodes
+from h2.events import (ConnectionTerminated, DataReceived, RemoteSettingsChanged, ResponseReceived,
+                       StreamEnded, StreamReset, WindowUpdated)
+from h2.exceptions import ProtocolError
+from h2.settings import SettingCodes
+from common.metrics import Metrics, CHUNK_SIZE
+from rawhttp import Unsupported
+
+# receive windows large enough that the server never waits for a
+# WINDOW_UPDATE while we count the bodies of many streams
+WINDOW_SIZE = 16 * 1024 * 1024
+
+
+def _name(code):
+    # h2 turns the error codes it knows into ErrorCodes
+    return getattr(code, 'name', code)
+
+
+class H2Response:
+    __slots__ = ('status', 'headers', 'size', 'words', 'lines')
+
+    def __init__(self, status, headers, metrics):
+        self.status = status
+        self.headers = headers
+        self.size, self.words, self.lines = metrics
+
+
+class _Stream:
+    __slots__ = ('future', 'status', 'headers', 'metrics')
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.status = None
+        self.headers = None
+        self.metrics = Metrics()
+
+
+class Http2Connection:
+    '''An HTTP/2 connection carrying many requests at once, one per stream.
+
+    `https` origins negotiate HTTP/2 with ALPN, `http` ones are spoken to
+    in HTTP/2 straight away (h2c with prior knowledge). No more streams are
+    opened than the server's SETTINGS_MAX_CONCURRENT_STREAMS allows. As with
+    the raw client, bodies are counted as they arrive and never kept.
+    '''
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.ssl = None
+        if parts.scheme == 'https':
+            self.ssl = ssl.create_default_context()
+            self.ssl.set_alpn_protocols(['h2'])
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.conn = H2Connection(H2Configuration(client_side=True, header_encoding='latin-1'))
+        self.streams = {}  # the open ones
+        self.max_streams = 0
+        self.closed = False
+        self.error = None
+        self.reader = None
+        self.writer = None
+        self._opened = None
+        self._reading = None
+        self._flushing = False
+        self._settled = asyncio.Event()  # the server's first SETTINGS came
+        self._window = asyncio.Event()  # the server let us send more
+        # requests waiting for a stream, woken one per stream that closes
+        self._waiters = deque()
+
+    async def open(self):
+        '''Connect once, whoever calls first; the others wait for it.'''
+        if self._opened is None:
+            self._opened = asyncio.ensure_future(self._connect())
+        await asyncio.shield(self._opened)
+
+    async def _connect(self):
+        try:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+        except BaseException as e:
+            self.closed = True
+            self.error = e
+            raise
+        if self.ssl and self.writer.get_extra_info('ssl_object').selected_alpn_protocol() != 'h2':
+            self.writer.close()
+            self.closed = True
+            raise Unsupported('no HTTP/2 in ALPN')
+        self.conn.initiate_connection()
+        self.conn.update_settings({SettingCodes.ENABLE_PUSH: 0, SettingCodes.INITIAL_WINDOW_SIZE: WINDOW_SIZE})
+        self.conn.increment_flow_control_window(WINDOW_SIZE)
+        self._flush()
+        self._reading = asyncio.ensure_future(self._read())
+        await self._settled.wait()
+        if self.closed:
+            raise self.error
+
+    async def request(self, headers, body=None):
+        '''Send a request, `headers` starting with the pseudo-headers, and
+        return its response once the stream ends.'''
+        while not self.closed and len(self.streams) >= self.max_streams:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()  # pass the stream on
+                raise
+        if self.closed:
+            raise self.error
+        stream_id = self.conn.get_next_available_stream_id()
+        stream = self.streams[stream_id] = _Stream()
+        try:
+            self.conn.send_headers(stream_id, headers, end_stream=not body)
+            self._flush_soon()
+            if body:
+                await self._send_body(stream_id, body)
+            return await stream.future
+        finally:
+            if self.streams.pop(stream_id, None) is not None and not self.closed:
+                # timed out or not wanted, the server can drop the stream
+                self.conn.reset_stream(stream_id, ErrorCodes.CANCEL)
+                self._flush_soon()
+                self._wake()
+
+    def _wake(self, n=1):
+        while n and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                n -= 1
+
+    async def _send_body(self, stream_id, body):
+        while body:
+            n = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if n <= 0:
+                self._window.clear()
+                await self._window.wait()
+                if self.closed:
+                    raise self.error
+                continue
+            self.conn.send_data(stream_id, body[:n], end_stream=len(body) <= n)
+            self._flush()
+            body = body[n:]
+
+    async def _read(self):
+        try:
+            while True:
+                data = await self.reader.read(CHUNK_SIZE)
+                if not data:
+                    raise ConnectionResetError('connection closed by the server')
+                for event in self.conn.receive_data(data):
+                    self._handle(event)
+                self._flush()
+        except (OSError, ProtocolError) as e:
+            # not HTTP/2 at all, the server answered the preface in HTTP/1.1
+            self._close(e if self._settled.is_set() else Unsupported(f'no HTTP/2: {e}'))
+
+    def _handle(self, event):
+        stream = self.streams.get(getattr(event, 'stream_id', None))
+        if isinstance(event, ResponseReceived) and stream:
+            headers = dict(event.headers)
+            stream.status = int(headers.pop(':status'))
+            stream.headers = headers
+            if headers.get('content-encoding', 'identity') != 'identity':
+                stream.future.set_exception(Unsupported('compressed body'))
+        elif isinstance(event, DataReceived):
+            self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+            if stream:
+                stream.metrics.feed(event.data)
+        elif isinstance(event, StreamEnded) and stream:
+            self._end(event.stream_id)
+            if not stream.future.done():
+                stream.future.set_result(H2Response(stream.status, stream.headers, stream.metrics))
+        elif isinstance(event, StreamReset) and stream:
+            self._end(event.stream_id)
+            if not stream.future.done():
+                stream.future.set_exception(ConnectionResetError(
+                    f'stream reset by the server: {_name(event.error_code)}'))
+        elif isinstance(event, RemoteSettingsChanged):
+            self.max_streams = self.conn.remote_settings.max_concurrent_streams
+            self._settled.set()
+            self._wake(len(self._waiters))
+        elif isinstance(event, WindowUpdated):
+            self._window.set()
+        elif isinstance(event, ConnectionTerminated):
+            # GOAWAY: streams up to the last one the server took may still finish
+            self.closed = True
+            self.error = ConnectionResetError(f'connection closed by the server: {_name(event.error_code)}')
+            for stream_id, stream in self.streams.items():
+                if stream_id > (event.last_stream_id or 0) and not stream.future.done():
+                    stream.future.set_exception(self.error)
+            self._wake(len(self._waiters))
+
+    def _end(self, stream_id):
+        del self.streams[stream_id]
+        self._wake()
+
+    def _flush_soon(self):
+        # the streams opened in one turn of the event loop go out in one write
+        if not self._flushing:
+            self._flushing = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flushing = False
+        data = self.conn.data_to_send()
+        if data and not self.writer.is_closing():
+            self.writer.write(data)
+
+    def _close(self, error):
+        self.closed = True
+        self.error = error
+        self._settled.set()
+        self._window.set()
+        self._wake(len(self._waiters))
+        for stream in self.streams.values():
+            if not stream.future.done():
+                stream.future.set_exception(error)
+        if self.writer:
+            self.writer.close()
+
+    def close(self):
+        if not self.closed and self.writer:
+            self.conn.close_connection()
+            self._flush()
+        self._close(ConnectionResetError('connection closed'))
+
+
+class Http2Client:
+    '''Requests spread over `connections` HTTP/2 connections per origin,
+    opened on first use and again when the server closes them.'''
+
+    def __init__(self, connections=1):
+        self.connections = connections
+        self.pools = {}
+        self.unsupported = set()  # origins without HTTP/2
+
+    async def request(self, headers, body=None):
+        origin = (headers[1][1], headers[2][1])  # :scheme, :authority
+        if origin in self.unsupported:
+            raise Unsupported('no HTTP/2')
+        pool = self.pools.setdefault(origin, [])
+        pool[:] = [conn for conn in pool if not conn.closed]
+        if len(pool) < self.connections:
+            pool.append(Http2Connection('{}://{}'.format(*origin)))
+        conn = min(pool, key=lambda conn: len(conn.streams))
+        try:
+            await conn.open()
+        except Unsupported:
+            self.unsupported.add(origin)
+            raise
+        return await conn.request(headers, body)
+
+    def close(self):
+        for pool in self.pools.values():
+            for conn in pool:
+                conn.close()
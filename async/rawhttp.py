@@ -0,0 +1,118 @@
+import asyncio
+import socket
+import ssl
+from urllib.parse import urlsplit
+from common.metrics import Metrics, CHUNK_SIZE
+
+# statuses that never have a body
+NO_BODY = {204, 304}
+
+
+class Unsupported(Exception):
+    '''A response the raw client does not handle, to be sent again with aiohttp.'''
+
+
+class RawResponse:
+    __slots__ = ('status', 'headers', 'size', 'words', 'lines', 'keep_alive')
+
+    def __init__(self, status, headers, metrics, keep_alive):
+        self.status = status
+        self.headers = headers
+        self.size, self.words, self.lines = metrics
+        self.keep_alive = keep_alive
+
+
+class RawConnection:
+    '''A keep-alive HTTP/1.1 connection for pre-rendered request bytes.
+
+    Requests may be pipelined: send() any number of them, then read the
+    responses back in order with read_response(). Bodies are counted as
+    they arrive and never kept; only the status line and headers are parsed.
+    '''
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.port = parts.port or (443 if self.ssl else 80)
+        self.reader = None
+        self.writer = None
+
+    def is_open(self):
+        return self.writer is not None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl)
+        # requests go out in one write; don't hold them back for ACKs
+        self.writer.get_extra_info('socket').setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def send(self, data):
+        self.writer.write(data)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+    async def read_response(self):
+        while True:
+            head = await self.reader.readuntil(b'\r\n\r\n')
+            if not head.startswith(b'HTTP/1.'):
+                raise Unsupported(f'not an HTTP/1.x response: {head[:16]!r}')
+            status = int(head[9:12])
+            if status >= 200:
+                break
+            if status == 101:
+                raise Unsupported('switching protocols')
+            # 100 Continue and other interim responses come before the real one
+
+        headers = {}
+        for line in head[head.index(b'\r\n') + 2:-4].split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            headers[name.strip().lower().decode('latin-1')] = value.strip().decode('latin-1')
+        if headers.get('content-encoding', 'identity') != 'identity':
+            raise Unsupported('compressed body')
+        connection = headers.get('connection', '').lower()
+        if head.startswith(b'HTTP/1.1'):
+            keep_alive = 'close' not in connection
+        else:
+            keep_alive = 'keep-alive' in connection
+
+        m = Metrics()
+        if status in NO_BODY:
+            pass
+        elif 'chunked' in headers.get('transfer-encoding', '').lower():
+            await self._read_chunked(m)
+        elif 'content-length' in headers:
+            await self._read_body(int(headers['content-length']), m)
+        else:
+            # no framing, the body runs to the end of the connection
+            while True:
+                chunk = await self.reader.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                m.feed(chunk)
+            keep_alive = False
+        return RawResponse(status, headers, m, keep_alive)
+
+    async def _read_body(self, size, m):
+        while size:
+            chunk = await self.reader.read(min(size, CHUNK_SIZE))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', size)
+            m.feed(chunk)
+            size -= len(chunk)
+
+    async def _read_chunked(self, m):
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            size = int(line.split(b';', 1)[0], 16)
+            if size == 0:
+                # skip the trailer section up to the final empty line
+                while await self.reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+                return
+            await self._read_body(size, m)
+            await self.reader.readexactly(2)
@@ -3,18 +3,80 @@ import asyncio
 import aiohttp
 from time import perf_counter
 import argparse
-from copy import deepcopy
-from re import split
+import os
+import sys
+from functools import partial
+from urllib.parse import urlsplit
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.template import RequestTemplate
+from common.metrics import Metrics, CHUNK_SIZE, PROBES, PROBE_SIZE, HEAD_UNSUPPORTED, content_length
+from common.wordlist import Progress
+from common.payloads import Payloads, MODES, parse_sources, parse_wordlist_arg
+from common.mutations import Mutator, comma_list
+from common.generators import parse_bounds
+from common.output import FORMATS, Console, open_writer, format_result, format_error, format_bytes
+from common.throttle import AsyncLimiter
+from common.stats import Stats, Sampler, new_timings, DOWNLOAD, PROCESS, TOTAL
+from rawhttp import RawConnection, Unsupported
+from common.control import AsyncControlServer
+from common.retry import RetryQueue, ErrorWriter, load_errors, describe, feed_retries, drain_retries
+from common.targets import FairScheduler, TARGET_KEYWORD
+from common.store import ResultStore, scan_meta
 
 
 parser = argparse.ArgumentParser(description='A simple sequential Web Fuzzer.\
-        Use keyword `FUZZ` in URL `-u`, post data `-d`, or header `-H` to define the fuzzing point.')
+        Use keyword `FUZZ` in URL `-u`, post data `-d`, header `-H`, or cookie `-b` to define the fuzzing point.\
+        Run `web-fuzzer.py query STORE_FILE` to explore the results saved with `--store`.')
 parser.add_argument('-u', '--url', action='store',
-                    required=True, help='Target URL (required)')
-parser.add_argument('-w', '--wordlist', action='store',
-                    required=True, help='Wordlist file path (required)')
+                    help='Target URL (required unless `-U` is given)')
+parser.add_argument('-U', '--targets', action='store', metavar='TARGETS_FILE',
+                    help='Fuzz every base URL of this file, one per line, taking turns; each fills the keyword `TARGET` (or `path:KEYWORD`), and `-u` defaults to `TARGET/FUZZ`')
+parser.add_argument('--host-concurrency', action='store', type=int, default=10,
+                    help='Maximum in-flight requests per target with `-U`, so a slow target only holds back itself (default: 10)')
+parser.add_argument('-w', '--wordlist', action='append',
+                    help='Wordlist file path and optional keyword `path:KEYWORD` (default keyword: FUZZ), use `-w users.txt:USER -w pass.txt:PASS` to fuzz multiple keywords (required unless `--range`, `--charset` or `--mask` is given)')
+parser.add_argument('--mode', action='store', choices=MODES, default='clusterbomb',
+                    help='How to combine multiple wordlists: every combination (clusterbomb) or the same line of each (pitchfork) (default: clusterbomb)')
 parser.add_argument('-e', '--encoding', action='store', default='utf-8',
                     help='Encoding for the wordlist, referring to Python Codecs (default: utf-8)')
+parser.add_argument('-c', '--concurrency', action='store', type=int,
+                    default=100, help='Number of in-flight requests, the upper bound with `--adaptive` (default: 100)')
+parser.add_argument('--raw', action='store_true',
+                    help='Send pre-rendered requests over plain keep-alive sockets instead of aiohttp, which still handles what the raw client cannot (default: false)')
+parser.add_argument('--pipeline', action='store', type=int, default=1,
+                    help='Number of requests pipelined on each connection with `--raw` (default: 1)')
+parser.add_argument('--http2', action='store_true',
+                    help='Send the requests as streams multiplexed over a few HTTP/2 connections per target, negotiated with ALPN for https and spoken straight away (h2c) for http, at most as many at once as the server allows; targets without HTTP/2 and responses it cannot handle are fetched with aiohttp (requires h2) (default: false)')
+parser.add_argument('--connections', action='store', type=int, default=1,
+                    help='Number of HTTP/2 connections per target with `--http2` (default: 1)')
+parser.add_argument('--adaptive', action='store_true',
+                    help='Adapt the number of in-flight requests to latency, timeouts, 429/503 responses and Retry-After (default: false)')
+parser.add_argument('--rate', action='store', type=float,
+                    help='Maximum requests per second (default: no limit)')
+parser.add_argument('--probe', action='store', choices=PROBES,
+                    help='Download as little of the bodies as possible: send HEAD instead of GET (head), or read at most `--probe-size` bytes of each body (get); responses are shown with the size announced by Content-Length and no word or line counts, unless their body ends within `--probe-size` bytes (default: off)')
+parser.add_argument('--probe-size', action='store', type=int, default=PROBE_SIZE,
+                    help='Bytes of a body read with `--probe get`, a body ending within them is measured in full (default: 65536)')
+parser.add_argument('--control', action='store', metavar='SOCKET_PATH',
+                    help='Listen for `stats`, `pause`, `resume`, `drain`, `concurrency N` and `rate R|off` on this unix socket while fuzzing, one command per line, each answered with the live statistics as JSON; `drain` lets the requests in flight finish, saves the results and progress and exits')
+parser.add_argument('--resume', action='store', metavar='STATE_FILE',
+                    help='Save progress to this file and resume from it if it exists')
+parser.add_argument('--retries', action='store', type=int, default=2,
+                    help='Send a payload whose request failed (connection error, timeout) again up to this many times, after a jittered exponential backoff (default: 2)')
+parser.add_argument('--errors', action='store', metavar='ERRORS_FILE',
+                    help='Write the payloads still failing after `--retries` to this file as JSON lines')
+parser.add_argument('--replay', action='store', metavar='ERRORS_FILE',
+                    help='Only send the payloads listed in the errors file of an earlier run with the same wordlists')
+parser.add_argument('--store', action='store', metavar='STORE_FILE',
+                    help='Save the status, size, words, lines and latency of every response to this file in compact columns, to filter, group and diff with `web-fuzzer.py query STORE_FILE`; added to with `--resume`')
+parser.add_argument('-o', '--output', action='store',
+                    help='Write results to this file')
+parser.add_argument('-of', '--output-format', action='store', choices=FORMATS,
+                    help='Output file format (default: csv for a `.csv` file, jsonl otherwise)')
+parser.add_argument('--stats', action='store', metavar='STATS_FILE',
+                    help='Write latency histograms of each request phase to this file as JSON, every 5 seconds and on exit')
+parser.add_argument('--profile', action='store', metavar='PROFILE_FILE',
+                    help='Sample the stacks of the fuzzer itself and write them to this file as collapsed stacks for flame graphs')
 parser.add_argument('-t', '--timeout', action='store', type=float,
                     default=100000.0, help='HTTP request timeout in seconds (default: 10.0)')
 http_arg_group = parser.add_argument_group('HTTP arguments')
@@ -28,27 +90,45 @@ http_arg_group.add_argument('-H', '--headers', action='store', nargs='+',
                             help='HTTP headers `"Key: Value"`, use `-H "Key1: Value1" "Key2: Value2" to set multiple headers')
 http_arg_group.add_argument('-r', '--redirect', action='store_true',
                             help='Follow redirects, add `-r` to follow (default: false)')
+generator_arg_group = parser.add_argument_group('Generator arguments')
+generator_arg_group.add_argument('--range', action='append', dest='ranges', metavar='START-END[:FORMAT][:KEYWORD]',
+                                 help='Numbers from START to END inclusive, formatted with a Python format spec, use `--range 0-999999:06d` for zero-padded IDs or `--range 1-100::ID` to set a keyword')
+generator_arg_group.add_argument('--charset', action='append', dest='charsets', metavar='CHARSET[:KEYWORD]',
+                                 help='Every string of `--len` characters from this charset, use `--charset abc0-9` for a, b, c and the digits')
+generator_arg_group.add_argument('--len', action='store', type=parse_bounds, default='1-4', dest='length', metavar='MIN-MAX',
+                                 help='Length of the strings of `--charset` (default: 1-4)')
+generator_arg_group.add_argument('--mask', action='append', dest='masks', metavar='MASK[:KEYWORD]',
+                                 help='Every string matching a mask of ?l (lowercase), ?u (uppercase), ?d (digit), ?h/?H (hex), ?s (symbol), ?a (any of these) and literal characters, use `--mask ?d?d?l?l`')
+mutation_arg_group = parser.add_argument_group('Mutation arguments')
+mutation_arg_group.add_argument('-x', '--extensions', action='store', type=comma_list,
+                                help='Also try each word with these extensions, use `-x php,html,bak` to set multiple extensions')
+mutation_arg_group.add_argument('--case', action='store', type=comma_list,
+                                help='Also try each word in these cases: lower, upper, title, use `--case lower,upper` to set multiple cases')
+mutation_arg_group.add_argument('--prefix', action='store', type=comma_list,
+                                help='Also try each word with these prefixes, use `--prefix .,_` to set multiple prefixes')
+mutation_arg_group.add_argument('--suffix', action='store', type=comma_list,
+                                help='Also try each word with these suffixes, use `--suffix ~,.old` to set multiple suffixes')
+mutation_arg_group.add_argument('--encode', action='store', type=comma_list,
+                                help='Also try each variant encoded with these: url, double (URL-encoded twice), base64')
+mutation_arg_group.add_argument('--dedup', action='store_true',
+                                help='Skip payloads already sent, keeping a hashed set of them (default: false)')
 
 keyword = 'FUZZ'
 total_req = 0
 success_req = 0
 error_req = 0
+saved_bytes = 0  # of the bodies not downloaded, as announced
 t0 = None
-tasks = []
-
-
-def get_fuzz_func(keyword, url, data, headers):
-    if keyword in url:
-        return fuzz_URL
-    elif data and keyword in data:
-        return fuzz_data
-    elif headers and any(keyword in key for key in headers.keys()):
-        return fuzz_header_key
-    elif headers and any(keyword in val for val in headers.values()):
-        return fuzz_header_value
-    else:
-        raise KeyError(
-            f'keyword {keyword} not found in URL, post data, and headers')
+console = None
+writer = None
+errors = None
+store = None
+retry = None
+stats = None
+scheduler = None
+probe = None
+probe_size = PROBE_SIZE
+draining = False  # set by the control channel, no new request goes out
 
 
 def _get_method(method, data):
@@ -79,103 +159,448 @@ def _get_dict_cookies(cookies):
     return ret
 
 
-def _build_request(method, url, headers, data, cookies):
+def _build_request(keywords, method, url, headers, data, cookies):
     method = _get_method(method, data)
     headers = _get_dict_headers(headers)
     cookies = _get_dict_cookies(cookies)
-    base_req = {'method': method, 'url': url,
-                'headers': headers, 'data': data, 'cookies': cookies}
-    return base_req
-
-
-async def fuzz_URL(s, keyword, base_req, word, timeout, redirect):
-    req = deepcopy(base_req)
-    req['url'] = req['url'].replace(keyword, word)
-    res = await s.request(**req, timeout=timeout, allow_redirects=redirect)
-    await print_res(res, word)
-
-
-async def fuzz_data(s, keyword, base_req, word, timeout, redirect):
-    req = deepcopy(base_req)
-    req['data'] = req['data'].replace(keyword, word)
-
-    res = await s.request(**req, timeout=timeout, allow_redirects=redirect)
-    await print_res(res, word)
-
-
-async def fuzz_header_key(s, keyword, base_req, word, timeout, redirect):
-    key_to_replace = []
-    for key in base_req['headers'].keys():
-        if keyword in key:
-            key_to_replace.append(key)
-    req = deepcopy(base_req)
-    for key in key_to_replace:
-        req['headers'][key.replace(keyword, word)] = req['headers'].pop(key)
-    res = await s.request(**req, timeout=timeout, allow_redirects=redirect)
-    await print_res(res, word)
-
-
-async def fuzz_header_value(s, keyword, base_req, word, timeout, redirect):
-    req = deepcopy(base_req)
-    for key in req['headers'].keys():
-        req['headers'][key] = req['headers'][key].replace(keyword, word)
-    res = await s.request(**req, timeout=timeout, allow_redirects=redirect)
-    await print_res(res, word)
-
-
-async def print_res(r, fuzz):
+    return RequestTemplate(keywords, method, url, headers, data, cookies)
+
+
+async def fuzz(s, template, i, words, label, limiter, timeout, redirect):
+    req = template.render(words)
+    sample = {}
+    timings = None if stats is None else new_timings()
+    await limiter.acquire()
+    t = perf_counter()
+    try:
+        res = None
+        if probe == 'head':
+            res = await s.request(**dict(req, method='HEAD'), timeout=timeout, allow_redirects=redirect,
+                                  trace_request_ctx=timings)
+            if res.status in HEAD_UNSUPPORTED:
+                res.release()
+                res = None
+        if res is None:
+            res = await s.request(**req, timeout=timeout, allow_redirects=redirect,
+                                  trace_request_ctx=timings)
+        sample = {'latency': perf_counter() - t, 'status': res.status,
+                  'retry_after': res.headers.get('Retry-After')}
+        await print_res(res, i, label, sample['latency'], timings)
+    except asyncio.TimeoutError:
+        sample = {'timeout': True}
+        raise
+    finally:
+        await limiter.release(**sample)
+    if timings:
+        timings[TOTAL] = perf_counter() - t
+        stats.record(timings)
+
+
+async def print_res(r, i, fuzz, latency, timings=None):
     global success_req
-    success_req += 1
-
-    duration = perf_counter() - t0
-    content = await r.content.read()
-    text = await r.text()
     status = r.status
-    size = len(content)
-    word = len(split(r'[^\S\n\t]', text))
-    line = len(text.split('\n'))
-
-    r.close()
-
-    print(
-        f'\033[1A{fuzz: <60} [Status: {status}, Size: {size}, Word: {word}, Line: {line}]')
-    print_status('\033[1B', duration)
-
+    t = perf_counter()
+    if probe is None:
+        m = Metrics()
+        async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+            m.feed(chunk)
+        size, word, line = m
+    else:
+        size, word, line = await probe_body(r)
 
-def print_status(prefix, duration):
+    r.release()
+    success_req += 1
+    if timings:
+        t_read = perf_counter()
+        timings[DOWNLOAD] = t_read - t
+
+    report(i, fuzz, status, size, word, line, latency)
+    if timings:
+        timings[PROCESS] = perf_counter() - t_read
+
+
+async def probe_body(r):
+    '''The size, words and lines of a response with `--probe`: those of its
+    body if it ends within `--probe-size` bytes, else the announced size.'''
+    global saved_bytes
+    if r.method == 'HEAD':
+        saved_bytes += content_length(r.headers, wire=True) or 0
+        return content_length(r.headers), None, None
+    m = Metrics()
+    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+        m.feed(chunk)
+        if m.size > probe_size:
+            saved_bytes += max(0, (content_length(r.headers, wire=True) or 0) - m.size)
+            r.close()
+            return content_length(r.headers), None, None
+    return tuple(m)
+
+
+def report(i, fuzz, status, size, word, line, latency):
+    console.result(format_result(fuzz, status, size, word, line))
+    if store is not None:
+        store.add(i, status, size, word, line, latency)
+    if writer:
+        writer.write({'fuzz': fuzz, 'status': status,
+                      'size': size, 'words': word, 'lines': line, 'latency': latency})
+
+
+def status_line():
+    duration = perf_counter() - t0
     rate = 0.
     if success_req != 0:
         rate = success_req / duration
 
-    msg = prefix
-    msg += f'====== Duration: {duration:.4f} sec, Rate: {rate:.4f} req/sec, Success: {success_req}, Error: {error_req}, Total: {success_req+error_req}/{total_req} ======'
-    print(msg)
+    saved = f', Saved: {format_bytes(saved_bytes)}' if probe else ''
+    return f'====== Duration: {duration:.4f} sec, Rate: {rate:.4f} req/sec, Success: {success_req}, Error: {error_req}, Total: {success_req+error_req}/{total_req}{saved} ======'
+
+
+def fail(progress, item, label, err):
+    global error_req
+    if retry.push(item):
+        return
+    error_req += 1
+    console.result(format_error(label, describe(err)))
+    if errors:
+        errors.write(item[0], label, describe(err))
+    progress.complete(item[0])
+
+
+def skip(progress, i):
+    # a duplicate payload is never sent
+    global total_req
+    total_req -= 1
+    progress.complete(i)
+
+
+async def control(limiter, concurrency, command, value):
+    '''Apply a command of the control channel and return the live statistics.'''
+    global draining
+    if command == 'drain':
+        # the payloads not sent yet are left for --resume
+        draining = True
+        await limiter.configure(paused=False)
+    elif command in ('pause', 'resume'):
+        await limiter.configure(paused=command == 'pause')
+    elif command == 'concurrency':
+        # there are no more workers than `--concurrency`
+        await limiter.configure(concurrency=min(value, concurrency))
+    elif command == 'rate':
+        await limiter.configure(rate=value or 0)
+    return live_stats(limiter)
+
+
+def live_stats(limiter):
+    duration = perf_counter() - t0
+    settings = limiter.settings()
+    paused = settings.pop('paused')
+    state = 'draining' if draining else 'paused' if paused else 'running'
+    return {'state': state, 'duration': round(duration, 3),
+            'rate': round(success_req / duration, 3) if duration else 0.,
+            'success': success_req, 'error': error_req,
+            'done': success_req + error_req, 'total': total_req,
+            'retrying': len(retry), 'saved_bytes': saved_bytes, **settings}
+
+
+async def produce(queue, items, worker_num):
+    async for item in items:
+        if draining:
+            break
+        await queue.put(item)
+        if len(retry):
+            await feed_retries(retry, queue)
+    await drain_retries(retry, queue, lambda: draining)
+    for _ in range(worker_num):
+        await queue.put(None)  # one stop signal per worker
+
+
+async def h2_fuzz(client, s, template, i, words, label, limiter, timeout, redirect):
+    '''Send the request for `words` as a stream of an HTTP/2 connection and
+    report the response; one the client cannot handle goes through aiohttp.'''
+    global success_req
+    headers, body = template.render_h2(words)
+    await limiter.acquire()
+    t = perf_counter()
+    try:
+        res = await asyncio.wait_for(client.request(headers, body), timeout)
+    except Unsupported:
+        await limiter.release()
+        return await fuzz(s, template, i, words, label, limiter, timeout, redirect)
+    except asyncio.TimeoutError:
+        await limiter.release(timeout=True)
+        raise
+    except BaseException:
+        await limiter.release()
+        raise
+    latency = perf_counter() - t
+    await limiter.release(latency, res.status, retry_after=res.headers.get('retry-after'))
+    if redirect and 300 <= res.status < 400 and 'location' in res.headers:
+        return await fuzz(s, template, i, words, label, limiter, timeout, redirect)
+    success_req += 1
+    report(i, label, res.status, res.size, res.words, res.lines, latency)
+    if stats:
+        timings = new_timings()
+        timings[TOTAL] = latency
+        stats.record(timings)
+
+
+async def work(queue, send, template, payloads, progress, limiter, timeout, redirect):
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        i, words = item
+        if draining:
+            # never sent, left for --resume
+            queue.task_done()
+            continue
+        try:
+            await send(template, i, words, payloads.label(words), limiter, timeout, redirect)
+        except Exception as e:
+            fail(progress, item, payloads.label(words), e)
+        else:
+            retry.done(item)
+            progress.complete(i)
+        if scheduler:
+            scheduler.done(i)
+        queue.task_done()
+        console.update()
+
+
+async def raw_fuzz(conn, s, batch, template, payloads, progress, limiter, timeout, redirect):
+    '''Send `batch`, holding a limiter slot per request, down one connection,
+    pipelined, and report the responses.
+
+    Returns the requests to send again because the connection closed before
+    their response came. A response the raw client cannot handle is fetched
+    again with aiohttp.
+    '''
+    global success_req
+    t = perf_counter()
+    fresh = not conn.is_open()
+    k = 0
+    try:
+        if fresh:
+            await asyncio.wait_for(conn.connect(), timeout)
+        conn.send(b''.join(template.render_bytes(words) for _, words in batch))
+        for k, (i, words) in enumerate(batch):
+            res = await asyncio.wait_for(conn.read_response(), timeout)
+            if redirect and 300 <= res.status < 400 and 'location' in res.headers:
+                raise Unsupported('redirect')
+            latency = perf_counter() - t
+            await limiter.release(latency, res.status, retry_after=res.headers.get('retry-after'))
+            success_req += 1
+            report(i, payloads.label(words), res.status, res.size, res.words, res.lines, latency)
+            if stats:
+                timings = new_timings()
+                timings[TOTAL] = latency
+                stats.record(timings)
+            retry.done(batch[k])
+            progress.complete(i)
+            console.update()
+            if not res.keep_alive:
+                conn.close()
+                k += 1
+                break
+        else:
+            return []
+    except Unsupported:
+        conn.close()
+        i, words = batch[k]
+        await limiter.release()
+        try:
+            await fuzz(s, template, i, words, payloads.label(words), limiter, timeout, redirect)
+        except Exception as e:
+            fail(progress, batch[k], payloads.label(words), e)
+        else:
+            retry.done(batch[k])
+            progress.complete(i)
+        k += 1
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as e:
+        conn.close()
+        # a fresh connection failing on its first response is the request's
+        # fault, anything else may be a keep-alive connection the server dropped
+        if fresh and k == 0:
+            await limiter.release(timeout=isinstance(e, asyncio.TimeoutError))
+            fail(progress, batch[0], payloads.label(batch[0][1]), e)
+            k = 1
+    for _ in batch[k:]:
+        await limiter.release()
+    return batch[k:]
+
+
+async def next_batch(queue, batch, depth):
+    '''Fill `batch` up to `depth` requests, only waiting while it is empty.
+    Returns False once the queue is finished.'''
+    while len(batch) < depth:
+        if batch:
+            try:
+                item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return True
+        else:
+            item = await queue.get()
+        if item is None:
+            return False
+        batch.append(item)
+    return True
+
+
+async def raw_work(queue, s, template, payloads, progress, limiter, timeout, redirect, depth):
+    conn = RawConnection(template.scheme + '://' + template.netloc)
+    pending = []
+    more = True
+    try:
+        while True:
+            if more:
+                more = await next_batch(queue, pending, depth)
+            if draining:
+                for _ in pending:
+                    queue.task_done()
+                pending = []
+                if more:
+                    continue
+            if not pending:
+                return
+            # wait for one slot, then pipeline as many more as are free
+            await limiter.acquire()
+            n = 1
+            while n < len(pending) and limiter.try_acquire():
+                n += 1
+            batch, pending = pending[:n], pending[n:]
+            resend = await raw_fuzz(conn, s, batch, template, payloads, progress,
+                                    limiter, timeout, redirect)
+            for _ in range(len(batch) - len(resend)):
+                queue.task_done()
+            pending = resend + pending
+    finally:
+        conn.close()
+
+
+async def each(items):
+    for item in items:
+        yield item
 
 
 async def main():
-    global total_req, t0
+    global total_req, t0, console, writer, errors, store, retry, stats, scheduler, probe, probe_size
     args = parser.parse_args()
-
+    if not (args.url or args.targets):
+        parser.error('one of -u/--url or -U/--targets is required')
+    if not (args.wordlist or args.ranges or args.charsets or args.masks):
+        parser.error('one of -w, --range, --charset or --mask is required')
+    if args.replay and args.resume:
+        parser.error('--replay cannot be combined with --resume')
+    if args.targets and args.raw:
+        parser.error('-U cannot be combined with --raw')
+    if args.probe and args.raw:
+        parser.error('--probe cannot be combined with --raw')
+    if args.http2 and (args.raw or args.probe):
+        parser.error('--http2 cannot be combined with --raw or --probe')
+    if args.probe == 'head' and (args.data or args.method != 'GET'):
+        parser.error('--probe head only applies to GET requests')
+
+    targets = parse_wordlist_arg(args.targets, TARGET_KEYWORD) if args.targets else None
+    url = args.url or (targets and f'{targets[1]}/{keyword}')
+    sources = parse_sources(args.wordlist, args.ranges, args.charsets, args.length, args.masks, keyword)
+    if args.raw and any(k in urlsplit(url).netloc for _, _, k in sources):
+        # each raw worker keeps one connection to the host of the URL
+        parser.error('--raw cannot be used with a keyword in the host of -u')
+    replay = None
+    if args.replay:
+        try:
+            replay = load_errors(args.replay)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f'cannot read errors file {args.replay}: {e}')
     timeout = aiohttp.ClientTimeout(total=args.timeout)
-    session = aiohttp.ClientSession(timeout=timeout)
-
-    headers = _get_dict_headers(args.headers)
-    fuzz_func = get_fuzz_func(keyword, args.url, args.data, headers)
-    base_req = _build_request(args.method, args.url,
+    # with several targets, each one is resolved once for the whole scan
+    connector = aiohttp.TCPConnector(limit=args.concurrency,
+                                     ttl_dns_cache=None if targets else 10)
+    trace_configs = []
+    if args.stats:
+        from common.aiotracing import trace_config
+        trace_configs.append(trace_config())
+        stats = Stats(args.stats)
+    session = aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                    trace_configs=trace_configs)
+    sampler = Sampler(args.profile).start() if args.profile else None
+
+    mutator = Mutator(args.extensions, args.case, args.prefix, args.suffix, args.encode)
+    payloads = Payloads.open(sources, args.encoding, args.mode, mutator, args.dedup, targets)
+    template = _build_request(payloads.keywords, args.method, url,
                               args.headers, args.data, args.cookies)
 
-    print('')  # allocate 1 line for printing
+    progress = Progress(args.resume, payloads)
+    if replay is not None:
+        progress.only(replay)
+    total_req = len(progress)
+    retry = RetryQueue(args.retries)
+    probe, probe_size = args.probe, args.probe_size
+    limiter = AsyncLimiter(args.concurrency, args.adaptive, args.rate)
+
+    console = Console(status_line)
+    writer = open_writer(args.output, args.output_format)
+    if args.errors:
+        errors = ErrorWriter(args.errors)
+    if args.store:
+        store = ResultStore.open(args.store, scan_meta(
+            url, _get_method(args.method, args.data), sources, args.encoding, args.mode, mutator,
+            targets, payloads), resume=bool(args.resume))
     t0 = perf_counter()
-    with open(args.wordlist, 'r', encoding=args.encoding) as wordlist:
-        for i, word in enumerate(wordlist):
-            word = word[:-1]
-            total_req += 1
-            task = asyncio.create_task(fuzz_func(session, keyword, base_req, word,
-                                                 args.timeout, args.redirect))
-            tasks.append(task)
-
-    await asyncio.wait(tasks)
-    await session.close()
+    control_server = client = None
+    if args.control:
+        control_server = await AsyncControlServer(
+            args.control, partial(control, limiter, args.concurrency)).start()
+    # bounded queue: the producer only reads ahead of the workers by a
+    # fixed amount, so memory stays flat whatever the wordlist size
+    queue = asyncio.Queue(maxsize=args.concurrency * 2)
+    if args.raw:
+        # one connection per `--pipeline` in-flight requests
+        workers = [asyncio.create_task(raw_work(queue, session, template, payloads, progress, limiter,
+                                                args.timeout, args.redirect, args.pipeline))
+                   for _ in range(-(-args.concurrency // args.pipeline))]
+    else:
+        send = partial(fuzz, session)
+        if args.http2:
+            from h2http import Http2Client
+            client = Http2Client(args.connections)
+            send = partial(h2_fuzz, client, session)
+        workers = [asyncio.create_task(work(queue, send, template, payloads, progress,
+                                            limiter, args.timeout, args.redirect))
+                   for _ in range(args.concurrency)]
+    ranges, done = progress.pending()
+    if targets:
+        # each target takes its turn, with at most `--host-concurrency` requests out
+        scheduler = FairScheduler([payloads.words(ranges, done, duplicate=partial(skip, progress), target=t)
+                                   for t in range(len(payloads.targets))], args.host_concurrency)
+        items = scheduler.drain()
+    else:
+        items = each(payloads.words(ranges, done, duplicate=partial(skip, progress)))
+    try:
+        await produce(queue, items, len(workers))
+        await asyncio.gather(*workers)
+    finally:
+        if control_server:
+            await control_server.close()
+        if client:
+            client.close()
+        progress.save()
+        await session.close()
+        console.close()
+        if writer:
+            writer.close()
+        if errors:
+            errors.close()
+        if store is not None:
+            store.save()
+        if stats:
+            stats.dump()
+        if sampler:
+            sampler.stop()
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['query']:
+        from common.query import main as query
+        query(sys.argv[2:])
+        parser.exit()
     asyncio.run(main())
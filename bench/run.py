@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+'''Runs every engine against the local stand-in server and compares them.
+
+Each engine is started as a child process over a generated wordlist and
+measured from the outside: wall time and completed requests from its final
+status line, latency percentiles from its result file, CPU time and peak
+RSS from the child's resource usage (the pool or shard processes included).
+'''
+import argparse
+import json
+import os
+import platform
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER = os.path.join(ROOT, 'bench', 'server.py')
+sys.path.insert(0, ROOT)
+from common.wordlist import Wordlist
+
+ENGINES = {
+    'sequential': ('sequential/web-fuzzer.py', []),
+    'async': ('async/web-fuzzer.py', ['-c', '{concurrency}']),
+    'async-raw': ('async/web-fuzzer.py', ['--raw', '-c', '{concurrency}']),
+    'async-h2': ('async/web-fuzzer.py', ['--http2', '-c', '{concurrency}']),
+    'multi-processing': ('multi-processing/web-fuzzer.py', ['-p', '{proc}', '-mc', 'all']),
+    'hybrid': ('multi-processing/web-fuzzer.py',
+               ['--hybrid', '-p', '{cores}', '-c', '{concurrency}', '-mc', 'all']),
+}
+SIZES = [10000, 100000, 1000000]
+STATUS_RE = re.compile(r'Success: (\d+), Error: (\d+)')
+# name, width and format of each column of the table
+COLUMNS = [('engine', 16, ''), ('words', 8, ''), ('req/s', 9, '.1f'), ('p50 ms', 8, '.2f'),
+           ('p99 ms', 8, '.2f'), ('cpu s', 8, '.2f'), ('rss MB', 8, '.1f'), ('errors', 7, '')]
+# how long an interrupted engine gets to save its progress and output
+KILL_GRACE = 10.
+
+parser = argparse.ArgumentParser(
+    description='Benchmark the fuzzers against a local HTTP server, no network access needed.')
+parser.add_argument('--engines', action='store', nargs='+', choices=list(ENGINES), default=list(ENGINES),
+                    help='Engines to run (default: all)')
+parser.add_argument('--sizes', action='store', nargs='+', type=int, default=SIZES,
+                    help='Wordlist sizes to run each engine over (default: 10000 100000 1000000)')
+parser.add_argument('--time-limit', action='store', type=float, default=60.,
+                    help='Stop a run with SIGINT after this many seconds and rate what it completed, 0 for no limit (default: 60)')
+parser.add_argument('-c', '--concurrency', action='store', type=int, default=100,
+                    help='In-flight requests for the async and hybrid engines (default: 100)')
+parser.add_argument('-p', '--proc', action='store', type=int, default=100,
+                    help='Processes for the multi-processing engine (default: 100)')
+parser.add_argument('--data-dir', action='store',
+                    help='Where generated wordlists are kept and reused (default: a temporary directory)')
+parser.add_argument('--json', action='store', metavar='FILE',
+                    help='Write the results to this file as JSON')
+parser.add_argument('--baseline', action='store', metavar='FILE',
+                    help='JSON results of an earlier run; exit with status 1 if any engine got slower')
+parser.add_argument('--tolerance', action='store', type=float, default=0.1,
+                    help='Fraction of req/s an engine may lose against the baseline (default: 0.1)')
+server_arg_group = parser.add_argument_group('Server arguments')
+server_arg_group.add_argument('--latency', action='store', type=float, default=0.,
+                              help='Seconds the server waits before each response (default: 0)')
+server_arg_group.add_argument('--body-size', action='store', type=int, default=1024,
+                              help='Body size of a miss (404) in bytes (default: 1024)')
+server_arg_group.add_argument('--hit-size', action='store', type=int, default=4096,
+                              help='Body size of a hit (200) in bytes (default: 4096)')
+server_arg_group.add_argument('--hit-rate', action='store', type=float, default=0.01,
+                              help='Fraction of paths answered with 200 (default: 0.01)')
+server_arg_group.add_argument('--error-rate', action='store', type=float, default=0.,
+                              help='Fraction of requests answered by closing the connection (default: 0)')
+server_arg_group.add_argument('--no-keep-alive', dest='keep_alive', action='store_false',
+                              help='Close the connection after every response (default: keep-alive)')
+server_arg_group.add_argument('--max-streams', action='store', type=int, default=100,
+                              help='Concurrent streams the server allows per HTTP/2 connection (default: 100)')
+server_arg_group.add_argument('--server-workers', action='store', type=int,
+                              default=max(1, (os.cpu_count() or 1) // 4),
+                              help='Server processes, so the server is not the bottleneck (default: a quarter of the CPU cores)')
+
+
+def make_wordlist(data_dir, size):
+    path = os.path.join(data_dir, f'words-{size}.txt')
+    if not os.path.exists(path):
+        with open(path + '.tmp', 'w') as f:
+            for start in range(0, size, 100000):
+                f.write(''.join(f'w{i:x}\n' for i in range(
+                    start, min(size, start + 100000))))
+        os.replace(path + '.tmp', path)
+    # build the line index up front, so the first engine does not pay for it
+    Wordlist(path, 'utf-8').close()
+    return path
+
+
+def start_server(args):
+    cmd = [sys.executable, SERVER, '--port', '0', '--latency', str(args.latency),
+           '--body-size', str(args.body_size), '--hit-size', str(args.hit_size),
+           '--hit-rate', str(args.hit_rate), '--error-rate', str(args.error_rate),
+           '--max-streams', str(args.max_streams), '--workers', str(args.server_workers)]
+    if not args.keep_alive:
+        cmd.append('--no-keep-alive')
+    server = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    port = int(server.stdout.readline())
+    return server, f'http://127.0.0.1:{port}'
+
+
+def wait(pid, deadline):
+    '''Wait for `pid`, interrupting it at `deadline`; return its rusage.'''
+    sig = signal.SIGINT
+    while True:
+        done, _, rusage = os.wait4(pid, os.WNOHANG)
+        if done:
+            return rusage
+        if sig and deadline and time.monotonic() >= deadline:
+            os.kill(pid, sig)
+            deadline += KILL_GRACE
+            sig = signal.SIGKILL if sig == signal.SIGINT else None
+        time.sleep(0.05)
+
+
+def percentile(values, q):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_engine(name, wordlist, size, url, args, work_dir):
+    script, extra = ENGINES[name]
+    fill = {'concurrency': args.concurrency, 'proc': args.proc,
+            'cores': os.cpu_count() or 1}
+    output = os.path.join(work_dir, f'{name}-{size}.jsonl')
+    log = os.path.join(work_dir, f'{name}-{size}.log')
+    cmd = [sys.executable, os.path.join(ROOT, script), '-u', f'{url}/FUZZ',
+           '-w', wordlist, '-o', output] + [a.format(**fill) for a in extra]
+
+    with open(log, 'w') as out:
+        t = time.monotonic()
+        proc = subprocess.Popen(cmd, stdout=out, stderr=subprocess.STDOUT)
+        deadline = t + args.time_limit if args.time_limit else None
+        rusage = wait(proc.pid, deadline)
+        seconds = time.monotonic() - t
+
+    with open(log) as f:
+        text = f.read()
+    counts = STATUS_RE.findall(text)
+    if not counts:
+        raise RuntimeError(f'{name} printed no status line:\n{text[-2000:]}')
+    success, error = map(int, counts[-1])
+    with open(output) as f:
+        latencies = sorted(json.loads(line)['latency'] for line in f)
+
+    return {
+        'engine': name,
+        'words': size,
+        'requests': success + error,
+        'errors': error,
+        'complete': success + error == size,
+        'seconds': seconds,
+        'req/s': (success + error) / seconds,
+        'p50 ms': percentile(latencies, 0.5) * 1000,
+        'p99 ms': percentile(latencies, 0.99) * 1000,
+        'cpu s': rusage.ru_utime + rusage.ru_stime,
+        # ru_maxrss is in KiB on Linux: the largest single process, not the sum
+        'rss MB': rusage.ru_maxrss / 1024,
+    }
+
+
+def _align(column):
+    return '<' if column == 'engine' else '>'
+
+
+def print_header():
+    print(' '.join(f'{c:{_align(c)}{w}}' for c, w, _ in COLUMNS))
+
+
+def print_row(run):
+    row = ' '.join(f'{run[c]:{_align(c)}{w}{f}}' for c, w, f in COLUMNS)
+    print(row + ('' if run['complete'] else '  (stopped at time limit)'), flush=True)
+
+
+def regressions(runs, baseline, tolerance):
+    previous = {(r['engine'], r['words']): r['req/s'] for r in baseline['runs']}
+    for run in runs:
+        before = previous.get((run['engine'], run['words']))
+        if before and run['req/s'] < before * (1 - tolerance):
+            yield run['engine'], run['words'], before, run['req/s']
+
+
+def main():
+    args = parser.parse_args()
+    server, url = start_server(args)
+    runs = []
+    print_header()
+    try:
+        with tempfile.TemporaryDirectory() as work_dir:
+            data_dir = args.data_dir or work_dir
+            os.makedirs(data_dir, exist_ok=True)
+            for size in args.sizes:
+                wordlist = make_wordlist(data_dir, size)
+                for name in args.engines:
+                    runs.append(run_engine(
+                        name, wordlist, size, url, args, work_dir))
+                    print_row(runs[-1])
+    finally:
+        server.terminate()
+        server.wait()
+
+    result = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'server': {k: getattr(args, k) for k in ('latency', 'body_size', 'hit_size', 'hit_rate',
+                                                 'error_rate', 'keep_alive', 'server_workers')},
+        'runs': runs,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = list(regressions(runs, json.load(f), args.tolerance))
+        for engine, words, before, now in slower:
+            print(f'regression: {engine} over {words} words, {before:.1f} -> {now:.1f} req/s')
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
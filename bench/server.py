@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+'''A local stand-in target for benchmarks: a small asyncio HTTP/1.1 server,
+which also speaks HTTP/2 to clients starting with its preface (h2c with
+prior knowledge) when h2 is installed.
+
+Whether a path is a hit (200), a miss (404) or an error (connection reset
+without a response) is decided by a hash of the path, so every run over
+the same wordlist sees exactly the same responses.
+'''
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import zlib
+try:
+    import h2.config
+    import h2.connection
+    import h2.errors
+    import h2.events
+    import h2.exceptions
+    import h2.settings
+except ImportError:
+    h2 = None
+
+parser = argparse.ArgumentParser(
+    description='A local HTTP server to benchmark the fuzzers against.')
+parser.add_argument('--host', action='store', default='127.0.0.1',
+                    help='Address to listen on (default: 127.0.0.1)')
+parser.add_argument('--port', action='store', type=int, default=8080,
+                    help='Port to listen on, 0 for any free port (default: 8080)')
+parser.add_argument('--latency', action='store', type=float, default=0.,
+                    help='Seconds to wait before answering each request (default: 0)')
+parser.add_argument('--body-size', action='store', type=int, default=1024,
+                    help='Body size of a miss (404) in bytes (default: 1024)')
+parser.add_argument('--hit-size', action='store', type=int, default=4096,
+                    help='Body size of a hit (200) in bytes (default: 4096)')
+parser.add_argument('--hit-rate', action='store', type=float, default=0.01,
+                    help='Fraction of paths answered with 200 (default: 0.01)')
+parser.add_argument('--error-rate', action='store', type=float, default=0.,
+                    help='Fraction of requests answered by closing the connection (default: 0)')
+parser.add_argument('--no-keep-alive', dest='keep_alive', action='store_false',
+                    help='Close the connection after every response (default: keep-alive)')
+parser.add_argument('--max-streams', action='store', type=int, default=100,
+                    help='SETTINGS_MAX_CONCURRENT_STREAMS of HTTP/2 connections (default: 100)')
+parser.add_argument('--workers', action='store', type=int, default=1,
+                    help='Number of server processes sharing the port (default: 1)')
+
+REASONS = {200: b'OK', 404: b'Not Found'}
+FILLER = b'lorem ipsum dolor sit amet consectetur adipiscing elit sed do\n'
+SCALE = 1 << 16
+H2_PREFACE = b'PRI * HTTP/2.0\r\n\r\n'
+
+
+def _body(size):
+    return (FILLER * (size // len(FILLER) + 1))[:size]
+
+
+class Stub:
+    def __init__(self, latency=0., body_size=1024, hit_size=4096, hit_rate=0.01, error_rate=0., keep_alive=True,
+                 max_streams=100):
+        self.latency = latency
+        self.keep_alive = keep_alive
+        self.max_streams = max_streams
+        self.hit_below = int(hit_rate * SCALE)
+        self.error_below = int(error_rate * SCALE)
+        connection = b'keep-alive' if keep_alive else b'close'
+        self.bodies = {200: _body(hit_size), 404: _body(body_size)}
+        self.responses = {}
+        for status, body in self.bodies.items():
+            self.responses[status] = (b'HTTP/1.1 %d %s\r\nContent-Type: text/html\r\n'
+                                      b'Content-Length: %d\r\nConnection: %s\r\n\r\n'
+                                      % (status, REASONS[status], len(body), connection), body)
+
+    def status(self, path):
+        '''The status of the response to `path`, or None for an error.'''
+        h = zlib.crc32(path)
+        if (h >> 16) < self.error_below:
+            return None
+        return 200 if (h & 0xffff) < self.hit_below else 404
+
+    def respond(self, method, path):
+        '''The response bytes for a request, or None to drop the connection.'''
+        status = self.status(path)
+        if status is None:
+            return None
+        head, body = self.responses[status]
+        return head if method == b'HEAD' else head + body
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                if head == H2_PREFACE and h2 is not None:
+                    return await self.handle_h2(head, reader, writer)
+                method, path, _ = head.split(b' ', 2)
+                size = 0
+                for line in head.split(b'\r\n')[1:]:
+                    key, _, val = line.partition(b':')
+                    if key.strip().lower() == b'content-length':
+                        size = int(val)
+                if size:
+                    await reader.readexactly(size)
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                res = self.respond(method, path)
+                if res is None:
+                    writer.transport.abort()
+                    return
+                writer.write(res)
+                await writer.drain()
+                if not self.keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        writer.close()
+
+    async def handle_h2(self, preface, reader, writer):
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+        conn.initiate_connection()
+        conn.update_settings({h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: self.max_streams})
+        data = preface
+        requests = {}  # stream id -> (method, path) until the request ends
+        tasks = set()
+        try:
+            while data:
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        headers = dict(event.headers)
+                        requests[event.stream_id] = (headers[b':method'], headers[b':path'])
+                    elif isinstance(event, h2.events.DataReceived):
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        # streams are answered concurrently, each after the latency
+                        task = asyncio.ensure_future(self.respond_h2(
+                            conn, writer, event.stream_id, *requests.pop(event.stream_id)))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                writer.write(conn.data_to_send())
+                data = await reader.read(65536)
+        except (h2.exceptions.ProtocolError, ConnectionError):
+            pass
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+    async def respond_h2(self, conn, writer, stream_id, method, path):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        try:
+            status = self.status(path)
+            if status is None:
+                conn.reset_stream(stream_id, h2.errors.ErrorCodes.INTERNAL_ERROR)
+            else:
+                body = b'' if method == b'HEAD' else self.bodies[status]
+                conn.send_headers(stream_id, [(':status', str(status)), ('content-type', 'text/html'),
+                                              ('content-length', str(len(self.bodies[status])))],
+                                  end_stream=not body)
+                # the client's windows are assumed large enough for the body
+                size = conn.max_outbound_frame_size
+                for i in range(0, len(body), size):
+                    conn.send_data(stream_id, body[i:i + size], end_stream=i + size >= len(body))
+        except h2.exceptions.StreamClosedError:
+            return  # reset by the client meanwhile
+        if not writer.is_closing():
+            writer.write(conn.data_to_send())
+
+
+async def serve(stub, sock):
+    server = await asyncio.start_server(stub.handle, sock=sock, backlog=4096)
+    loop = asyncio.get_running_loop()
+    stop = loop.create_future()
+    loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
+    loop.add_signal_handler(signal.SIGINT, stop.set_result, None)
+    async with server:
+        await stop
+
+
+def listen(host, port):
+    # asyncio only turns Nagle off on accepted sockets whose proto is TCP;
+    # left on, pipelined responses wait for delayed ACKs
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(4096)
+    return sock
+
+
+def run(args, sock):
+    stub = Stub(args.latency, args.body_size, args.hit_size,
+                args.hit_rate, args.error_rate, args.keep_alive, args.max_streams)
+    asyncio.run(serve(stub, sock))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    sock = listen(args.host, args.port)
+    # the port is printed first, so a caller asking for port 0 can read it
+    print(sock.getsockname()[1], flush=True)
+
+    # workers share the listening socket and the kernel spreads connections
+    children = []
+    for _ in range(args.workers - 1):
+        pid = os.fork()
+        if pid == 0:
+            run(args, sock)
+            os._exit(0)
+        children.append(pid)
+    try:
+        run(args, sock)
+    finally:
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
@@ -0,0 +1 @@
+'''The modules the sequential, async and multi-processing engines share.'''
@@ -0,0 +1,35 @@
+from time import perf_counter
+import aiohttp
+from .stats import QUEUE, DNS, CONNECT, WAIT
+
+
+def trace_config():
+    '''An aiohttp TraceConfig filling in the pool queue, DNS, connect and wait
+    phases of the timings list passed as `trace_request_ctx`. The connect
+    phase includes the TLS handshake, which aiohttp does not time apart.'''
+    config = aiohttp.TraceConfig()
+
+    def start(attr):
+        async def on_start(session, ctx, params):
+            setattr(ctx, attr, perf_counter())
+        return on_start
+
+    def end(attr, phase, minus=None):
+        async def on_end(session, ctx, params):
+            timings = ctx.trace_request_ctx
+            if timings is not None:
+                timings[phase] = perf_counter() - getattr(ctx, attr)
+                if minus is not None and timings[minus] is not None:
+                    timings[phase] -= timings[minus]
+        return on_end
+
+    config.on_connection_queued_start.append(start('t_queue'))
+    config.on_connection_queued_end.append(end('t_queue', QUEUE))
+    config.on_dns_resolvehost_start.append(start('t_dns'))
+    config.on_dns_resolvehost_end.append(end('t_dns', DNS))
+    config.on_connection_create_start.append(start('t_connect'))
+    # the connection is created around the DNS lookup
+    config.on_connection_create_end.append(end('t_connect', CONNECT, DNS))
+    config.on_request_headers_sent.append(start('t_sent'))
+    config.on_request_end.append(end('t_sent', WAIT))
+    return config
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import multiprocessing as mp
+import os
+import socket
+import threading
+
+COMMANDS = ['stats', 'pause', 'resume', 'drain', 'concurrency', 'rate']
+
+
+def parse_command(line):
+    '''Split a control line like `concurrency 20` into its command and value.'''
+    name, _, value = line.strip().partition(' ')
+    if name not in COMMANDS:
+        raise ValueError(f'unknown command {name}, use one of {", ".join(COMMANDS)}')
+    value = value.strip()
+    try:
+        if name == 'concurrency':
+            value = int(value)
+            if value < 1:
+                raise ValueError
+        elif name == 'rate':
+            value = None if value in ('off', '0') else float(value)
+            if value is not None and value <= 0:
+                raise ValueError
+        else:
+            value = None
+    except ValueError:
+        raise ValueError(f'invalid value for {name}, use `concurrency N` or `rate R|off`') from None
+    return name, value
+
+
+def _reply(result):
+    return json.dumps(result).encode() + b'\n'
+
+
+def _failed(error):
+    return _reply({'ok': False, 'error': str(error)})
+
+
+def _remove(path):
+    # a socket left by a run that crashed
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+class ControlServer:
+    '''Control commands on a unix socket, one per line, each answered with
+    the live statistics as a JSON line. `handle(command, value)` applies a
+    command and returns the statistics; it is called from the server's
+    threads.'''
+
+    def __init__(self, path, handle):
+        self.path = path
+        self.handle = handle
+        self.sock = None
+
+    def start(self):
+        _remove(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen()
+        threading.Thread(target=self._accept, daemon=True).start()
+        return self
+
+    def close(self):
+        self.sock.close()
+        _remove(self.path)
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with conn, conn.makefile('rb') as lines:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    reply = _reply({'ok': True, **self.handle(*parse_command(line.decode()))})
+                except ValueError as e:
+                    reply = _failed(e)
+                try:
+                    conn.sendall(reply)
+                except OSError:
+                    return
+
+
+class AsyncControlServer(ControlServer):
+    '''The same commands on an event loop, `handle` being a coroutine function.'''
+
+    def __init__(self, path, handle):
+        super().__init__(path, handle)
+        self.writers = set()  # of the clients connected
+
+    async def start(self):
+        _remove(self.path)
+        self.sock = await asyncio.start_unix_server(self._serve, self.path)
+        return self
+
+    async def close(self):
+        '''Stop listening and hang up on the clients still connected.'''
+        self.sock.close()
+        for writer in self.writers:
+            writer.close()
+        await self.sock.wait_closed()
+        _remove(self.path)
+
+    async def _serve(self, reader, writer):
+        self.writers.add(writer)
+        try:
+            while line := await reader.readline():
+                if not line.strip():
+                    continue
+                try:
+                    writer.write(_reply({'ok': True, **await self.handle(*parse_command(line.decode()))}))
+                except ValueError as e:
+                    writer.write(_failed(e))
+                await writer.drain()
+        except (OSError, asyncio.CancelledError):
+            # the client left, or the run ended with the client still connected
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+
+class SharedControl:
+    '''The pause, drain, concurrency and rate settings of a run, shared with
+    the processes fuzzing its shards, which poll them with changed().'''
+    _FIELDS = ('version', 'paused', 'draining', 'concurrency', 'rate')
+
+    def __init__(self, concurrency, rate):
+        self._values = mp.Array('d', [0, 0, 0, concurrency, rate or 0])
+        self._seen = 0
+
+    def set(self, **settings):
+        with self._values.get_lock():
+            for name, value in settings.items():
+                self._values[self._FIELDS.index(name)] = 0 if value is None else value
+            self._values[0] += 1
+
+    def get(self):
+        '''The settings, rate None if there is no limit.'''
+        with self._values.get_lock():
+            values = dict(zip(self._FIELDS, self._values))
+        values['paused'] = bool(values['paused'])
+        values['draining'] = bool(values['draining'])
+        values['concurrency'] = int(values['concurrency'])
+        values['rate'] = values['rate'] or None
+        return values
+
+    def changed(self):
+        '''The settings if they changed since the last call in this process, else None.'''
+        if self._values[0] == self._seen:
+            return None
+        settings = self.get()
+        self._seen = settings['version']
+        return settings
@@ -0,0 +1,139 @@
+import string
+
+# mask placeholders, as in hashcat
+MASK_CHARSETS = {
+    'l': string.ascii_lowercase,
+    'u': string.ascii_uppercase,
+    'd': string.digits,
+    'h': '0123456789abcdef',
+    'H': '0123456789ABCDEF',
+    's': ' ' + string.punctuation,
+    '?': '?',
+}
+MASK_CHARSETS['a'] = MASK_CHARSETS['l'] + MASK_CHARSETS['u'] + MASK_CHARSETS['d'] + MASK_CHARSETS['s']
+
+
+def parse_bounds(spec):
+    '''Parse a `START-END` or `N` command line value into `(start, end)`.'''
+    start, sep, end = spec.partition('-')
+    try:
+        start = int(start)
+        end = int(end) if sep else start
+    except ValueError:
+        raise ValueError(f'invalid bounds {spec}, use START-END like 1-4') from None
+    if start < 0 or end < start:
+        raise ValueError(f'invalid bounds {spec}, use START-END like 1-4')
+    return start, end
+
+
+def expand_charset(spec):
+    '''The characters of `abc0-9` style charsets, in order and without repeats.'''
+    chars = []
+    i = 0
+    while i < len(spec):
+        if i + 2 < len(spec) and spec[i + 1] == '-' and spec[i] <= spec[i + 2]:
+            chars.extend(chr(c) for c in range(ord(spec[i]), ord(spec[i + 2]) + 1))
+            i += 3
+        else:
+            chars.append(spec[i])
+            i += 1
+    return ''.join(dict.fromkeys(chars))
+
+
+def _decode(i, charsets):
+    '''Word `i` of the product of `charsets`, the last one varying fastest.'''
+    chars = []
+    for charset in reversed(charsets):
+        i, d = divmod(i, len(charset))
+        chars.append(charset[d])
+    return ''.join(reversed(chars))
+
+
+class NumberRange:
+    '''The numbers from `start` to `end` inclusive, formatted with `fmt`.'''
+
+    def __init__(self, start, end, fmt='d'):
+        format(start, fmt)  # raises ValueError on a bad format
+        self.start = start
+        self.end = end
+        self.fmt = fmt
+        self.path = f'range:{start}-{end}:{fmt}'
+
+    @classmethod
+    def parse(cls, spec):
+        bounds, _, fmt = spec.partition(':')
+        return cls(*parse_bounds(bounds), fmt or 'd')
+
+    def __len__(self):
+        return self.end - self.start + 1
+
+    def word(self, i):
+        return format(self.start + i, self.fmt)
+
+    def close(self):
+        pass
+
+
+class Charset:
+    '''Every string of `min_len` to `max_len` characters of a charset,
+    shortest first.'''
+
+    def __init__(self, charset, min_len, max_len):
+        self.chars = expand_charset(charset)
+        if not self.chars:
+            raise ValueError('empty charset')
+        self.path = f'charset:{charset}:{min_len}-{max_len}'
+        # one product of the charset per length, with the number of words in it
+        n = len(self.chars)
+        self._lengths = [([self.chars] * k, n ** k) for k in range(min_len, max_len + 1)]
+
+    @classmethod
+    def parse(cls, spec):
+        '''Parse `CHARSET:MIN-MAX`.'''
+        charset, _, bounds = spec.rpartition(':')
+        return cls(charset, *parse_bounds(bounds))
+
+    def __len__(self):
+        return sum(count for _, count in self._lengths)
+
+    def word(self, i):
+        for charsets, count in self._lengths:
+            if i < count:
+                return _decode(i, charsets)
+            i -= count
+        raise IndexError(i)
+
+    def close(self):
+        pass
+
+
+class Mask:
+    '''Every string matching a mask like `?d?d?l?l`, see MASK_CHARSETS.'''
+
+    def __init__(self, mask):
+        self.path = f'mask:{mask}'
+        self.charsets = []
+        i = 0
+        while i < len(mask):
+            if mask[i] != '?':
+                self.charsets.append(mask[i])
+                i += 1
+                continue
+            placeholder = mask[i + 1:i + 2]
+            if placeholder not in MASK_CHARSETS:
+                raise ValueError(
+                    f'unknown mask placeholder ?{placeholder}, use one of {", ".join("?" + p for p in MASK_CHARSETS)}')
+            self.charsets.append(MASK_CHARSETS[placeholder])
+            i += 2
+        self._len = 1
+        for charset in self.charsets:
+            self._len *= len(charset)
+
+    def __len__(self):
+        return self._len
+
+    def word(self, i):
+        return _decode(i, self.charsets)
+
+    def close(self):
+        pass
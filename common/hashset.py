@@ -0,0 +1,39 @@
+from array import array
+from hashlib import blake2b
+
+
+class HashSet:
+    '''A set of strings kept as 64-bit hashes in an open-addressing table.
+
+    An entry costs 16 to 32 bytes however long the string: the table is an
+    array of 64-bit slots, doubled whenever it gets half full. Two strings
+    sharing a hash is possible in theory, and unlikely below billions.
+    '''
+
+    def __init__(self, capacity=1 << 16):
+        self.slots = array('Q', bytes(8 * capacity))  # a power of two
+        self.count = 0
+
+    def add(self, key):
+        '''Add `key` and return whether it was new.'''
+        h = int.from_bytes(blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        if not self._insert(self.slots, h):
+            return False
+        self.count += 1
+        if self.count * 2 > len(self.slots):
+            old, self.slots = self.slots, array('Q', bytes(16 * len(self.slots)))
+            for h in old:
+                if h:
+                    self._insert(self.slots, h)
+        return True
+
+    @staticmethod
+    def _insert(slots, h):
+        mask = len(slots) - 1
+        i = h & mask
+        while slots[i]:
+            if slots[i] == h:
+                return False
+            i = (i + 1) & mask
+        slots[i] = h
+        return True
@@ -0,0 +1,99 @@
+from zlib import crc32
+
+# whitespace that separates words, i.e. what `[^\S\n\t]` matches: single
+# bytes in ASCII, UTF-8 sequences beyond
+WORD_SEPARATORS = b' \r\x0b\x0c\x1c\x1d\x1e\x1f'
+WIDE_SEPARATORS = tuple(chr(c).encode() for c in (
+    0x85, 0xa0, 0x1680, *range(0x2000, 0x200b), 0x2028, 0x2029, 0x202f, 0x205f, 0x3000))
+# how a chunk can end in the middle of a wide separator
+_CUT = {sep[:n] for sep in WIDE_SEPARATORS for n in range(1, len(sep))}
+CHUNK_SIZE = 64 * 1024
+# unwanted bodies up to this size are drained to keep the connection alive,
+# larger or unknown ones are cut off by closing the connection
+DRAIN_LIMIT = 64 * 1024
+# --probe head sends HEAD and only gets the body when it is needed, --probe
+# get reads a body it does not need up to PROBE_SIZE bytes, and measures it
+# only if it ends there
+PROBES = ['head', 'get']
+PROBE_SIZE = 64 * 1024
+# a server answering HEAD with these does not handle it, GET is sent instead
+HEAD_UNSUPPORTED = (405, 501)
+
+
+class Metrics:
+    '''Size, word and line counts of a body, fed chunk by chunk.
+
+    Counts match `len(re.split(r'[^\\S\\n\\t]', text))` and
+    `len(text.split('\\n'))` on the text of an ASCII or UTF-8 body, without
+    decoding it or building lists.
+    '''
+    __slots__ = ('size', 'words', 'lines', 'digest', '_tail')
+
+    def __init__(self, digest=False):
+        self.size = 0
+        self.words = 1
+        self.lines = 1
+        # CRC32 of the body, only computed when asked for
+        self.digest = 0 if digest else None
+        self._tail = b''  # the start of a wide separator the last chunk cut
+
+    def feed(self, chunk):
+        size = len(chunk)
+        self.size += size
+        self.words += size - len(chunk.translate(None, WORD_SEPARATORS))
+        if self._tail or not chunk.isascii():
+            self._count_wide(chunk)
+        self.lines += chunk.count(b'\n')
+        if self.digest is not None:
+            self.digest = crc32(chunk, self.digest)
+
+    def _count_wide(self, chunk):
+        data = self._tail + chunk
+        self.words += sum(data.count(sep) for sep in WIDE_SEPARATORS)
+        self._tail = data[-2:] if data[-2:] in _CUT else data[-1:] if data[-1:] in _CUT else b''
+
+    def __iter__(self):
+        return iter((self.size, self.words, self.lines))
+
+
+def measure(content, digest=False):
+    m = Metrics(digest)
+    for i in range(0, len(content), CHUNK_SIZE):
+        m.feed(content[i:i + CHUNK_SIZE])
+    return m
+
+
+def content_length(headers, wire=False):
+    '''Body size announced by the headers, or None if it can't be trusted.
+    With `wire`, the size sent over the network, compressed or not.'''
+    if 'Content-Encoding' in headers and not wire:
+        return None  # the decoded size is what we report
+    try:
+        return int(headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+
+
+if __name__ == '__main__':
+    from re import split
+    from timeit import timeit
+
+    def _split_metrics(content):
+        text = content.decode('utf-8')
+        return len(content), len(split(r'[^\S\n\t]', text)), len(text.split('\n'))
+
+    wide = ' '.join(sep.decode() for sep in WIDE_SEPARATORS).encode()
+    for n in range(1, len(wide) + 1):
+        m = Metrics()
+        for i in range(0, len(wide), n):
+            m.feed(wide[i:i + n])
+        assert tuple(m) == _split_metrics(wide)
+    for size in (1024, 1024 * 1024, 16 * 1024 * 1024):
+        content = (b'lorem ipsum dolor\tsit amet,\r\nconsectetur adipiscing elit\n'
+                   * (size // 56 + 1))[:size]
+        assert tuple(measure(content)) == _split_metrics(content)
+        number = max(1, 64 * 1024 * 1024 // size)
+        t_split = timeit(lambda: _split_metrics(content), number=number) / number
+        t_bytes = timeit(lambda: tuple(measure(content)), number=number) / number
+        print(f'{size: >9} bytes: decode+split {t_split * 1e3:.4f} ms, '
+              f'bytes {t_bytes * 1e3:.4f} ms, speedup {t_split / t_bytes:.1f}x')
@@ -0,0 +1,88 @@
+import base64
+from urllib.parse import quote
+
+
+def _url(word):
+    return quote(word, safe='')
+
+
+def _double_url(word):
+    return quote(quote(word, safe=''), safe='')
+
+
+def _base64(word):
+    return base64.b64encode(word.encode()).decode()
+
+
+CASES = {'lower': str.lower, 'upper': str.upper, 'title': str.title}
+ENCODINGS = {'url': _url, 'double': _double_url, 'base64': _base64}
+
+
+def comma_list(value):
+    '''Parse a `a,b,c` command line value.'''
+    return [v for v in value.split(',') if v]
+
+
+class Mutator:
+    '''Turns a word into variants: the word itself plus every combination of
+    the given case, prefix, suffix, extension and encoding.
+
+    The `v`th variant is decoded from `v` alone, so a mutated wordlist keeps
+    a fixed length and random access.
+    '''
+
+    def __init__(self, extensions=None, cases=None, prefixes=None, suffixes=None, encodings=None):
+        for name, given, known in (('case', cases, CASES), ('encoding', encodings, ENCODINGS)):
+            for value in given or []:
+                if value not in known:
+                    raise ValueError(f'unknown {name} {value}, use one of {", ".join(known)}')
+        # None and '' stand for leaving the word as it is
+        self.cases = [None] + list(cases or [])
+        self.prefixes = [''] + list(prefixes or [])
+        self.suffixes = [''] + list(suffixes or [])
+        self.extensions = [''] + ['.' + e.lstrip('.') for e in extensions or []]
+        self.encodings = [None] + list(encodings or [])
+        self.size = len(self.cases) * len(self.prefixes) * len(self.suffixes) \
+            * len(self.extensions) * len(self.encodings)
+
+    def spec(self):
+        '''The arguments giving this mutator again.'''
+        return {'extensions': self.extensions[1:], 'cases': self.cases[1:], 'prefixes': self.prefixes[1:],
+                'suffixes': self.suffixes[1:], 'encodings': self.encodings[1:]}
+
+    def variant(self, word, v):
+        v, e = divmod(v, len(self.encodings))
+        v, x = divmod(v, len(self.extensions))
+        v, s = divmod(v, len(self.suffixes))
+        c, p = divmod(v, len(self.prefixes))
+        case = self.cases[c]
+        if case:
+            word = CASES[case](word)
+        word = self.prefixes[p] + word + self.suffixes[s] + self.extensions[x]
+        encoding = self.encodings[e]
+        return ENCODINGS[encoding](word) if encoding else word
+
+
+class Mutated:
+    '''A wordlist whose `i`th word is variant `i % size` of word `i // size`.'''
+
+    def __init__(self, wordlist, mutator):
+        self.wordlist = wordlist
+        self.mutator = mutator
+        self._base = (None, None)  # the last word read, its variants come in a row
+
+    @property
+    def path(self):
+        return self.wordlist.path
+
+    def __len__(self):
+        return len(self.wordlist) * self.mutator.size
+
+    def word(self, i):
+        n, v = divmod(i, self.mutator.size)
+        if self._base[0] != n:
+            self._base = (n, self.wordlist.word(n))
+        return self.mutator.variant(self._base[1], v)
+
+    def close(self):
+        self.wordlist.close()
@@ -0,0 +1,127 @@
+import csv
+import json
+import os
+import sys
+from time import monotonic
+
+FORMATS = ['jsonl', 'csv']
+FIELDS = ['fuzz', 'status', 'size', 'words', 'lines', 'latency']
+BATCH_SIZE = 512
+STATUS_INTERVAL = 0.1  # 10 Hz
+
+
+class ResultWriter:
+    '''Writes result records to a file in batches of `batch_size`.'''
+
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.batch_size = batch_size
+        self.batch = []
+
+    def write(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self._write_batch(self.batch)
+            self.batch = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def _write_batch(self, batch):
+        raise NotImplementedError
+
+
+class JsonlWriter(ResultWriter):
+    def _write_batch(self, batch):
+        self.file.write(''.join(json.dumps(r) + '\n' for r in batch))
+
+
+class CsvWriter(ResultWriter):
+    def __init__(self, path, batch_size=BATCH_SIZE):
+        super().__init__(path, batch_size)
+        self.writer = csv.DictWriter(
+            self.file, FIELDS, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def _write_batch(self, batch):
+        self.writer.writerows(batch)
+
+
+def open_writer(path, fmt=None):
+    '''Open a result writer, guessing the format from the file extension.'''
+    if path is None:
+        return None
+    if fmt is None:
+        fmt = 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'jsonl'
+    if fmt not in FORMATS:
+        raise ValueError(f'unknown output format {fmt}, use one of {", ".join(FORMATS)}')
+    return CsvWriter(path) if fmt == 'csv' else JsonlWriter(path)
+
+
+def format_result(fuzz, status, size, word, line, found=None):
+    # `-` for what was not measured, like the counts of an unread body
+    size, word, line = ('-' if n is None else n for n in (size, word, line))
+    result = f'{fuzz: <60} [Status: {status}, Size: {size}, Word: {word}, Line: {line}]'
+    if found and 'signatures' in found:
+        result += f' [Signatures: {", ".join(found["signatures"])}]'
+    if found and 'extract' in found:
+        result += f' [Extract: {", ".join(f"{k}={v}" for k, v in found["extract"].items())}]'
+    return result
+
+
+def format_bytes(n):
+    '''A byte count for the status line, like `12.3 MiB`.'''
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if n < 1024 or unit == 'GiB':
+            return f'{n} {unit}' if unit == 'B' else f'{n:.1f} {unit}'
+        n /= 1024
+
+
+def format_error(fuzz, error):
+    return f'{fuzz: <60} [Error: {error}]'
+
+
+class Console:
+    '''Result lines under a status line redrawn at most every `interval` seconds.
+
+    Result lines are buffered and written together with the status line.
+    When the stream is not a terminal, results are plain lines and the
+    status is only written once, by close().
+    '''
+
+    def __init__(self, status, stream=None, interval=STATUS_INTERVAL):
+        self.status = status  # returns the status text
+        self.stream = stream or sys.stdout
+        self.tty = self.stream.isatty()
+        self.interval = interval
+        self.pending = []
+        self.t_render = 0.
+
+    def result(self, line):
+        self.pending.append(line)
+        self.update()
+
+    def update(self):
+        if monotonic() - self.t_render >= self.interval:
+            self.render()
+
+    def render(self):
+        out = ''.join(line + '\n' for line in self.pending)
+        if self.tty:
+            out = '\r\033[K' + out + self.status()
+        if out:
+            self.stream.write(out)
+            self.stream.flush()
+        self.pending = []
+        self.t_render = monotonic()
+
+    def close(self):
+        self.render()
+        self.stream.write('\n' if self.tty else self.status() + '\n')
+        self.stream.flush()
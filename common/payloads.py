@@ -0,0 +1,202 @@
+import os
+from .wordlist import Wordlist
+from .generators import NumberRange, Charset, Mask
+from .mutations import Mutated
+from .hashset import HashSet
+from .targets import Targets
+
+CLUSTERBOMB = 'clusterbomb'
+PITCHFORK = 'pitchfork'
+MODES = [CLUSTERBOMB, PITCHFORK]
+
+# payload sources other than wordlists, by kind
+GENERATORS = {'range': NumberRange.parse, 'charset': Charset.parse, 'mask': Mask}
+
+
+def parse_wordlist_arg(spec, default_keyword):
+    '''Split a `-w path[:KEYWORD]` argument into its path and keyword.'''
+    path, sep, keyword = spec.rpartition(':')
+    if not sep or not keyword or '/' in keyword or os.sep in keyword:
+        return spec, default_keyword
+    return path, keyword
+
+
+def parse_range_arg(spec, default_keyword):
+    '''Split a `--range START-END[:FORMAT][:KEYWORD]` argument into its range and keyword.'''
+    parts = spec.split(':')
+    if len(parts) == 2:
+        # a lone suffix is a keyword if it is written like one, in upper case
+        # (so `X` needs `START-END:X:` to mean upper-case hex), or if it does
+        # not format a number; a format otherwise
+        if parts[1].isidentifier() and parts[1].isupper():
+            return parts[0], parts[1]
+        try:
+            format(0, parts[1])
+        except ValueError:
+            return parts[0], parts[1]
+        return spec, default_keyword
+    if len(parts) == 3:
+        bounds, fmt, keyword = parts
+        return f'{bounds}:{fmt}' if fmt else bounds, keyword or default_keyword
+    return spec, default_keyword
+
+
+def parse_sources(wordlists=None, ranges=None, charsets=None, length=(1, 4), masks=None, default_keyword='FUZZ'):
+    '''The `(kind, spec, keyword)` of each payload source on the command line,
+    wordlists first, then ranges, charsets and masks.'''
+    sources = [('wordlist', *parse_wordlist_arg(spec, default_keyword))
+               for spec in wordlists or []]
+    sources += [('range', *parse_range_arg(spec, default_keyword))
+                for spec in ranges or []]
+    for spec in charsets or []:
+        charset, keyword = parse_wordlist_arg(spec, default_keyword)
+        sources.append(('charset', f'{charset}:{length[0]}-{length[1]}', keyword))
+    sources += [('mask', *parse_wordlist_arg(spec, default_keyword))
+                for spec in masks or []]
+    return sources
+
+
+def label(keywords, words):
+    '''How a payload is shown in the results.'''
+    if len(words) == 1:
+        return words[0]
+    return ' '.join(f'{k}={w}' for k, w in zip(keywords, words))
+
+
+class Payloads:
+    '''Payload tuples, one word per keyword, numbered by a single index.
+
+    In clusterbomb mode index `i` is the `i`th tuple of the cartesian
+    product of the wordlists (the last wordlist varying fastest), in
+    pitchfork mode it is the `i`th word of every wordlist. Tuples are
+    produced lazily, so resuming and sharding work on plain index ranges
+    whatever the mode. With `dedup`, a tuple already produced is skipped.
+
+    With `targets`, every tuple is sent to every target, the target URL
+    being the last word: index `i` is tuple `i // T` on target `i % T`, so
+    consecutive indexes go to different targets.
+    '''
+
+    def __init__(self, wordlists, keywords, mode=CLUSTERBOMB, dedup=False, targets=None):
+        if mode not in MODES:
+            raise ValueError(f'unknown mode {mode}, use one of {", ".join(MODES)}')
+        if len(set(keywords)) != len(keywords):
+            raise ValueError('each wordlist needs its own keyword')
+        self.wordlists = wordlists
+        self.keywords = keywords
+        self.mode = mode
+        self.dedup = dedup
+        self.targets = targets
+        self._lens = [len(w) for w in wordlists]
+
+        if mode == PITCHFORK:
+            self._len = min(self._lens)
+        else:
+            self._len = 1
+            for n in self._lens:
+                self._len *= n
+        if targets is not None:
+            self._len *= len(targets)
+
+    @classmethod
+    def open(cls, sources, encoding, mode=CLUSTERBOMB, mutator=None, dedup=False, targets=None):
+        '''Open the sources from parse_sources(), each expanded by `mutator` if
+        one is given, and the `(path, keyword)` targets file if one is given.'''
+        if not sources:
+            raise ValueError('no payload source, use -w, --range, --charset or --mask')
+        wordlists = [Wordlist(spec, encoding) if kind == 'wordlist' else GENERATORS[kind](spec)
+                     for kind, spec, _ in sources]
+        keywords = [keyword for _, _, keyword in sources]
+        if mutator is not None and mutator.size > 1:
+            wordlists = [Mutated(w, mutator) for w in wordlists]
+        if targets is not None:
+            path, keyword = targets
+            targets = Targets(path)
+            keywords.append(keyword)
+        return cls(wordlists, keywords, mode, dedup, targets)
+
+    @property
+    def path(self):
+        paths = [w.path for w in self.wordlists]
+        if self.targets is not None:
+            paths.append(self.targets.path)
+        return os.pathsep.join(paths)
+
+    def __len__(self):
+        return self._len
+
+    def label(self, words):
+        return label(self.keywords, words)
+
+    def words(self, ranges=None, skip=(), duplicate=None, target=None):
+        '''Yield `(i, words)` for every index in `ranges` not in `skip`, only
+        those of one target if `target` is given.
+
+        With dedup on, repeated tuples are passed to `duplicate(i)` instead.
+        '''
+        if ranges is None:
+            ranges = [(0, len(self))]
+        items = self._words(ranges, skip) if self.targets is None \
+            else self._targeted(ranges, skip, target)
+        if not self.dedup:
+            yield from items
+            return
+        seen = HashSet()
+        for i, words in items:
+            if seen.add('\0'.join(words)):
+                yield i, words
+            elif duplicate is not None:
+                duplicate(i)
+
+    def _words(self, ranges, skip):
+        for start, end in ranges:
+            if start >= end:
+                continue
+            if self.mode == PITCHFORK:
+                yield from self._pitchfork(start, end, skip)
+            else:
+                yield from self._clusterbomb(start, end, skip)
+
+    def _targeted(self, ranges, skip, target):
+        n = len(self.targets)
+        urls = [self.targets.word(t) for t in range(n)]
+        targets = range(n) if target is None else (target,)
+        for start, end in ranges:
+            for b, words in self._words([(start // n, -(-end // n))], ()):
+                for t in targets:
+                    i = b * n + t
+                    if start <= i < end and i not in skip:
+                        yield i, words + (urls[t],)
+
+    def _pitchfork(self, start, end, skip):
+        wordlists = self.wordlists
+        for i in range(start, end):
+            if i not in skip:
+                yield i, tuple(w.word(i) for w in wordlists)
+
+    def _clusterbomb(self, start, end, skip):
+        wordlists, lens = self.wordlists, self._lens
+        digits = []
+        rest = start
+        for n in reversed(lens):
+            rest, d = divmod(rest, n)
+            digits.append(d)
+        digits.reverse()
+        words = [w.word(d) for w, d in zip(wordlists, digits)]
+
+        last = len(lens) - 1
+        for i in range(start, end):
+            if i not in skip:
+                yield i, tuple(words)
+            # advance the odometer, decoding only the words that change
+            k = last
+            while k >= 0:
+                digits[k] += 1
+                if digits[k] < lens[k]:
+                    words[k] = wordlists[k].word(digits[k])
+                    break
+                digits[k] = 0
+                words[k] = wordlists[k].word(0)
+                k -= 1
+            else:
+                return
@@ -0,0 +1,163 @@
+import argparse
+from array import array
+from collections import Counter
+from itertools import compress
+from .generators import parse_bounds
+from .mutations import Mutator
+from .output import format_result
+from .payloads import Payloads
+from .store import ResultStore
+
+GROUPS = ['status', 'size', 'words', 'lines']
+# what a diff compares, latency differs from one scan to the next anyway;
+# a count one scan did not measure is not a difference
+COMPARED = ['status', 'size', 'words', 'lines']
+
+parser = argparse.ArgumentParser(
+    prog='web-fuzzer.py query',
+    description='Filter, group and diff the results of scans saved with `--store`, without sending any request.')
+parser.add_argument('store', metavar='STORE_FILE',
+                    help='Result store written by `--store`')
+parser.add_argument('--status', action='store', nargs='+', type=int,
+                    help='Only results with these status codes, use `--status 200 403` to keep multiple codes')
+parser.add_argument('--size', action='store', type=parse_bounds, metavar='MIN-MAX',
+                    help='Only results with a response size in this range, use `--size 1000` for one size')
+parser.add_argument('--words', action='store', type=parse_bounds, metavar='MIN-MAX',
+                    help='Only results with a number of words in this range')
+parser.add_argument('--lines', action='store', type=parse_bounds, metavar='MIN-MAX',
+                    help='Only results with a number of lines in this range')
+parser.add_argument('--latency-over', action='store', type=float, metavar='SECONDS',
+                    help='Only results that took longer than this to answer')
+parser.add_argument('--group-by', action='store', choices=GROUPS,
+                    help='Count the results by this column instead of listing them, rarest values first')
+parser.add_argument('--bucket', action='store', type=int, default=1,
+                    help='Width of the groups of `--group-by`, use `--group-by size --bucket 100` for a size histogram (default: 1)')
+parser.add_argument('--diff', action='store', metavar='OTHER_STORE_FILE',
+                    help='List the payloads whose status, size, words or lines differ from this earlier scan of the same payloads, and those only one scan has')
+parser.add_argument('--limit', action='store', type=int,
+                    help='List at most this many results (default: all)')
+
+
+class Labels:
+    '''Names the payloads of a store from their index, opening its payload
+    sources again; `#INDEX` if they are gone or changed since.'''
+
+    def __init__(self, meta):
+        self.payloads = None
+        try:
+            payloads = Payloads.open([tuple(s) for s in meta['sources']], meta['encoding'], meta['mode'],
+                                     Mutator(**meta['mutations']), targets=meta['targets'])
+        except (OSError, ValueError):
+            return
+        if len(payloads) == meta['payloads']:
+            self.payloads = payloads
+
+    def __call__(self, i):
+        if i is None:
+            return '(recursion)'
+        if self.payloads is None:
+            return f'#{i}'
+        _, words = next(self.payloads.words([(i, i + 1)]))
+        return self.payloads.label(words)
+
+
+def select(store, args):
+    '''The rows of `store` passing the filters of `args`.'''
+    c = store.columns
+    rows = range(len(store))
+    if args.status:
+        statuses = set(args.status)
+        column = c['status']
+        rows = [r for r in rows if column[r] in statuses]
+    for name in ('size', 'words', 'lines'):
+        if getattr(args, name):
+            # not measured is -1, out of any range
+            low, high = getattr(args, name)
+            column = c[name]
+            rows = [r for r in rows if low <= column[r] <= high]
+    if args.latency_over is not None:
+        column = c['latency']
+        rows = [r for r in rows if column[r] > args.latency_over]
+    return rows
+
+
+def group(store, rows, name, bucket):
+    '''Print how many of `rows` fall in each group of column `name`, rarest first.'''
+    column = store.columns[name]
+    counts = Counter(column[r] // bucket if column[r] != -1 else None for r in rows)
+    for value, count in sorted(counts.items(), key=lambda item: (item[1], -1 if item[0] is None else item[0])):
+        if value is None:
+            key = 'unknown'
+        elif bucket == 1:
+            key = str(value)
+        else:
+            key = f'{value * bucket}-{value * bucket + bucket - 1}'
+        print(f'{key: <24} {count: >10} {100 * count / len(rows):6.2f}%')
+    print(f'====== {name}: {len(counts)} groups of {len(rows)} results ======')
+
+
+def show(store, r, labels, prefix=''):
+    i, status, size, words, lines, _ = store.row(r)
+    print(prefix + format_result(labels(i), status, size, words, lines))
+
+
+def positions(store, total):
+    '''The row of each payload index in `store`, -1 for those it does not have.'''
+    pos = array('q', [-1]) * total
+    for r, i in enumerate(store.columns['index']):
+        if 0 <= i < total:
+            pos[i] = r  # the last result of a payload counts
+    return pos
+
+
+def diff(store, other, rows, other_rows, labels, limit):
+    '''Print the payloads of `rows` or `other_rows` whose results differ
+    between `other`, the earlier scan, and `store`.'''
+    total = store.meta['payloads']
+    pos, other_pos = positions(store, total), positions(other, total)
+    # the payloads to compare, in index order
+    wanted = bytearray(total)
+    for s, selected in ((store, rows), (other, other_rows)):
+        index = s.columns['index']
+        for r in selected:
+            if index[r] != -1:
+                wanted[index[r]] = 1
+    pairs = [(store.columns[name], other.columns[name]) for name in COMPARED]
+    compared = changed = 0
+    for i in compress(range(total), wanted):
+        compared += 1
+        r, s = pos[i], other_pos[i]
+        if r != -1 and s != -1 and all(a[r] == b[s] or a[r] == -1 or b[s] == -1 for a, b in pairs):
+            continue
+        if limit is None or changed < limit:
+            if s != -1:
+                show(other, s, labels, '- ')
+            if r != -1:
+                show(store, r, labels, '+ ')
+        changed += 1
+    print(f'====== Changed: {changed} of {compared} payloads ======')
+
+
+def main(argv=None):
+    args = parser.parse_args(argv)
+    if args.bucket < 1:
+        parser.error('--bucket must be at least 1')
+    try:
+        store = ResultStore.load(args.store)
+        other = ResultStore.load(args.diff) if args.diff else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if other is not None and other.meta['payloads'] != store.meta['payloads']:
+        parser.error(f'{args.diff} has {other.meta["payloads"]} payloads and {args.store} '
+                     f'{store.meta["payloads"]}, they are not scans of the same payloads')
+
+    rows = select(store, args)
+    labels = Labels(store.meta)
+    if other is not None:
+        diff(store, other, rows, select(other, args), labels, args.limit)
+    elif args.group_by:
+        group(store, rows, args.group_by, args.bucket)
+    else:
+        for r in rows[:args.limit]:
+            show(store, r, labels)
+        print(f'====== Results: {len(rows)} of {len(store)} ======')
@@ -0,0 +1,127 @@
+import asyncio
+import heapq
+import json
+import random
+import threading
+from time import monotonic
+
+# the first retry waits up to BACKOFF_BASE seconds, each one after up to
+# twice as long as the one before, capped at BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# how often an engine waiting on retries checks for due ones
+POLL_INTERVAL = 0.05
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_MAX):
+    '''Seconds to wait before retry number `attempt`, with full jitter so
+    payloads failing together don't come back together.'''
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryQueue:
+    '''Failed payloads waiting to be sent again, on a timer heap.
+
+    push() schedules a payload after a backoff, or refuses once it has had
+    `retries` retries; due() pops the payloads whose time has come. Safe to
+    use from several threads.
+    '''
+
+    def __init__(self, retries):
+        self.retries = retries
+        self._heap = []
+        self._seq = 0
+        self._tries = {}  # retries so far of the payloads that failed
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, item):
+        '''Schedule `item` again. Returns False when it has no retries left.'''
+        with self._lock:
+            attempt = self._tries.get(item, 0) + 1
+            if attempt > self.retries:
+                self._tries.pop(item, None)
+                return False
+            self._tries[item] = attempt
+            heapq.heappush(self._heap, (monotonic() + backoff(attempt), self._seq, item))
+            self._seq += 1
+        return True
+
+    def done(self, item):
+        '''Forget the retries of an item that went through.'''
+        if self._tries:
+            with self._lock:
+                self._tries.pop(item, None)
+
+    def due(self):
+        '''Pop the items whose time has come.'''
+        if not self._heap:
+            return []
+        now = monotonic()
+        items = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                items.append(heapq.heappop(self._heap)[2])
+        return items
+
+    def wait_time(self):
+        '''Seconds until the next item is due, None if there is none.'''
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0., self._heap[0][0] - monotonic())
+
+
+async def feed_retries(retry, queue):
+    '''Put the due items of `retry` in an asyncio queue.'''
+    for item in retry.due():
+        await queue.put(item)
+
+
+async def drain_retries(retry, queue, stopped=None):
+    '''Feed `queue` the items of `retry` as they come due, until none is
+    waiting and everything queued is done. The consumers of the queue must
+    call task_done() once an item went through or was given to `retry`.
+    Once `stopped()` is true, the items still waiting are left to resume.'''
+    while True:
+        if stopped and stopped():
+            await queue.join()
+            return
+        await feed_retries(retry, queue)
+        if len(retry):
+            await asyncio.sleep(min(retry.wait_time(), POLL_INTERVAL))
+        else:
+            await queue.join()
+            if not len(retry):
+                return
+
+
+def describe(err):
+    '''An error message, for exceptions like timeouts that have none.'''
+    return str(err) or type(err).__name__
+
+
+class ErrorWriter:
+    '''Writes the payloads that ran out of retries as JSON lines, to be sent
+    again later with load_errors().'''
+
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, i, fuzz, error):
+        # errors are few, each line is flushed so a crash loses none
+        self.file.write(json.dumps({'index': i, 'fuzz': fuzz, 'error': error}) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def load_errors(path):
+    '''The payload indexes in an errors file, sorted.'''
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    # payloads of a recursion pass have no index, they are not replayed
+    return sorted({r['index'] for r in records if r['index'] is not None})
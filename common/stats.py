@@ -0,0 +1,151 @@
+import json
+import math
+import os
+import sys
+import threading
+from array import array
+from time import monotonic
+
+# phases of a request; a request's timings are a list indexed by these, with
+# None for the phases an engine cannot see
+PHASES = ('queue', 'dns', 'connect', 'tls', 'wait', 'download', 'process', 'total')
+QUEUE, DNS, CONNECT, TLS, WAIT, DOWNLOAD, PROCESS, TOTAL = range(len(PHASES))
+
+# histogram buckets: SUBBUCKETS per power of two from MIN_VALUE up to about
+# 4.5 minutes, so a bucket is at most 12.5% wide whatever the latency
+MIN_VALUE = 1e-6
+SUBBUCKETS = 8
+OCTAVES = 28
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+def new_timings():
+    return [None] * len(PHASES)
+
+
+class Histogram:
+    '''Counts of values in log-spaced buckets, in a fixed amount of memory.'''
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        # bucket 0 holds everything under MIN_VALUE, the last one everything over
+        self.counts = array('Q', bytes(8 * (OCTAVES * SUBBUCKETS + 1)))
+        self.count = 0
+        self.sum = 0.
+        self.min = math.inf
+        self.max = 0.
+
+    def record(self, value):
+        if value < MIN_VALUE:
+            i = 0
+        else:
+            m, e = math.frexp(value / MIN_VALUE)
+            i = min(len(self.counts) - 1,
+                    1 + (e - 1) * SUBBUCKETS + int((2 * m - 1) * SUBBUCKETS))
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    @staticmethod
+    def bound(i):
+        '''The upper bound of bucket `i`.'''
+        if i == 0:
+            return MIN_VALUE
+        octave, sub = divmod(i - 1, SUBBUCKETS)
+        return MIN_VALUE * 2 ** octave * (1 + (sub + 1) / SUBBUCKETS)
+
+    def percentile(self, q):
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.bound(i), self.max)
+        return self.max
+
+    def to_dict(self):
+        if not self.count:
+            return {'count': 0}
+        out = {'count': self.count, 'mean': self.sum / self.count,
+               'min': self.min, 'max': self.max}
+        for q in PERCENTILES:
+            out[f'p{q * 100:g}'] = self.percentile(q)
+        out['buckets'] = [[self.bound(i), n]
+                          for i, n in enumerate(self.counts) if n]
+        return out
+
+
+class Stats:
+    '''One histogram per request phase, saved as JSON every `interval` seconds.'''
+
+    def __init__(self, path, interval=5.0):
+        self.path = path
+        self.interval = interval
+        self.histograms = [Histogram() for _ in PHASES]
+        self._t_dump = monotonic()
+
+    def record(self, timings):
+        for histogram, seconds in zip(self.histograms, timings):
+            if seconds is not None:
+                histogram.record(seconds)
+        if self.path and monotonic() - self._t_dump >= self.interval:
+            self.dump()
+
+    def to_dict(self):
+        return {'unit': 'seconds',
+                'phases': {phase: h.to_dict() for phase, h in zip(PHASES, self.histograms) if h.count}}
+
+    def dump(self):
+        self._t_dump = monotonic()
+        if not self.path:
+            return
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(tmp, self.path)
+
+
+class Sampler:
+    '''A sampling profiler: every `interval` seconds it records the stack of
+    every other thread, and on stop() writes them as collapsed stacks
+    (`frame;frame;frame count` per line, as read by flamegraph.pl and
+    speedscope).'''
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self.samples = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        with open(self.path, 'w') as f:
+            for stack, n in sorted(self.samples.items(), key=lambda s: -s[1]):
+                f.write(f'{stack} {n}\n')
+
+    def _run(self):
+        me = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(ident, str(ident)))
+                key = ';'.join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
@@ -0,0 +1,109 @@
+import json
+import math
+import os
+import struct
+import sys
+from array import array
+
+_MAGIC = b'FUZZCOLS'
+_HEADER = struct.Struct('<8sI')  # magic, length of the JSON header after it
+# one typed array per column; -1 stands for a size or count that was not
+# measured, NaN for a missing latency, and an index of -1 for a payload of
+# a recursion pass, which has none
+COLUMNS = (('index', 'q'), ('status', 'H'), ('size', 'q'),
+           ('words', 'i'), ('lines', 'i'), ('latency', 'f'))
+
+
+def scan_meta(url, method, sources, encoding, mode, mutator, targets, payloads):
+    '''What a store records about its scan, enough to open its payloads again.'''
+    return {'url': url, 'method': method, 'encoding': encoding, 'mode': mode,
+            # query may run from another directory
+            'sources': [(kind, os.path.abspath(spec) if kind == 'wordlist' else spec, keyword)
+                        for kind, spec, keyword in sources],
+            'mutations': mutator.spec(),
+            'targets': (os.path.abspath(targets[0]), targets[1]) if targets else None,
+            'payloads': len(payloads)}
+
+
+class ResultStore:
+    '''Every response of a scan in typed columns, a few bytes per result.
+
+    `meta` says what was scanned, so query can name the payloads again from
+    their index. Columns are saved one after the other under a JSON header
+    and loaded back with no per-row parsing.
+    '''
+
+    def __init__(self, path=None, meta=None):
+        self.path = path
+        self.meta = meta or {}
+        self.columns = {name: array(code) for name, code in COLUMNS}
+
+    @classmethod
+    def open(cls, path, meta, resume=False):
+        '''A store saving to `path`, holding the results already there when resuming.'''
+        if resume and os.path.exists(path):
+            store = cls.load(path)
+            store.meta = meta
+            return store
+        return cls(path, meta)
+
+    def __len__(self):
+        return len(self.columns['index'])
+
+    def add(self, i, status, size, words, lines, latency):
+        c = self.columns
+        c['index'].append(-1 if i is None else i)
+        c['status'].append(status)
+        c['size'].append(-1 if size is None else size)
+        c['words'].append(-1 if words is None else words)
+        c['lines'].append(-1 if lines is None else lines)
+        c['latency'].append(math.nan if latency is None else latency)
+
+    def row(self, r):
+        '''Row `r` as `(index, status, size, words, lines, latency)`, with None for what is missing.'''
+        index, status, size, words, lines, latency = (self.columns[name][r] for name, _ in COLUMNS)
+        return (None if index == -1 else index, status, None if size == -1 else size,
+                None if words == -1 else words, None if lines == -1 else lines,
+                None if math.isnan(latency) else latency)
+
+    def take(self):
+        '''The columns as bytes, emptying them, to be sent to another process.'''
+        data = [self.columns[name].tobytes() for name, _ in COLUMNS]
+        self.columns = {name: array(code) for name, code in COLUMNS}
+        return data
+
+    def extend(self, data):
+        '''Append the columns of another store, as take() returned them.'''
+        for (name, _), column in zip(COLUMNS, data):
+            self.columns[name].frombytes(column)
+
+    def save(self):
+        # results may still come in, only whole rows are saved
+        rows = min(len(column) for column in self.columns.values())
+        header = json.dumps({'meta': self.meta, 'rows': rows, 'byteorder': sys.byteorder,
+                             'columns': [[name, code] for name, code in COLUMNS]}).encode()
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, len(header)))
+            f.write(header)
+            for name, _ in COLUMNS:
+                column = self.columns[name]
+                (column if len(column) == rows else column[:rows]).tofile(f)
+        os.replace(tmp, self.path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            head = f.read(_HEADER.size)
+            if len(head) < _HEADER.size or not head.startswith(_MAGIC):
+                raise ValueError(f'{path} is not a result store')
+            _, size = _HEADER.unpack(head)
+            header = json.loads(f.read(size))
+            store = cls(path, header['meta'])
+            for name, code in header['columns']:
+                column = array(code)
+                column.fromfile(f, header['rows'])
+                if header['byteorder'] != sys.byteorder:
+                    column.byteswap()
+                store.columns[name] = column
+        return store
@@ -0,0 +1,112 @@
+import asyncio
+import socket
+from collections import deque
+
+TARGET_KEYWORD = 'TARGET'
+# payloads out at a time per target, the same for every engine
+HOST_CONCURRENCY = 10
+
+
+class Targets:
+    '''The base URLs of a targets file, one per line, skipping empty lines
+    and `#` comments. A URL fills its keyword like a word would.'''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, encoding='utf-8') as f:
+            self.urls = [line.strip().rstrip('/') for line in f
+                         if line.strip() and not line.lstrip().startswith('#')]
+        if not self.urls:
+            raise ValueError(f'no target in {path}')
+
+    def __len__(self):
+        return len(self.urls)
+
+    def word(self, i):
+        return self.urls[i]
+
+    def close(self):
+        pass
+
+
+class FairScheduler:
+    '''Hands out the payloads of several targets in turn.
+
+    Every target has its own stream of `(i, words)` and at most `cap` of
+    its payloads out at a time, so a slow target only holds back itself:
+    its turn is skipped until done() is called for one of them. Payloads
+    sent again after a failure are not counted. Threads must share a lock
+    to use it.
+    '''
+
+    def __init__(self, streams, cap=HOST_CONCURRENCY):
+        self.cap = cap
+        self._streams = streams
+        self._turns = deque(range(len(streams)))
+        self._out = [0] * len(streams)
+        self._targets = {}  # index of each payload out -> its target
+        self._returned = asyncio.Event()
+
+    @property
+    def finished(self):
+        '''Whether every stream ran out.'''
+        return not self._turns
+
+    def next(self):
+        '''The next payload of the next target below its cap, or None if
+        every target with payloads left is at its cap.'''
+        turns = self._turns
+        skipped = 0
+        while skipped < len(turns):
+            t = turns[0]
+            if self._out[t] >= self.cap:
+                turns.rotate(-1)
+                skipped += 1
+                continue
+            item = next(self._streams[t], None)
+            if item is None:
+                turns.popleft()
+                continue
+            turns.rotate(-1)
+            self._out[t] += 1
+            self._targets[item[0]] = t
+            return item
+        return None
+
+    def done(self, i):
+        '''Payload `i` is no longer out.'''
+        t = self._targets.pop(i, None)
+        if t is not None:
+            self._out[t] -= 1
+            self._returned.set()
+
+    async def drain(self):
+        '''Yield the payloads as next() hands them out, for coroutines on one
+        event loop, waiting for done() while every target is at its cap.'''
+        while True:
+            item = self.next()
+            if item is not None:
+                yield item
+            elif self.finished:
+                return
+            else:
+                self._returned.clear()
+                await self._returned.wait()
+
+
+def cache_dns():
+    '''Resolve each host once for the life of the process rather than once
+    per new connection, for the blocking clients.'''
+    if getattr(socket.getaddrinfo, 'cached', False):
+        return
+    resolve = socket.getaddrinfo
+    cache = {}
+
+    def getaddrinfo(*args, **kwargs):
+        key = args + tuple(sorted(kwargs.items()))
+        if key not in cache:
+            cache[key] = resolve(*args, **kwargs)
+        return cache[key]
+
+    getaddrinfo.cached = True
+    socket.getaddrinfo = getaddrinfo
@@ -0,0 +1,181 @@
+import re
+from urllib.parse import urlsplit, quote
+
+# characters requests leaves as-is when quoting a URL (requests.utils.requote_uri)
+_URL_SAFE = "!#$%&'()*+,/:;=?@[]~"
+_RAW, _QUOTED = 0, 1
+# HTTP/1.1 headers about the connection, which HTTP/2 does not allow
+_HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade'}
+
+
+class _Field:
+    '''A string split into literal fragments around keyword slots.'''
+    __slots__ = ('parts', 'slots', 'single')
+
+    def __init__(self, s, pattern, keywords):
+        pieces = pattern.split(s)
+        self.parts = pieces[0::2]
+        self.slots = [keywords.index(k) for k in pieces[1::2]]
+        # a field using one keyword only is rendered with a single str.join
+        self.single = self.slots[0] if len(set(self.slots)) == 1 else None
+
+    def render(self, words):
+        if not self.slots:
+            return self.parts[0]
+        if self.single is not None:
+            return words[self.single].join(self.parts)
+        out = [self.parts[0]]
+        for slot, part in zip(self.slots, self.parts[1:]):
+            out.append(words[slot])
+            out.append(part)
+        return ''.join(out)
+
+
+def _field(s, pattern, keywords):
+    return None if s is None else _Field(s, pattern, keywords)
+
+
+class RequestTemplate:
+    '''A base request parsed once, rendered per payload by joining fragments.
+
+    Every occurrence of a keyword in the URL, post data, header keys and
+    values, and cookie keys and values is a fuzzing position; all of them
+    are substituted at once. A payload is a tuple with one word per keyword.
+    '''
+
+    def __init__(self, keywords, method, url, headers=None, data=None, cookies=None):
+        self.keywords = list(keywords)
+        self.method = method
+        # longest first, so a keyword containing another one wins
+        pattern = re.compile('(' + '|'.join(re.escape(k) for k in sorted(
+            self.keywords, key=len, reverse=True)) + ')')
+        self.url = _field(url, pattern, self.keywords)
+        self.data = _field(data, pattern, self.keywords)
+        self.headers = [(_field(k, pattern, self.keywords), _field(v, pattern, self.keywords))
+                        for k, v in (headers or {}).items()]
+        self.cookies = [(_field(k, pattern, self.keywords), _field(v, pattern, self.keywords))
+                        for k, v in (cookies or {}).items()]
+
+        used = set(self.url.slots)
+        if self.data is not None:
+            used.update(self.data.slots)
+        for k, v in self.headers + self.cookies:
+            used.update(k.slots)
+            used.update(v.slots)
+        for i, keyword in enumerate(self.keywords):
+            if i not in used:
+                raise KeyError(
+                    f'keyword {keyword} not found in URL, post data, headers, and cookies')
+
+        self.positions = self._get_positions()
+        # unfuzzed dicts are built once and shared by every rendered request
+        self._fuzz_headers = 'header' in self.positions
+        self._fuzz_cookies = 'cookie' in self.positions
+        self._headers = None if headers is None else dict(headers)
+        self._cookies = None if cookies is None else dict(cookies)
+
+        self._compile_raw(pattern, url, headers, data, cookies)
+
+    def render(self, words):
+        '''Return the request for `words` as `method`, `url`, `headers`, `data`
+        and `cookies` keyword arguments for requests and aiohttp.'''
+        return {
+            'method': self.method,
+            'url': self.url.render(words),
+            'headers': self._render_pairs(self.headers, words) if self._fuzz_headers else self._headers,
+            'data': None if self.data is None else self.data.render(words),
+            'cookies': self._render_pairs(self.cookies, words) if self._fuzz_cookies else self._cookies,
+        }
+
+    def render_bytes(self, words):
+        '''Return the HTTP/1.1 request for `words` as bytes ready to send.'''
+        subs = [(w.encode(), quote(w, safe=_URL_SAFE).encode()) for w in words]
+        head = [self._head[0]]
+        for (slot, kind), part in zip(self._head_slots, self._head[1:]):
+            head.append(subs[slot][kind])
+            head.append(part)
+        if self._body is None:
+            head.append(b'\r\n')
+            return b''.join(head)
+        body = [self._body[0]]
+        for slot, part in zip(self._body_slots, self._body[1:]):
+            body.append(subs[slot][_RAW])
+            body.append(part)
+        body = b''.join(body)
+        head.append(b'Content-Length: %d\r\n\r\n' % len(body))
+        head.append(body)
+        return b''.join(head)
+
+    def render_h2(self, words):
+        '''Return the request for `words` as HTTP/2 headers, pseudo-headers
+        first, and the body as bytes or None.'''
+        req = self.render(words)
+        scheme, netloc, path, query, _ = urlsplit(req['url'])
+        target = quote((path or '/') + (f'?{query}' if query else ''), safe=_URL_SAFE)
+        headers = [(':method', self.method), (':scheme', scheme), (':authority', netloc), (':path', target)]
+        for key, val in (req['headers'] or {}).items():
+            key = key.lower()
+            if key == 'host':
+                headers[2] = (':authority', val)
+            elif key not in _HOP_BY_HOP:
+                headers.append((key, val))
+        if req['cookies']:
+            headers.append(('cookie', '; '.join(f'{k}={v}' for k, v in req['cookies'].items())))
+        body = None
+        if req['data'] is not None:
+            body = req['data'].encode()
+            headers.append(('content-length', str(len(body))))
+        return headers, body
+
+    def _get_positions(self):
+        positions = []
+        if self.url.slots:
+            positions.append('url')
+        if self.data is not None and self.data.slots:
+            positions.append('data')
+        if any(k.slots or v.slots for k, v in self.headers):
+            positions.append('header')
+        if any(k.slots or v.slots for k, v in self.cookies):
+            positions.append('cookie')
+        return positions
+
+    def _compile_raw(self, pattern, url, headers, data, cookies):
+        # the head is kept as text with the keywords in place, then split into
+        # byte fragments; URL slots get the percent-encoded word
+        scheme, netloc, path, query, _ = urlsplit(url)
+        target = (path or '/') + (f'?{query}' if query else '')
+        # a Host header of the user's replaces the URL's, as for vhost fuzzing
+        host = next(((val, _RAW) for key, val in (headers or {}).items() if key.lower() == 'host'),
+                    (netloc, _QUOTED))
+        chunks = [(f'{self.method} ', _RAW), (target, _QUOTED),
+                  (f' HTTP/1.1\r\nHost: ', _RAW), host, ('\r\n', _RAW)]
+        for key, val in (headers or {}).items():
+            if key.lower() != 'host':
+                chunks.append((f'{key}: {val}\r\n', _RAW))
+        if cookies:
+            cookie = '; '.join(f'{k}={v}' for k, v in cookies.items())
+            chunks.append((f'Cookie: {cookie}\r\n', _RAW))
+
+        parts, slots, cur = [], [], ''
+        for text, kind in chunks:
+            pieces = pattern.split(text)
+            cur += pieces[0]
+            for keyword, piece in zip(pieces[1::2], pieces[2::2]):
+                parts.append(cur.encode())
+                slots.append((self.keywords.index(keyword), kind))
+                cur = piece
+        parts.append(cur.encode())
+
+        self.scheme = scheme
+        self.netloc = netloc
+        self._head = parts
+        self._head_slots = slots
+        self._body = self._body_slots = None
+        if data is not None:
+            pieces = pattern.split(data)
+            self._body = [piece.encode() for piece in pieces[0::2]]
+            self._body_slots = [self.keywords.index(k) for k in pieces[1::2]]
+
+    @staticmethod
+    def _render_pairs(pairs, words):
+        return {k.render(words): v.render(words) for k, v in pairs}
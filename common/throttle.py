@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# AIMD tuning: back off by half on congestion, add one slot per clean window
+DECREASE = 0.5
+INCREASE = 1
+MIN_WINDOW = 20
+TIMEOUT_RATE = 0.05
+# the p95 latency is compared with the best p95 seen, which is allowed to
+# drift up a little every window so a slower but steady target recovers
+LATENCY_FACTOR = 2.0
+BASE_DRIFT = 1.05
+MAX_RETRY_AFTER = 300.
+
+
+def parse_retry_after(value):
+    '''Seconds to wait from a `Retry-After` header, or None.'''
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    '''Caps the request rate at `rate` requests per second.'''
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.t = time.monotonic()
+
+    def reserve(self):
+        '''Take a token and return how long to wait before using it.'''
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.t) * self.rate) - 1
+        self.t = now
+        return 0. if self.tokens >= 0 else -self.tokens / self.rate
+
+    def try_take(self):
+        '''Take a token only if one is available now.'''
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens +
+                          (now - self.t) * self.rate)
+        self.t = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AIMD:
+    '''Adjusts a concurrency limit from latency, timeouts and throttling responses.
+
+    Samples are collected in windows of at least `limit` requests. A window
+    with a 429/503, more than 5% timeouts or a p95 latency over twice the
+    baseline halves the limit, any other window raises it by one.
+    '''
+
+    def __init__(self, initial, minimum=1, maximum=None):
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.limit = initial
+        self.base_p95 = None
+        self.resume_at = 0.
+        self._reset()
+
+    def record(self, latency=None, status=None, timeout=False, retry_after=None):
+        self.samples += 1
+        if latency is not None:
+            self.latencies.append(latency)
+        if timeout:
+            self.timeouts += 1
+        if status in (429, 503):
+            self.throttled = True
+        retry_after = parse_retry_after(retry_after)
+        if retry_after:
+            self.resume_at = max(
+                self.resume_at, time.monotonic() + retry_after)
+        if self.samples >= max(MIN_WINDOW, self.limit):
+            self._adjust()
+
+    def pause(self):
+        '''How long to hold off because the target sent `Retry-After`.'''
+        return max(0., self.resume_at - time.monotonic())
+
+    def _adjust(self):
+        congested = self.throttled or self.timeouts > self.samples * TIMEOUT_RATE
+        if self.latencies:
+            self.latencies.sort()
+            p95 = self.latencies[int(0.95 * (len(self.latencies) - 1))]
+            if self.base_p95 is not None and p95 > self.base_p95 * LATENCY_FACTOR:
+                congested = True
+            self.base_p95 = p95 if self.base_p95 is None else min(
+                p95, self.base_p95 * BASE_DRIFT)
+
+        if congested:
+            self.limit = max(self.minimum, int(self.limit * DECREASE))
+        else:
+            self.limit = min(self.maximum, self.limit + INCREASE)
+        self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.timeouts = 0
+        self.throttled = False
+        self.latencies = []
+
+
+class Limiter:
+    '''Bounds in-flight requests for threads, optionally adaptive and rate-capped.'''
+
+    def __init__(self, concurrency, adaptive=False, rate=None):
+        self.concurrency = concurrency
+        self.controller = AIMD(concurrency) if adaptive else None
+        self.bucket = TokenBucket(rate) if rate else None
+        self.inflight = 0
+        self.paused = False
+        self._cond = threading.Condition()
+
+    @property
+    def limit(self):
+        if self.paused:
+            return 0
+        return self.controller.limit if self.controller else self.concurrency
+
+    def configure(self, paused=None, concurrency=None, rate=None):
+        '''Pause, resume or change the limits of a running scan; a rate of 0
+        lifts the cap, None leaves a setting as it is.'''
+        with self._cond:
+            self._configure(paused, concurrency, rate)
+            self._cond.notify_all()
+
+    def _configure(self, paused, concurrency, rate):
+        if paused is not None:
+            self.paused = paused
+        if concurrency is not None:
+            self.concurrency = concurrency
+            if self.controller:
+                self.controller.maximum = concurrency
+                self.controller.limit = min(self.controller.limit, concurrency)
+        if rate is not None:
+            self.bucket = TokenBucket(rate) if rate else None
+
+    def settings(self):
+        '''The current limits, as the control channel reports them.'''
+        return {'paused': self.paused, 'inflight': self.inflight,
+                'concurrency': self.controller.limit if self.controller else self.concurrency,
+                'rate_limit': self.bucket.rate if self.bucket else None}
+
+    def acquire(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self.inflight < self.limit)
+            self.inflight += 1
+            # reserved under the lock, other threads take from the same bucket
+            delay = self._delay()
+        time.sleep(delay)
+
+    def try_acquire(self):
+        '''Take a slot only if one is free and no wait is due right now.'''
+        with self._cond:
+            return self._try_acquire()
+
+    def _try_acquire(self):
+        if self.inflight >= self.limit or (self.controller and self.controller.pause()):
+            return False
+        if self.bucket and not self.bucket.try_take():
+            return False
+        self.inflight += 1
+        return True
+
+    def release(self, latency=None, status=None, timeout=False, retry_after=None):
+        with self._cond:
+            self.inflight -= 1
+            if self.controller:
+                self.controller.record(latency, status, timeout, retry_after)
+            self._cond.notify_all()
+
+    def _delay(self):
+        delay = self.controller.pause() if self.controller else 0.
+        if self.bucket:
+            delay = max(delay, self.bucket.reserve())
+        return delay
+
+
+class AsyncLimiter(Limiter):
+    '''The same limits for coroutines on one event loop.'''
+
+    def __init__(self, concurrency, adaptive=False, rate=None):
+        super().__init__(concurrency, adaptive, rate)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < self.limit)
+            self.inflight += 1
+        delay = self._delay()
+        if delay:
+            await asyncio.sleep(delay)
+
+    async def configure(self, paused=None, concurrency=None, rate=None):
+        async with self._cond:
+            self._configure(paused, concurrency, rate)
+            self._cond.notify_all()
+
+    def try_acquire(self):
+        # coroutines on one loop cannot interleave here, no lock needed
+        return self._try_acquire()
+
+    async def release(self, latency=None, status=None, timeout=False, retry_after=None):
+        async with self._cond:
+            self.inflight -= 1
+            if self.controller:
+                self.controller.record(latency, status, timeout, retry_after)
+            self._cond.notify_all()
@@ -0,0 +1,55 @@
+from time import perf_counter
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from .stats import CONNECT, TLS, WAIT, DOWNLOAD, TOTAL
+
+
+class _TimedConnection:
+    '''Records connect and TLS handshake times in the adapter's current timings.'''
+    adapter = None
+
+    def _new_conn(self):
+        t = perf_counter()
+        sock = super()._new_conn()
+        if self.adapter.timings is not None:
+            # includes the DNS lookup, which urllib3 does not time apart
+            self.adapter.timings[CONNECT] = perf_counter() - t
+        return sock
+
+    def connect(self):
+        t = perf_counter()
+        super().connect()
+        timings = self.adapter.timings
+        if timings is not None and isinstance(self, HTTPSConnection):
+            timings[TLS] = perf_counter() - t - (timings[CONNECT] or 0.)
+
+
+class TimedAdapter(HTTPAdapter):
+    '''An HTTPAdapter filling in the connection phases of `timings`, the
+    timings list of the request being sent. One request at a time.'''
+
+    def __init__(self, *args, **kwargs):
+        self.timings = None
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        http = type('TimedHTTPConnection', (_TimedConnection, HTTPConnection),
+                    {'adapter': self})
+        https = type('TimedHTTPSConnection', (_TimedConnection, HTTPSConnection),
+                     {'adapter': self})
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': type('TimedHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http}),
+            'https': type('TimedHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https}),
+        }
+
+
+def body_read(timings, t, elapsed):
+    '''Fill in the wait, download and total phases of a request sent at `t`
+    whose response headers took `elapsed` seconds and whose body is read.'''
+    now = perf_counter()
+    timings[WAIT] = elapsed - (timings[CONNECT] or 0.) - (timings[TLS] or 0.)
+    timings[DOWNLOAD] = now - t - elapsed
+    timings[TOTAL] = now - t
+    return now
@@ -0,0 +1,248 @@
+import json
+import mmap
+import os
+import stat
+from array import array
+from hashlib import blake2b
+from threading import Lock
+from time import monotonic
+
+INDEX_SUFFIX = '.idx'
+_INDEX_MAGIC = 0x5846555a58444e49  # b'INDXZUFX'
+
+
+class Wordlist:
+    '''A memory-mapped wordlist with a line-offset index.
+
+    The index is built once and cached in the user's cache directory, so
+    the number of words is known up front and any line range can be read
+    without scanning the file. A pipe or device, like `/dev/stdin`, is read
+    into memory instead and its index never cached.
+    '''
+
+    def __init__(self, path, encoding='utf-8'):
+        self.path = path
+        self.encoding = encoding
+        self._data = None  # the contents of a file that isn't regular
+        self._open()
+
+    def __len__(self):
+        return len(self.index) - 1
+
+    def line(self, i):
+        '''Zero-copy view of line `i` without its line ending.'''
+        start, end = self.index[i], self.index[i + 1]
+        view = self._view
+        if end > start and view[end - 1] == 0x0a:
+            end -= 1
+            if end > start and view[end - 1] == 0x0d:
+                end -= 1
+        return view[start:end]
+
+    def word(self, i):
+        return str(self.line(i), self.encoding)
+
+    def words(self, ranges=None, skip=()):
+        '''Yield `(i, word)` for every line in `ranges` not in `skip`.'''
+        if ranges is None:
+            ranges = [(0, len(self))]
+        encoding = self.encoding
+        for start, end in ranges:
+            for i in range(start, end):
+                if i in skip:
+                    continue
+                yield i, str(self.line(i), encoding)
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __getstate__(self):
+        return {'path': self.path, 'encoding': self.encoding, '_data': self._data}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+
+    def _open(self):
+        self._mmap = None
+        if self._data is None:
+            with open(self.path, 'rb') as f:
+                st = os.fstat(f.fileno())
+                if stat.S_ISREG(st.st_mode):
+                    # an empty file can't be mapped
+                    if st.st_size:
+                        self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._view = memoryview(self._mmap if self._mmap is not None else b'')
+                    self.index = self._load_index(st)
+                    if self.index is None:
+                        self.index = self._build_index(self._mmap, st.st_size)
+                        self._save_index(st)
+                    return
+                # a pipe can only be read once, and not mapped
+                self._data = f.read()
+        self._view = memoryview(self._data)
+        self.index = self._build_index(self._data, len(self._data))
+
+    @staticmethod
+    def _build_index(data, size):
+        index = array('Q', [0])
+        if size:
+            find = data.find
+            append = index.append
+            pos = find(b'\n')
+            while pos != -1:
+                append(pos + 1)
+                pos = find(b'\n', pos + 1)
+        if index[-1] != size:
+            index.append(size)  # last line has no newline
+        return index
+
+    def _save_index(self, st):
+        path = index_path(self.path)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, 'wb') as f:
+                array('Q', [_INDEX_MAGIC, st.st_size, st.st_mtime_ns]).tofile(f)
+                self.index.tofile(f)
+            os.replace(tmp, path)
+        except OSError:
+            pass  # caching is best-effort, e.g. no writable home directory
+
+    def _load_index(self, st):
+        try:
+            with open(index_path(self.path), 'rb') as f:
+                header = array('Q')
+                header.fromfile(f, 3)
+                if list(header) != [_INDEX_MAGIC, st.st_size, st.st_mtime_ns]:
+                    return None
+                index = array('Q')
+                index.frombytes(f.read())
+        except (OSError, EOFError, ValueError):
+            return None
+        return index if index and index[-1] == st.st_size else None
+
+
+def index_path(path):
+    '''Where the line index of the wordlist at `path` is cached.'''
+    cache = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    key = blake2b(os.path.realpath(path).encode(), digest_size=16).hexdigest()
+    return os.path.join(cache, 'web-fuzzer', key + INDEX_SUFFIX)
+
+
+class Progress:
+    '''Tracks completed words and saves the remaining ranges to a state file.
+
+    Words complete out of order, so each range keeps the first index not
+    yet completed plus the completed indexes past it; together they are
+    exactly what is left to do. Without a state file it only keeps count.
+    '''
+
+    def __init__(self, state_path, wordlist, interval=5.0):
+        self.state_path = state_path
+        self.wordlist = wordlist
+        self.interval = interval
+        self.ranges = [[0, len(wordlist)]]
+        self.done = set()
+        self._lock = Lock()
+        self._t_save = monotonic()
+        if state_path and os.path.exists(state_path):
+            self._load()
+
+    def __len__(self):
+        return sum(end - start for start, end in self.ranges) - len(self.done)
+
+    def pending(self):
+        '''The ranges and the already completed indexes inside them.'''
+        with self._lock:
+            return [tuple(r) for r in self.ranges if r[0] < r[1]], set(self.done)
+
+    def only(self, indexes):
+        '''Restrict the work to `indexes`, like the failures of an earlier run.'''
+        indexes = sorted(indexes)
+        if indexes and not 0 <= indexes[0] <= indexes[-1] < len(self.wordlist):
+            raise ValueError(f'index {indexes[-1]} is out of range of wordlist {self.wordlist.path}')
+        with self._lock:
+            self.ranges = to_ranges(indexes)
+            self.done = set()
+
+    def complete(self, i):
+        with self._lock:
+            for r in self.ranges:
+                if r[0] <= i < r[1]:
+                    break
+            else:
+                return
+            if i != r[0]:
+                self.done.add(i)
+            else:
+                r[0] += 1
+                while r[0] in self.done:
+                    self.done.remove(r[0])
+                    r[0] += 1
+        if self.state_path and monotonic() - self._t_save >= self.interval:
+            self.save()
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = {
+                'wordlist': self.wordlist.path,
+                'words': len(self.wordlist),
+                'ranges': [r for r in self.ranges if r[0] < r[1]],
+                'done': sorted(self.done),
+            }
+            self._t_save = monotonic()
+        tmp = self.state_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _load(self):
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state['words'] != len(self.wordlist):
+            raise ValueError(
+                f'state file {self.state_path} does not match wordlist {self.wordlist.path}')
+        self.ranges = [list(r) for r in state['ranges']]
+        self.done = set(state['done'])
+
+
+def to_ranges(indexes):
+    '''Compress sorted indexes into `[start, end)` pairs.'''
+    ranges = []
+    for i in indexes:
+        if ranges and ranges[-1][1] == i:
+            ranges[-1][1] += 1
+        else:
+            ranges.append([i, i + 1])
+    return ranges
+
+
+def split_ranges(ranges, num):
+    '''Split index ranges into `num` lists of ranges with about the same number of indexes.'''
+    total = sum(end - start for start, end in ranges)
+    parts = [[] for _ in range(num)]
+    part, left = 0, -(-total // num) if total else 0
+    for start, end in ranges:
+        while start < end:
+            take = min(end - start, left)
+            parts[part].append((start, start + take))
+            start += take
+            left -= take
+            if left == 0 and part < num - 1:
+                part += 1
+                left = -(-total // num)
+    return [p for p in parts if p]
@@ -0,0 +1,338 @@
+import base64
+import json
+import socket
+import threading
+from collections import deque
+from time import monotonic, perf_counter, sleep
+from fuzzer import Fuzzer
+from common.wordlist import to_ranges
+from common.store import ResultStore
+
+# options that only apply on the coordinator's machine
+LOCAL_OPTIONS = ('proc', 'resume', 'output', 'output_format', 'stats', 'profile', 'errors', 'replay', 'store', 'control')
+LEASE_SIZE = 5000
+# a worker with nothing left to queue asks again for a lease this often,
+# sending its retries meanwhile; the coordinator waits as long for workers
+# to hear the scan is over
+LEASE_POLL = 0.5
+# a worker sends its results every FLUSH_INTERVAL seconds, and something at
+# least every HEARTBEAT seconds; a worker silent for DEAD_AFTER is dropped
+FLUSH_INTERVAL = 0.2
+HEARTBEAT = 5.0
+DEAD_AFTER = 30.0
+
+
+def parse_address(value, default_host=''):
+    '''Parse a `[HOST:]PORT` command line value.'''
+    host, _, port = value.rpartition(':')
+    return host or default_host, int(port)
+
+
+class Channel:
+    '''Newline-delimited JSON messages over a socket, sent from any thread.'''
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        data = json.dumps(msg, separators=(',', ':')).encode() + b'\n'
+        with self._lock:
+            self.sock.sendall(data)
+
+    def recv(self):
+        line = self.rfile.readline()
+        if not line:
+            raise ConnectionError('connection closed')
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.rfile.close()
+        self.sock.close()
+
+
+class Lease:
+    '''A share of the wordlist: index ranges, minus the indexes already done.'''
+
+    def __init__(self, id, ranges, done):
+        self.id = id
+        self.ranges = ranges
+        self.done = done
+        self.left = sum(end - start for start, end in ranges) - len(done)
+
+    def __contains__(self, i):
+        return any(start <= i < end for start, end in self.ranges)
+
+    def complete(self, i):
+        if i in self.done:
+            return False
+        self.done.add(i)
+        self.left -= 1
+        return True
+
+    def to_message(self):
+        return {'type': 'lease', 'id': self.id, 'ranges': self.ranges, 'done': sorted(self.done)}
+
+
+class Coordinator(Fuzzer):
+    '''Hands out leases of the wordlist to workers connecting over TCP and
+    merges their results into one output and status line.
+
+    A worker asks for its next lease as soon as it has queued the last
+    one, so it never runs dry, and keeps asking while leases are still out
+    with other workers. The leases of a worker that disconnects or goes
+    silent are handed out again, minus what it already completed.
+    '''
+
+    def __init__(self, address, lease_size=LEASE_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.address = address
+        self.lease_size = lease_size
+        self.config = {k: v for k, v in kwargs.items() if k not in LOCAL_OPTIONS}
+        self.pending = deque()
+        self.active = 0
+        self.workers = 0
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    def fuzz(self):
+        self._open_wordlist()
+        self._open_output()
+        self.pending.extend(self._split(*self.progress.pending()))
+        if not self.pending:
+            self.finished.set()
+
+        server = socket.create_server(self.address)
+        server.settimeout(self.console.interval)
+        threading.Thread(target=self._accept, args=(server,), daemon=True).start()
+        try:
+            self.t0 = perf_counter()
+            while not self.finished.wait(self.console.interval):
+                with self.lock:
+                    self.console.update()
+            # let the workers asking for a lease hear it is over
+            deadline = monotonic() + 2 * LEASE_POLL
+            while self.workers and monotonic() < deadline:
+                sleep(self.console.interval)
+        except KeyboardInterrupt:
+            return self.success_req + self.error_req
+        finally:
+            self.finished.set()
+            server.close()
+            with self.lock:
+                self.progress.save()
+                self._close_output()
+
+        return self.total_req
+
+    def status_fields(self):
+        return f'{super().status_fields()}, Workers: {self.workers}'
+
+    def _split(self, ranges, done):
+        next_id = 0
+        for start, end in ranges:
+            for s in range(start, end, self.lease_size):
+                e = min(s + self.lease_size, end)
+                yield Lease(next_id, [[s, e]], {i for i in done if s <= i < e})
+                next_id += 1
+
+    def _accept(self, server):
+        while not self.finished.is_set():
+            try:
+                sock, addr = server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock, addr), daemon=True).start()
+
+    def _serve(self, sock, addr):
+        name = f'{addr[0]}:{addr[1]}'
+        sock.settimeout(DEAD_AFTER)
+        channel = Channel(sock)
+        leases = {}
+        joined = False
+        try:
+            channel.recv()  # hello
+            channel.send({'type': 'config', 'fuzzer': self.config, 'store': bool(self.store_path)})
+            words = channel.recv()['words']
+            if words != len(self.payloads):
+                channel.send({'type': 'error',
+                              'error': f'{words} payloads on the worker, {len(self.payloads)} on the coordinator'})
+                with self.lock:
+                    self.console.result(f'Worker {name} rejected: its wordlists differ')
+                return
+            with self.lock:
+                self.workers += 1
+                joined = True
+            while True:
+                msg = channel.recv()
+                with self.lock:
+                    if msg['type'] == 'lease':
+                        self._assign(channel, leases)
+                    elif msg['type'] == 'results':
+                        self._merge(msg, leases)
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            channel.close()
+            with self.lock:
+                self.workers -= joined
+                if leases and not self.finished.is_set():
+                    left = sum(lease.left for lease in leases.values())
+                    self.console.result(f'Worker {name} lost, handing out its {left} payloads again')
+                    self.active -= len(leases)
+                    self.pending.extendleft(leases.values())
+
+    def _assign(self, channel, leases):
+        if self.pending:
+            lease = self.pending.popleft()
+            leases[lease.id] = lease
+            self.active += 1
+            channel.send(lease.to_message())
+        elif self.active:
+            # a lease out with another worker may come back
+            channel.send({'type': 'wait'})
+        else:
+            channel.send({'type': 'end'})
+
+    def _merge(self, msg, leases):
+        self.success_req += msg['success']
+        self.error_req += msg['error']
+        self.saved_bytes += msg['saved']
+        self.total_req -= msg['skipped']
+        lease = None
+        for start, end in msg['completed']:
+            for i in range(start, end):
+                if lease is None or i not in lease:
+                    lease = next((l for l in leases.values() if i in l), None)
+                    if lease is None:
+                        continue
+                if not lease.complete(i):
+                    continue
+                self.progress.complete(i)
+                if not lease.left:
+                    del leases[lease.id]
+                    self.active -= 1
+        for res in msg['matched']:
+            self.print_result(*res)
+        for i, fuzz, error in msg['failed']:
+            self.report_error(i, fuzz, error)
+        if 'store' in msg:
+            self.store.extend(base64.b64decode(column) for column in msg['store'])
+        self.console.update()
+
+        if not self.pending and not self.active:
+            self.finished.set()
+
+
+class WorkerFuzzer(Fuzzer):
+    '''Fuzzes the leases a coordinator hands out, streaming results back.'''
+
+    def __init__(self, channel, store=False, **kwargs):
+        super().__init__(**kwargs)
+        self.channel = channel
+        # the coordinator saves the store, results are only collected here
+        self.store = ResultStore() if store else None
+        self.completed = []
+        self.matched = []
+        self.failed = []
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._sent = (0, 0, 0)
+        self._t_sent = monotonic()
+        self._stop = threading.Event()
+
+    def fuzz(self):
+        self.prepare()
+        self.total_req = 0  # counted lease by lease
+        self.channel.send({'type': 'ready', 'words': len(self.payloads)})
+        self._open_output()
+        flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        try:
+            self.t0 = perf_counter()
+            flusher.start()
+            while True:
+                self.channel.send({'type': 'lease'})
+                msg = self.channel.recv()
+                if msg['type'] == 'end':
+                    break
+                if msg['type'] == 'error':
+                    raise RuntimeError(msg['error'])
+                if msg['type'] == 'wait':
+                    self.send_retries()
+                    sleep(LEASE_POLL)
+                    continue
+                done = set(msg['done'])
+                self.total_req += sum(end - start for start, end in msg['ranges']) - len(done)
+                self.fuzz_words(self.payloads.words(msg['ranges'], done, duplicate=self._skip))
+            self.http_requester.wait()
+        finally:
+            self._stop.set()
+            self._close_output()
+        flusher.join()
+        self.flush()
+        self.print_conn_stats()
+        return self.total_req
+
+    def _complete(self, i, depth):
+        with self._lock:
+            self.completed.append(i)
+
+    def _skip(self, i, depth=0):
+        self.total_req -= 1
+        with self._lock:
+            self.skipped += 1
+            self.completed.append(i)
+
+    def print_result(self, fuzz, status, size, word, line, latency=None, found=None):
+        with self._lock:
+            self.matched.append([fuzz, status, size, word, line, latency, found])
+        super().print_result(fuzz, status, size, word, line, latency, found)
+
+    def record(self, i, status, size, word, line, latency):
+        with self._lock:
+            super().record(i, status, size, word, line, latency)
+
+    def report_error(self, i, fuzz, error):
+        with self._lock:
+            self.failed.append([i, fuzz, error])
+        super().report_error(i, fuzz, error)
+
+    def flush(self):
+        with self._lock:
+            completed, self.completed = self.completed, []
+            matched, self.matched = self.matched, []
+            failed, self.failed = self.failed, []
+            skipped, self.skipped = self.skipped, 0
+            columns = self.store.take() if self.store is not None and len(self.store) else None
+        success, error, saved = self.success_req, self.error_req, self.saved_bytes
+        if completed or matched or failed or monotonic() - self._t_sent >= HEARTBEAT:
+            msg = {'type': 'results', 'success': success - self._sent[0],
+                   'error': error - self._sent[1], 'saved': saved - self._sent[2], 'skipped': skipped,
+                   'completed': to_ranges(sorted(completed)), 'matched': matched, 'failed': failed}
+            if columns:
+                msg['store'] = [base64.b64encode(column).decode() for column in columns]
+            self.channel.send(msg)
+            self._sent = (success, error, saved)
+            self._t_sent = monotonic()
+
+    def _flush_loop(self):
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self.flush()
+
+
+def run_worker(address, proc):
+    '''Connect to a coordinator and fuzz with its options until it has no more leases.'''
+    channel = Channel(socket.create_connection(address))
+    try:
+        channel.send({'type': 'hello'})
+        config = channel.recv()
+        WorkerFuzzer(channel, config.get('store', False), proc=proc, **config['fuzzer']).fuzz()
+    finally:
+        channel.close()
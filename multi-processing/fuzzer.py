@@ -1,22 +1,65 @@
-from typing import List
+from functools import partial
+from threading import Condition, Lock
+from typing import Iterable, Tuple
+from time import perf_counter, sleep
 import requests as rq
-from copy import deepcopy
-from re import split
-from time import perf_counter
-from requester import HttpRequester
+from requester import HttpRequester, unpack_batch, BATCH_SIZE
+from matcher import Matcher, calibration_words
+from common.metrics import measure
+from common.throttle import Limiter
+from common.output import Console, open_writer, format_result, format_error, format_bytes
+from common.stats import Stats, Sampler, PROCESS
+from common.template import RequestTemplate
+from common.wordlist import Progress
+from common.payloads import Payloads, parse_sources, parse_wordlist_arg
+from recursion import WorkQueue, is_directory
+from common.hashset import HashSet
+from common.mutations import Mutator
+from patterns import load_signatures
+from common.targets import FairScheduler, TARGET_KEYWORD, HOST_CONCURRENCY
+from common.retry import RetryQueue, ErrorWriter, load_errors, describe, POLL_INTERVAL
+from common.store import ResultStore, scan_meta
+from common.metrics import PROBE_SIZE
+from common.control import ControlServer
 
 
 class Fuzzer:
-    def __init__(self, url, wordlist, proc, timeout, encoding=None, method=None, cookies=None, data=None, headers=None, redirect=None, mc=None, ms=None, mw=None, ml=None):
+    def __init__(self, url, wordlist, proc, timeout, encoding=None, method=None, cookies=None, data=None, headers=None, redirect=None, mc=None, ms=None, mw=None, ml=None, fc=None, fs=None, fw=None, fl=None, ac=False, resume=None, mode=None, adaptive=False, rate=None, output=None, output_format=None, stats=None, profile=None, recursion=False, depth=2, extensions=None, case=None, prefix=None, suffix=None, encode=None, dedup=False, ranges=None, charsets=None, length=(1, 4), masks=None, retries=2, errors=None, replay=None, mr=None, fr=None, signatures=None, extract=None, targets=None, host_concurrency=HOST_CONCURRENCY, store=None, probe=None, probe_size=PROBE_SIZE, control=None):
         self.keyword = 'FUZZ'
-        self.batch_size = 256
 
         # required arguments
+        wordlists = wordlist if isinstance(wordlist, list) or wordlist is None else [wordlist]
+        self.sources = parse_sources(wordlists, ranges, charsets, length, masks, self.keyword)
+        self.keywords = [keyword for _, _, keyword in self.sources]
+        # the `(path, keyword)` of the targets file, whose URLs are crossed with the payloads
+        self.targets = parse_wordlist_arg(targets, TARGET_KEYWORD) if targets else None
+        self.host_concurrency = host_concurrency
+        if self.targets:
+            self.keywords.append(self.targets[1])
+            url = url or f'{self.targets[1]}/{self.keyword}'
         self.url = url
-        self.wordlist_path = wordlist
+        self.mode = mode or 'clusterbomb'
         self.encoding = encoding
         self.proc_num = proc
         self.timeout = timeout
+        self.resume_path = resume
+        self.adaptive = adaptive
+        self.rate = rate
+        self.output_path = output
+        self.output_format = output_format
+        self.stats_path = stats
+        self.profile_path = profile
+        self.recursion = recursion
+        self.max_depth = depth
+        self.mutator = Mutator(extensions, case, prefix, suffix, encode)
+        self.dedup = dedup
+        self.retry = RetryQueue(retries)
+        self.errors_path = errors
+        self.replay_path = replay
+        self.store_path = store
+        self.probe = probe
+        self.probe_size = probe_size
+        self.control_path = control
 
         # http arguments
         self.method = method
@@ -25,135 +68,402 @@ class Fuzzer:
         self.headers = headers
         self.redirect = redirect
 
-        # match arguments
-        self.matches = {
-            'codes': ['all'] if 'all' in mc else [int(c) for c in mc],
-            'size': ms if ms else [],
-            'word': mw if mw else [],
-            'line': ml if ml else [],
-        }
+        # match and filter arguments
+        self.matcher = Matcher(mc, ms, mw, ml, fc, fs, fw, fl, mr, fr,
+                               load_signatures(signatures) if signatures else None, extract)
+        self.auto_calibrate = ac
 
-        self.http_requester = HttpRequester(
-            self.proc_num, self.timeout, self.redirect)
-
-        self.fuzz_func = None
-        self.base_req = None
+        self.http_requester = None
+        self.template = None
+        self.payloads = None
+        self.progress = None
+        self.limiter = None
+        self.console = None
+        self.writer = None
+        self.errors = None
+        self.store = None
+        self.stats = None
+        self.sampler = None
+        self.jobs = None
+        self.visited = None
+        self.recursion_slot = None
+        self.scheduler = None
+        self.control_server = None
+        self.draining = False
+        self._turn = Condition()
+        self.batch = []
+        # the limiter counts batches: keep them to one request when it has
+        # to pace requests one by one; a batch runs its requests in a row,
+        # so a slow target would hold up the others of its batch
+        self.batch_size = 1 if adaptive or rate or targets else BATCH_SIZE
+        # requests sent and not back yet, which the limiter only counts in batches
+        self.inflight_req = 0
+        self._inflight_lock = Lock()
         self.total_req = 0
         self.success_req = 0
         self.error_req = 0
+        self.saved_bytes = 0  # of the bodies not downloaded, as announced
 
     def fuzz(self):
-        try:
-            self._build_request()
-        except Exception as e:
-            raise RuntimeError('Failed to build base request') from e
+        self.prepare()
+        self._open_output()
+
+        if self.recursion:
+            self.jobs = WorkQueue()
+            self.visited = HashSet()
 
         try:
-            print('')  # allocate 1 line for printing
             self.t0 = perf_counter()
-            words = []
-            with open(self.wordlist_path, 'r', encoding=self.encoding) as wordlist:
-                for i, word in enumerate(wordlist):
-                    words.append(word[:-1])  # [:-1] remove newline
-                    if i % self.batch_size == self.batch_size - 1:
-                        self.fuzz_func(words)
-                        words = []
-                    self.total_req += 1
-                self.fuzz_func(words)
-
+            self._start_control()
+            if self.targets:
+                self.fuzz_targets()
+            else:
+                self.fuzz_words(self.payloads.words(
+                    *self.progress.pending(), duplicate=self._skip))
+            while True:
+                if self.recursion:
+                    self.fuzz_directories()
+                self.fuzz_retries()
+                # a retry may have found a directory after the others were done
+                if self.draining or not (self.recursion and self.jobs.waiting()):
+                    break
             self.http_requester.wait()
         except KeyboardInterrupt:
-            self.print_status('\033[1A\r', perf_counter() - self.t0)
+            self.http_requester.terminate()
             return self.success_req + self.error_req
+        finally:
+            self._stop_control()
+            self.progress.save()
+            self._close_output()
 
-        self.print_status('\033[1A\r', perf_counter() - self.t0)
+        self.print_conn_stats()
         return self.total_req
 
-    def fuzz_URL(self, words: List[str]):
-        for i, word in enumerate(words):
-            req = deepcopy(self.base_req)
-            req.url = req.url.replace(self.keyword, word)
-            self.http_requester.request(
-                req, word, self.callback, self.err_callback)
-
-    def fuzz_data(self, words: List[str]):
-        for i, word in enumerate(words):
-            req = deepcopy(self.base_req)
-            req.data = req.data.replace(self.keyword, word)
-            self.http_requester.request(
-                req, word, self.callback, self.err_callback)
-
-    def fuzz_header_key(self, words):
-        key_to_replace = []
-        for key in self.base_req.headers.keys():
-            if self.keyword in key:
-                key_to_replace.append(key)
-        for i, word in enumerate(words):
-            req = deepcopy(self.base_req)
-            for key in key_to_replace:
-                req.headers[key.replace(self.keyword, word)
-                            ] = req.headers.pop(key)
-            self.http_requester.request(
-                req, word, self.callback, self.err_callback)
-
-    def fuzz_header_value(self, words):
-        for i, word in enumerate(words):
-            req = deepcopy(self.base_req)
-            for key in req.headers.keys():
-                req.headers[key] = req.headers[key].replace(self.keyword, word)
-            self.http_requester.request(
-                req, word, self.callback, self.err_callback)
-
-    def callback(self, res: rq.Response):
-        r, fuzz = res
-        self.success_req += 1
+    def prepare(self):
+        '''Build the request, start the worker processes and open the wordlist.'''
+        try:
+            self._build_request()
+        except Exception as e:
+            raise RuntimeError('Failed to build base request') from e
+        if self.auto_calibrate:
+            self.calibrate()
+
+        self._open_wordlist()
+        targets = self.payloads.targets
+        self.http_requester = HttpRequester(
+            self.proc_num, self.timeout, self.redirect, self.template, self.matcher,
+            trace=bool(self.stats_path), targets=len(targets) if targets else 0,
+            probe=self.probe, probe_size=self.probe_size)
+        # keep every worker fed while bounding the tasks waiting in the pool
+        self.limiter = Limiter(2 * self.proc_num, self.adaptive, self.rate)
+
+    def fuzz_words(self, payloads: Iterable[Tuple[int, Tuple[str, ...]]], depth=0):
+        for i, words in payloads:
+            if self.draining:
+                break
+            if self.visited is not None and not self.visited.add('\0'.join(words)):
+                self._skip(i, depth)
+                continue
+            self._submit(i, words, depth)
+            if len(self.retry):
+                self.send_retries()
+        self._send_batch()
+
+    def fuzz_targets(self):
+        '''Fuzz every target, taking turns, with at most `host_concurrency`
+        payloads of each out at a time.'''
+        ranges, done = self.progress.pending()
+        self.scheduler = FairScheduler(
+            [self.payloads.words(ranges, done, duplicate=self._skip, target=t)
+             for t in range(len(self.payloads.targets))], self.host_concurrency)
+        while not self.draining:
+            with self._turn:
+                item = self.scheduler.next()
+                finished = self.scheduler.finished
+            if item is not None:
+                self._submit(*item, 0)
+            elif finished:
+                break
+            else:
+                # every target left is at its cap until a payload comes back
+                self._send_batch()
+                with self._turn:
+                    self._turn.wait(POLL_INTERVAL)
+            if len(self.retry):
+                self.send_retries()
+        self._send_batch()
+
+    def _target_done(self, i):
+        with self._turn:
+            self.scheduler.done(i)
+            self._turn.notify()
+
+    def _submit(self, i, words, depth):
+        if self.jobs:
+            self.jobs.sent()
+        self.batch.append((i, words, depth))
+        if len(self.batch) >= self.batch_size:
+            self._send_batch()
+
+    def _send_batch(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self.limiter.acquire()
+        if self.draining:
+            # never sent, left for --resume
+            self.limiter.release()
+            return
+        self._count_inflight(len(batch))
+        self.http_requester.batch_request(
+            [words for _, words, _ in batch],
+            partial(self.batch_callback, batch), partial(self.batch_err_callback, batch))
+
+    def send_retries(self):
+        for i, words, depth in self.retry.due():
+            self._submit(i, words, depth)
+        self._send_batch()
+
+    def fuzz_retries(self):
+        '''Send the payloads waiting for a retry, until none is waiting or in flight.'''
+        while (len(self.retry) and not self.draining) or self.limiter.inflight:
+            if not self.draining:
+                self.send_retries()
+            wait = self.retry.wait_time()
+            sleep(POLL_INTERVAL if wait is None else min(wait, POLL_INTERVAL))
+
+    def fuzz_directories(self):
+        '''Fuzz the directories found so far, and those found meanwhile,
+        with the same wordlist under each.'''
+        slot = self.recursion_slot
+        while not self.draining:
+            job = self.jobs.pop()
+            if job is None:
+                return
+            depth, prefix = job
+            self.total_req += len(self.payloads)
+            self.fuzz_words(((None, words[:slot] + (prefix + words[slot],) + words[slot + 1:])
+                             for _, words in self.payloads.words()), depth)
+
+    def _start_control(self):
+        if self.control_path:
+            self.control_server = ControlServer(self.control_path, self.control).start()
+
+    def _stop_control(self):
+        if self.control_server:
+            self.control_server.close()
 
+    def control(self, command, value):
+        '''Apply a command of the control channel and return the live statistics.'''
+        if command == 'drain':
+            # the payloads not sent yet are left for --resume
+            self.draining = True
+            self.limiter.configure(paused=False)
+        elif command in ('pause', 'resume'):
+            self.limiter.configure(paused=command == 'pause')
+        elif command in ('concurrency', 'rate'):
+            # from now on the limiter counts requests, not batches
+            self.batch_size = 1
+            self.limiter.configure(**{command: value or 0})
+        return self.live_stats()
+
+    def limits(self):
+        '''The limiter's settings, in requests.'''
+        settings = self.limiter.settings()
+        settings['inflight'] = self.inflight_req
+        # until a concurrency or rate command, the limiter counts batches
+        settings['concurrency'] *= self.batch_size
+        return settings
+
+    def live_stats(self):
         duration = perf_counter() - self.t0
-        status = r.status_code
-        size = len(r.content)
-        word = len(split(r'[^\S\n\t]', r.text))
-        line = len(r.text.split('\n'))
-
-        if status in self.matches['codes'] or 'all' in self.matches['codes'] \
-                or size in self.matches['size'] or word in self.matches['word'] or line in self.matches['line']:
-            print(
-                f'\033[1A{fuzz: <60} [Status: {status}, Size: {size}, Word: {word}, Line: {line}]')
-            self.print_status('\033[1B', duration)
-
-    def err_callback(self, err):
+        settings = self.limits()
+        paused = settings.pop('paused')
+        state = 'draining' if self.draining else 'paused' if paused else 'running'
+        return {'state': state, 'duration': round(duration, 3),
+                'rate': round(self.success_req / duration, 3) if duration else 0.,
+                'success': self.success_req, 'error': self.error_req,
+                'done': self.success_req + self.error_req, 'total': self.total_req,
+                'retrying': len(self.retry), 'saved_bytes': self.saved_bytes,
+                **settings}
+
+    def batch_callback(self, batch, results):
+        latency = status = retry_after = None
+        timeout = False
+        *results, saved = results
+        self.saved_bytes += saved
+        for (i, words, depth), res in zip(batch, unpack_batch(*results)):
+            if len(res) == 2:
+                timeout |= res[0]
+                self.err_callback(i, words, depth, res[1])
+                continue
+            status, size, word, line, matched, latency, retry_after, location, timings, found = res
+            self.callback(i, words, depth, (self.payloads.label(words), status, size, word, line,
+                                            matched, latency, retry_after, timings, location, found))
+        # a batch of more than one request only comes without pacing
+        self._count_inflight(-len(batch))
+        self.limiter.release(latency, status, timeout, retry_after)
+
+    def batch_err_callback(self, batch, err):
+        # the whole task failed, like a payload that cannot be pickled
+        for i, words, depth in batch:
+            self.err_callback(i, words, depth, describe(err))
+        self._count_inflight(-len(batch))
+        self.limiter.release()
+
+    def _count_inflight(self, n):
+        with self._inflight_lock:
+            self.inflight_req += n
+
+    def callback(self, i, words, depth, res: tuple):
+        t = perf_counter()
+        fuzz, status, size, word, line, matched, latency, retry_after, timings, location, found = res
+        self.success_req += 1
+        self.retry.done((i, words, depth))
+        if matched and self.jobs and depth < self.max_depth \
+                and is_directory(words[self.recursion_slot], status, location):
+            self.jobs.push(depth + 1, words[self.recursion_slot] + '/')
+
+        if self.store is not None:
+            self.record(i, status, size, word, line, latency)
+        # the result goes out before the payload counts as done
+        if matched:
+            self.print_result(fuzz, status, size, word, line, latency, found)
+        else:
+            self.console.update()
+        self._complete(i, depth)
+        if timings:
+            self.record_timings(timings, perf_counter() - t)
+
+    def _complete(self, i, depth):
+        # only the first pass is tracked for resuming
+        if depth == 0:
+            self.progress.complete(i)
+        if self.jobs:
+            self.jobs.done()
+        if self.scheduler:
+            self._target_done(i)
+
+    def _skip(self, i, depth=0):
+        # a payload not sent at all: a duplicate, or a URL already requested
+        self.total_req -= 1
+        if depth == 0:
+            self.progress.complete(i)
+
+    def record(self, i, status, size, word, line, latency):
+        self.store.add(i, status, size, word, line, latency)
+
+    def record_timings(self, timings, process):
+        # the request phases were timed by the worker, the processing here
+        timings[PROCESS] = process
+        self.stats.record(timings)
+
+    def print_result(self, fuzz, status, size, word, line, latency=None, found=None):
+        self.console.result(format_result(fuzz, status, size, word, line, found))
+        if self.writer:
+            record = {'fuzz': fuzz, 'status': status,
+                      'size': size, 'words': word, 'lines': line, 'latency': latency}
+            if found:
+                record.update(found)
+            self.writer.write(record)
+
+    def err_callback(self, i, words, depth, error):
+        if self.retry.push((i, words, depth)):
+            # no longer in flight, the retry queue has it
+            if self.jobs:
+                self.jobs.done()
+            if self.scheduler:
+                self._target_done(i)
+            return
         self.error_req += 1
-        print(err)
+        self.report_error(i, self.payloads.label(words), error)
+        self._complete(i, depth)
+
+    def report_error(self, i, fuzz, error):
+        self.console.result(format_error(fuzz, error))
+        if self.errors:
+            self.errors.write(i, fuzz, error)
 
-    def print_status(self, prefix, duration):
+    def status_line(self):
+        duration = perf_counter() - self.t0
         rate = 0.
         if self.success_req != 0:
             rate = self.success_req / duration
 
-        msg = prefix
-        msg += f'====== Duration: {duration:.4f} sec, Rate: {rate:.4f} req/sec, Success: {self.success_req}, Error: {self.error_req}, Total: {self.success_req+self.error_req}/{self.total_req} ======'
-        print(msg)
+        return f'====== Duration: {duration:.4f} sec, Rate: {rate:.4f} req/sec, Success: {self.success_req}, Error: {self.error_req}, Total: {self.success_req+self.error_req}/{self.total_req}{self.status_fields()} ======'
+
+    def status_fields(self):
+        '''Fields added to the status line, each starting with `, `.'''
+        return f', Saved: {format_bytes(self.saved_bytes)}' if self.probe else ''
+
+    def print_conn_stats(self):
+        stats = self.http_requester.stats()
+        print(
+            f'====== Connections: New: {stats["new"]}, Reused: {stats["reused"]} ======')
+
+    def calibrate(self):
+        '''Fingerprint what the target returns for random junk and filter it out.'''
+        baselines = []
+        with rq.sessions.Session() as session:
+            for words in calibration_words(self.keywords):
+                req = rq.Request(**self.template.render(words)).prepare()
+                res = session.send(req, timeout=self.timeout,
+                                   allow_redirects=self.redirect)
+                m = measure(res.content, digest=True)
+                baselines.append(
+                    (res.status_code, m.size, m.words, m.lines, m.digest))
+        self.matcher.calibrate(baselines)
+
+    def _open_output(self):
+        self.console = Console(self.status_line)
+        self.writer = open_writer(self.output_path, self.output_format)
+        if self.errors_path:
+            self.errors = ErrorWriter(self.errors_path)
+        if self.store_path:
+            self.store = ResultStore.open(self.store_path, scan_meta(
+                self.url, self._get_method(), self.sources, self.encoding, self.mode, self.mutator,
+                self.targets, self.payloads), resume=bool(self.resume_path))
+        if self.stats_path:
+            self.stats = Stats(self.stats_path)
+        if self.profile_path:
+            self.sampler = Sampler(self.profile_path).start()
+
+    def _close_output(self):
+        self.console.close()
+        if self.writer:
+            self.writer.close()
+        if self.errors:
+            self.errors.close()
+        if self.store_path:
+            self.store.save()
+        if self.stats:
+            self.stats.dump()
+        if self.sampler:
+            self.sampler.stop()
+
+    def _open_wordlist(self):
+        self.payloads = Payloads.open(
+            self.sources, self.encoding, self.mode, self.mutator, self.dedup, self.targets)
+        self.progress = Progress(self.resume_path, self.payloads)
+        if self.replay_path:
+            self.progress.only(load_errors(self.replay_path))
+        self.total_req = len(self.progress)
 
     def _build_request(self):
         self.method = self._get_method()
         self.headers = self._get_dict_headers()
         self.cookies = self._get_dict_cookies()
-        self.base_req = rq.Request(
-            self.method, self.url, self.headers, data=self.data, cookies=self.cookies)
-
-        self.fuzz_func = self._get_fuzz_func()
-
-    def _get_fuzz_func(self):
-        if self.keyword in self.url:
-            return self.fuzz_URL
-        elif self.data and self.keyword in self.data:
-            return self.fuzz_data
-        elif self.headers and any(self.keyword in key for key in self.headers.keys()):
-            return self.fuzz_header_key
-        elif self.headers and any(self.keyword in val for val in self.headers.values()):
-            return self.fuzz_header_value
-        else:
-            raise KeyError(
-                f'keyword {self.keyword} not found in URL, post data, and headers')
+        self.template = RequestTemplate(
+            self.keywords, self.method, self.url, self.headers, data=self.data, cookies=self.cookies)
+        if self.recursion:
+            self.recursion_slot = self._get_recursion_slot()
+
+    def _get_recursion_slot(self):
+        # directories are fuzzed by prefixing the keyword at the end of the path
+        for slot, keyword in enumerate(self.keywords):
+            if self.url.endswith('/' + keyword):
+                return slot
+        raise ValueError('recursion needs the URL to end with a keyword, like http://host/FUZZ')
 
     def _get_method(self):
         if self.data:
@@ -0,0 +1,341 @@
+import asyncio
+import multiprocessing as mp
+import os
+from queue import Empty
+from time import perf_counter
+import aiohttp
+from fuzzer import Fuzzer
+from common.metrics import Metrics, CHUNK_SIZE, DRAIN_LIMIT, HEAD_UNSUPPORTED, content_length
+from common.wordlist import split_ranges
+from common.throttle import AsyncLimiter
+from common.stats import new_timings, DOWNLOAD, TOTAL
+from common.retry import feed_retries, drain_retries, describe
+from common.targets import FairScheduler
+from common.store import ResultStore
+from common.control import SharedControl
+
+# a shard sends its results to the parent every `FLUSH_SIZE` responses or
+# `FLUSH_INTERVAL` seconds, whichever comes first
+FLUSH_SIZE = 256
+FLUSH_INTERVAL = 0.1
+
+
+class HybridFuzzer(Fuzzer):
+    '''One process per shard of the wordlist, each running an aiohttp event loop.'''
+
+    def __init__(self, concurrency, **kwargs):
+        super().__init__(**kwargs)
+        if not self.proc_num:
+            self.proc_num = os.cpu_count() or 1
+        self.concurrency = concurrency
+        self.shared = None
+
+    def fuzz(self):
+        try:
+            self._build_request()
+        except Exception as e:
+            raise RuntimeError('Failed to build base request') from e
+        if self.auto_calibrate:
+            self.calibrate()
+
+        self._open_wordlist()
+        self._open_output()
+        ranges, done = self.progress.pending()
+        results = mp.Queue()
+        self.shared = SharedControl(self.concurrency, self.rate)
+        shards = [mp.Process(target=self._run_shard, args=(shard_ranges, done, results), daemon=True)
+                  for shard_ranges in split_ranges(ranges, self.proc_num)]
+
+        try:
+            self.t0 = perf_counter()
+            for shard in shards:
+                shard.start()
+            self._start_control()
+
+            running = len(shards)
+            while running:
+                try:
+                    msg = results.get(timeout=self.console.interval)
+                except Empty:
+                    self.console.update()
+                    continue
+                if msg is None:
+                    running -= 1
+                    continue
+                t = perf_counter()
+                success, error, saved, skipped, completed, matched, failed, timings, columns = msg
+                self.success_req += success
+                self.error_req += error
+                self.saved_bytes += saved
+                self.total_req -= skipped
+                for i in completed:
+                    self.progress.complete(i)
+                for res in matched:
+                    self.print_result(*res)
+                for failure in failed:
+                    self.report_error(*failure)
+                if columns:
+                    self.store.extend(columns)
+                self.console.update()
+                if timings:
+                    # the time spent here is shared out over the batch
+                    process = (perf_counter() - t) / len(timings)
+                    for request_timings in timings:
+                        self.record_timings(request_timings, process)
+
+            for shard in shards:
+                shard.join()
+        except KeyboardInterrupt:
+            for shard in shards:
+                shard.terminate()
+            return self.success_req + self.error_req
+        finally:
+            self._stop_control()
+            self.progress.save()
+            self._close_output()
+
+        return self.total_req
+
+    def control(self, command, value):
+        # the shards apply the new settings as they poll them
+        if command == 'drain':
+            self.draining = True
+            self.shared.set(draining=True, paused=False)
+        elif command in ('pause', 'resume'):
+            self.shared.set(paused=command == 'pause')
+        elif command == 'concurrency':
+            # there are no more workers per shard than `-c`
+            self.shared.set(concurrency=min(value, self.concurrency))
+        elif command == 'rate':
+            self.shared.set(rate=value)
+        return self.live_stats()
+
+    def limits(self):
+        settings = self.shared.get()
+        return {'paused': settings['paused'], 'concurrency': settings['concurrency'],
+                'rate_limit': settings['rate']}
+
+    def _run_shard(self, ranges, done, results):
+        try:
+            asyncio.run(self._fuzz_shard(ranges, done, results))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            results.put(None)
+
+    async def _fuzz_shard(self, ranges, done, results):
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        # with several targets, each one is resolved once for the whole scan
+        connector = aiohttp.TCPConnector(limit=self.concurrency,
+                                         ttl_dns_cache=None if self.targets else 10)
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        batch = _Batch(results, store=bool(self.store_path))
+        scheduler = None
+        if self.targets:
+            # the cap of each target is shared out between the shards
+            scheduler = FairScheduler(
+                [self.payloads.words(ranges, done, duplicate=batch.skip, target=t)
+                 for t in range(len(self.payloads.targets))],
+                max(1, self.host_concurrency // self.proc_num))
+        # the rate cap is shared out evenly between the shards
+        limiter = AsyncLimiter(self.concurrency, self.adaptive,
+                               self.rate / self.proc_num if self.rate else None)
+
+        trace_configs = []
+        if self.stats_path:
+            from common.aiotracing import trace_config
+            trace_configs.append(trace_config())
+
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                         trace_configs=trace_configs) as session:
+            workers = [asyncio.create_task(self._work(queue, session, limiter, batch, scheduler))
+                       for _ in range(self.concurrency)]
+            follower = asyncio.create_task(self._follow(limiter))
+            items = scheduler.drain() if scheduler \
+                else _each(self.payloads.words(ranges, done, duplicate=batch.skip))
+            async for item in items:
+                if self.draining:
+                    break
+                await queue.put(item)
+                if len(self.retry):
+                    await feed_retries(self.retry, queue)
+            await drain_retries(self.retry, queue, lambda: self.draining)
+            for _ in workers:
+                await queue.put(None)  # one stop signal per worker
+            await asyncio.gather(*workers)
+            follower.cancel()
+        batch.flush()
+
+    async def _follow(self, limiter):
+        '''Apply the settings changed on the control channel while the shard runs.'''
+        while True:
+            settings = self.shared.changed()
+            if settings:
+                self.draining = settings['draining']
+                rate = settings['rate']
+                await limiter.configure(settings['paused'], settings['concurrency'],
+                                        rate / self.proc_num if rate else 0)
+            await asyncio.sleep(FLUSH_INTERVAL)
+
+    async def _work(self, queue, session, limiter, batch, scheduler=None):
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            i, words = item
+            await limiter.acquire()
+            if self.draining:
+                # never sent, left for --resume
+                await limiter.release()
+                queue.task_done()
+                continue
+            try:
+                res = await self._request(session, words, batch)
+            except Exception as e:
+                await limiter.release(timeout=isinstance(e, asyncio.TimeoutError))
+                if not self.retry.push(item):
+                    batch.fail(i, self.payloads.label(words), describe(e))
+            else:
+                self.retry.done(item)
+                await limiter.release(res[6], res[1], retry_after=res[7])
+                batch.add(i, res)
+            if scheduler:
+                scheduler.done(i)
+            queue.task_done()
+
+    async def _request(self, session, words, batch):
+        req = self.template.render(words)
+        word = self.payloads.label(words)
+        timings = new_timings() if self.stats_path else None
+        matcher = self.matcher
+        if self.probe == 'head':
+            t = perf_counter()
+            async with session.request(**dict(req, method='HEAD'), allow_redirects=self.redirect,
+                                       trace_request_ctx=timings) as r:
+                latency = perf_counter() - t
+                if r.status not in HEAD_UNSUPPORTED and not matcher.needs_body(r.status, r.headers, True):
+                    _body_read(timings, t, latency)
+                    size = content_length(r.headers)
+                    batch.saved += content_length(r.headers, wire=True) or 0
+                    return word, r.status, size, None, None, matcher.is_match(r.status, size, None, None), \
+                        latency, r.headers.get('Retry-After'), timings, r.headers.get('Location'), None
+            # the body is needed after all
+            timings = new_timings() if timings else None
+        t = perf_counter()
+        async with session.request(**req, allow_redirects=self.redirect, trace_request_ctx=timings) as r:
+            latency = perf_counter() - t
+            retry_after = r.headers.get('Retry-After')
+            location = r.headers.get('Location')
+            if not matcher.needs_body(r.status, r.headers, self.probe is not None):
+                size = content_length(r.headers)
+                n_words = n_lines = None
+                if self.probe and matcher.is_match(r.status, size, None, None):
+                    size, n_words, n_lines, saved = await _probe_body(r, size, self.probe_size)
+                else:
+                    saved = await _discard(r)
+                batch.saved += saved
+                _body_read(timings, t, latency)
+                return word, r.status, size, n_words, n_lines, matcher.is_match(r.status, size, n_words, n_lines), \
+                    latency, retry_after, timings, location, None
+
+            m = Metrics(matcher.needs_digest)
+            scan = matcher.scan(r.headers)
+            async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                m.feed(chunk)
+                if scan:
+                    scan.feed(chunk)
+            _body_read(timings, t, latency)
+            matched = matcher.is_match(r.status, m.size, m.words, m.lines, m.digest, scan)
+            return word, r.status, m.size, m.words, m.lines, matched, \
+                latency, retry_after, timings, location, scan.found() if scan and matched else None
+
+
+async def _each(items):
+    for item in items:
+        yield item
+
+
+async def _discard(r):
+    '''Drop the body of `r`, returning how many of its bytes were not downloaded.'''
+    size = content_length(r.headers, wire=True)
+    if size is not None and size <= DRAIN_LIMIT:
+        await r.read()
+        return 0
+    r.close()
+    return size or 0
+
+
+async def _probe_body(r, size, limit):
+    '''Read the body of `r` up to `limit` bytes. Returns its size, words and
+    lines if it ends there, else `size` and no counts, and the bytes not
+    downloaded.'''
+    m = Metrics()
+    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+        m.feed(chunk)
+        if m.size > limit:
+            r.close()
+            return size, None, None, max(0, (content_length(r.headers, wire=True) or 0) - m.size)
+    return m.size, m.words, m.lines, 0
+
+
+def _body_read(timings, t, latency):
+    if timings:
+        timings[TOTAL] = perf_counter() - t
+        timings[DOWNLOAD] = timings[TOTAL] - latency
+
+
+class _Batch:
+    '''Counters, matched and failed results, timings and stored columns of a
+    shard, sent to the parent in batches.'''
+
+    def __init__(self, results, store=False):
+        self.results = results
+        self.store = ResultStore() if store else None
+        self.success = 0
+        self.error = 0
+        self.saved = 0
+        self.skipped = 0
+        self.completed = []
+        self.matched = []
+        self.failed = []
+        self.timings = []
+        self.t_flush = perf_counter()
+
+    def add(self, i, res):
+        self.success += 1
+        self.completed.append(i)
+        if res[5]:
+            self.matched.append(res[:5] + res[6:7] + res[10:])
+        if res[8]:
+            self.timings.append(res[8])
+        if self.store is not None:
+            self.store.add(i, *res[1:5], res[6])
+        self._maybe_flush()
+
+    def fail(self, i, fuzz, error):
+        self.error += 1
+        self.completed.append(i)
+        self.failed.append((i, fuzz, error))
+        self._maybe_flush()
+
+    def skip(self, i):
+        self.skipped += 1
+        self.completed.append(i)
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self.completed) >= FLUSH_SIZE or perf_counter() - self.t_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.results.put((self.success, self.error, self.saved, self.skipped, self.completed, self.matched,
+                          self.failed, self.timings, self.store.take() if self.store is not None else None))
+        self.success = 0
+        self.error = 0
+        self.saved = 0
+        self.skipped = 0
+        self.completed = []
+        self.matched = []
+        self.failed = []
+        self.timings = []
+        self.t_flush = perf_counter()
@@ -0,0 +1,108 @@
+import secrets
+from common.metrics import content_length
+from patterns import Patterns
+
+# lengths of the random words sent by auto-calibration
+CALIBRATION_LENGTHS = (8, 16, 24, 32)
+# fingerprint masks that can be checked before reading the body
+_STATUS_ONLY = (False, False, False, False)
+_STATUS_SIZE = (True, False, False, False)
+
+
+class Matcher:
+    '''Match and filter options, checked with set lookups only.
+
+    A response is shown if it matches any `-m*` option and no `-f*` option.
+    Auto-calibration adds fingerprints of baseline responses: the status plus
+    whichever of size, words, lines and body digest were the same across the
+    baseline responses with that status. Regexes, signatures and
+    extractions are looked for in the headers and body by a Patterns scan.
+    '''
+
+    def __init__(self, mc=None, ms=None, mw=None, ml=None, fc=None, fs=None, fw=None, fl=None,
+                 mr=None, fr=None, signatures=None, extract=None):
+        mc = mc or []
+        self.match_all = 'all' in mc
+        self.codes = set() if self.match_all else {int(c) for c in mc}
+        self.size = set(ms or [])
+        self.word = set(mw or [])
+        self.line = set(ml or [])
+
+        self.filter_codes = set(fc or [])
+        self.filter_size = set(fs or [])
+        self.filter_word = set(fw or [])
+        self.filter_line = set(fl or [])
+        self.patterns = Patterns(mr, fr, signatures, extract) if mr or fr or signatures or extract else None
+        # (size, words, lines, digest) mask -> set of (status, *masked values)
+        self.fingerprints = {}
+        self.needs_digest = False
+
+    def needs_body(self, status, headers, probe=False):
+        '''Whether the body must be read to match and print a response.
+
+        When probing, a response matched by its status or size is shown
+        without reading its body, unless an option needs the body to
+        filter it out.
+        '''
+        # filtered responses are dropped before their body is read
+        if status in self.filter_codes or (status,) in self.fingerprints.get(_STATUS_ONLY, ()):
+            return False
+        size = content_length(headers)
+        if size is not None and (size in self.filter_size
+                                 or (status, size) in self.fingerprints.get(_STATUS_SIZE, ())):
+            return False
+        if probe and (self.match_all or status in self.codes or size in self.size):
+            return bool(self.filter_word or self.filter_line or self.patterns
+                        or (size is None and self.filter_size)
+                        or any(mask[1] or mask[2] or mask[3] or (size is None and mask[0])
+                               for mask in self.fingerprints))
+        if self.match_all or status in self.codes:
+            return True
+        if self.patterns and self.patterns.can_match:
+            return True
+        if self.word or self.line:
+            return True
+        if self.size:
+            return size is None or size in self.size
+        return False
+
+    def scan(self, headers):
+        '''A scan to feed the body to, or None if there are no patterns.'''
+        return self.patterns.scan(headers) if self.patterns else None
+
+    def is_match(self, status, size, word, line, digest=None, scan=None):
+        if not (self.match_all or status in self.codes or size in self.size
+                or word in self.word or line in self.line or (scan and scan.matched)):
+            return False
+        return not self.is_filtered(status, size, word, line, digest, scan)
+
+    def is_filtered(self, status, size, word, line, digest=None, scan=None):
+        if status in self.filter_codes or size in self.filter_size \
+                or word in self.filter_word or line in self.filter_line:
+            return True
+        if scan and scan.filtered:
+            return True
+        values = (size, word, line, digest)
+        for mask, keys in self.fingerprints.items():
+            key = (status,) + tuple(v for v, m in zip(values, mask) if m)
+            if key in keys:
+                return True
+        return False
+
+    def calibrate(self, baselines):
+        '''Add fingerprints for `(status, size, words, lines, digest)` baselines.'''
+        by_status = {}
+        for status, *values in baselines:
+            by_status.setdefault(status, []).append(values)
+        for status, group in by_status.items():
+            mask = tuple(all(v[i] == group[0][i] for v in group)
+                         for i in range(4))
+            key = (status,) + tuple(v for v, m in zip(group[0], mask) if m)
+            self.fingerprints.setdefault(mask, set()).add(key)
+            self.needs_digest = self.needs_digest or mask[3]
+
+
+def calibration_words(keywords):
+    '''Random payloads that should hit whatever the target serves for junk.'''
+    return [tuple(secrets.token_hex(n // 2) for _ in keywords)
+            for n in CALIBRATION_LENGTHS]
@@ -0,0 +1,183 @@
+import re
+try:
+    from re import _parser as sre_parse
+except ImportError:  # before Python 3.11
+    import sre_parse
+
+# bytes kept from the end of a chunk and scanned again with the next one, so
+# a match across two chunks is still found; a longer match across two
+# chunks can be missed
+OVERLAP = 4096
+# patterns are looked for by the longest literal every match contains, if
+# it is at least this long; the others are searched for on their own
+MIN_LITERAL = 3
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)}
+
+
+def load_signatures(path):
+    '''The `(name, regex)` signatures of a file, one per line as `NAME<TAB>REGEX`
+    or just `REGEX`, skipping empty lines and `#` comments.'''
+    signatures = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            name, tab, regex = line.partition('\t')
+            signatures.append((name, regex) if tab else (line, line))
+    return signatures
+
+
+def required_literal(regex):
+    '''The longest run of characters every match of `regex` contains.'''
+    best = ''
+
+    def walk(items):
+        nonlocal best
+        run = ''
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run += chr(av)
+                continue
+            best = max(best, run, key=len)
+            run = ''
+            if op is sre_parse.SUBPATTERN:
+                walk(av[-1])
+            elif op in _REPEATS and av[0] >= 1:
+                walk(av[2])
+        best = max(best, run, key=len)
+
+    walk(sre_parse.parse(regex))
+    return best
+
+
+def _trie(literals):
+    '''A regex matching any of `literals`, shaped as a trie so a position in
+    a body costs a step per character matched rather than one per literal.'''
+    root = {}
+    for literal in literals:
+        node = root
+        for c in literal:
+            node = node.setdefault(c, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(c) + build(child) for c, child in sorted(node.items()) if c]
+        if not branches:
+            return ''
+        regex = branches[0] if len(branches) == 1 else f'(?:{"|".join(branches)})'
+        if '' in node:
+            regex = f'(?:{regex})?'
+        return regex
+
+    return build(root)
+
+
+class Patterns:
+    '''Match, filter, signature and extraction regexes, looked for in a
+    response in one pass however many there are.
+
+    The pass is a single regex of the literals the patterns require, built
+    as a trie and matched on the lowercased chunk; only the patterns whose
+    literal turned up in a chunk are then searched for in it. Patterns
+    without a literal of MIN_LITERAL characters are searched for in every
+    chunk until found.
+    '''
+
+    def __init__(self, match=None, filter=None, signatures=None, extract=None):
+        patterns = [('match', regex, None) for regex in match or []] \
+            + [('filter', regex, None) for regex in filter or []] \
+            + [('match', regex, name) for name, regex in signatures or []] \
+            + [('extract', regex, None) for regex in extract or []]
+        self.regexes = []
+        self.kinds = []
+        self.names = []  # signature names, None for the other patterns
+        self.by_literal = {}  # lowercased literal -> indexes of the patterns requiring it
+        self.unfiltered = []  # indexes of the patterns without a literal
+        for i, (kind, regex, name) in enumerate(patterns):
+            try:
+                compiled = re.compile(regex.encode())
+                # bytes.lower(), like the prefiltered body, only folds ASCII
+                literal = required_literal(regex).encode().lower()
+            except re.error as e:
+                raise ValueError(f'invalid regex {regex}: {e}') from None
+            if kind == 'extract' and not compiled.groupindex:
+                raise ValueError(f'invalid regex {regex}: extraction needs a named group like (?P<name>...)')
+            self.regexes.append(compiled)
+            self.kinds.append(kind)
+            self.names.append(name)
+            if len(literal) >= MIN_LITERAL:
+                self.by_literal.setdefault(literal, []).append(i)
+            else:
+                self.unfiltered.append(i)
+        # a lookahead finds literals starting inside one another
+        self.prefilter = None
+        if self.by_literal:
+            trie = _trie(literal.decode('latin-1') for literal in self.by_literal)
+            self.prefilter = re.compile(f'(?=({trie}))'.encode('latin-1'))
+        self.can_match = 'match' in self.kinds
+
+    def scan(self, headers):
+        '''A scan of a response, fed its headers already.'''
+        scan = Scan(self)
+        scan.feed(''.join(f'{k}: {v}\r\n' for k, v in headers.items()).encode('latin-1', 'replace'))
+        scan.tail = b''  # a match does not run from the headers into the body
+        return scan
+
+
+class Scan:
+    '''The patterns found in a response, fed chunk by chunk.'''
+    __slots__ = ('patterns', 'hits', 'extracted', 'tail')
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.hits = set()  # indexes of the patterns found, they are not looked for again
+        self.extracted = {}  # first value of each extracted group
+        self.tail = b''
+
+    def feed(self, chunk):
+        patterns = self.patterns
+        if len(self.hits) == len(patterns.regexes):
+            return
+        data = self.tail + chunk if self.tail else chunk
+        self.tail = data[-OVERLAP:]
+
+        candidates = set(patterns.unfiltered)
+        if patterns.prefilter:
+            by_literal = patterns.by_literal
+            # matching lowercased bytes is much faster than IGNORECASE
+            for m in patterns.prefilter.finditer(data.lower()):
+                # the literals found are the match and its prefixes
+                found = m.group(1)
+                for end in range(MIN_LITERAL, len(found) + 1):
+                    candidates.update(by_literal.get(found[:end], ()))
+        for i in candidates - self.hits:
+            m = patterns.regexes[i].search(data)
+            if m is None:
+                continue
+            self.hits.add(i)
+            if patterns.kinds[i] == 'extract':
+                for name, value in m.groupdict().items():
+                    if value is not None:
+                        self.extracted.setdefault(name, value.decode('utf-8', 'replace'))
+
+    @property
+    def matched(self):
+        kinds = self.patterns.kinds
+        return any(kinds[i] == 'match' for i in self.hits)
+
+    @property
+    def filtered(self):
+        kinds = self.patterns.kinds
+        return any(kinds[i] == 'filter' for i in self.hits)
+
+    def found(self):
+        '''The signatures and extracted values to report, or None.'''
+        names = self.patterns.names
+        found = {}
+        signatures = sorted(names[i] for i in self.hits if names[i] is not None)
+        if signatures:
+            found['signatures'] = signatures
+        if self.extracted:
+            found['extract'] = self.extracted
+        return found or None
@@ -0,0 +1,60 @@
+import heapq
+from threading import Condition
+from urllib.parse import urlsplit
+
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+# a directory answers with a redirect to itself plus a slash, or denies access
+DIRECTORY_CODES = {401, 403}
+
+
+def is_directory(word, status, location):
+    '''Whether a response for `word` looks like a directory worth recursing into.'''
+    if status in DIRECTORY_CODES:
+        return True
+    return status in REDIRECT_CODES and location is not None \
+        and urlsplit(location).path.endswith(word + '/')
+
+
+class WorkQueue:
+    '''Directories left to fuzz, shallowest first.
+
+    The loop submitting requests pops directories; request callbacks push
+    the ones they find. pop() waits while requests that may still find a
+    directory are in flight, and returns None once everything is done.
+    '''
+
+    def __init__(self):
+        self._heap = []
+        self._seq = 0
+        self._inflight = 0
+        self._cond = Condition()
+
+    def push(self, depth, prefix):
+        with self._cond:
+            heapq.heappush(self._heap, (depth, self._seq, prefix))
+            self._seq += 1
+            self._cond.notify_all()
+
+    def pop(self):
+        with self._cond:
+            self._cond.wait_for(lambda: self._heap or not self._inflight)
+            if not self._heap:
+                return None
+            depth, _, prefix = heapq.heappop(self._heap)
+            return depth, prefix
+
+    def waiting(self):
+        '''The number of directories left to fuzz.'''
+        with self._cond:
+            return len(self._heap)
+
+    def sent(self):
+        with self._cond:
+            self._inflight += 1
+
+    def done(self):
+        with self._cond:
+            self._inflight -= 1
+            if not self._inflight:
+                self._cond.notify_all()
+
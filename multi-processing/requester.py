@@ -1,60 +1,251 @@
-from typing import Callable, List
+import math
+import struct
+from typing import Callable, List, Tuple
 import requests as rq
+from requests.adapters import HTTPAdapter
 import multiprocessing as mp
 from time import perf_counter
+from common.template import RequestTemplate
+from matcher import Matcher
+from common.metrics import Metrics, CHUNK_SIZE, DRAIN_LIMIT, HEAD_UNSUPPORTED, content_length
+from common.stats import PHASES, new_timings
+from common.tracing import TimedAdapter, body_read
+from common.retry import describe
+from common.targets import cache_dns
 
+# a worker sends one request at a time, so one keep-alive connection per
+# host is enough; a few host pools leave room for redirects to other hosts
+POOL_HOSTS = 4
+POOL_MAXSIZE = 1
+# a worker sends a batch of requests per task and packs each result into a
+# fixed-size record: status, size, words, lines, matched and latency, with -1
+# for the sizes and counts it did not measure. Timings, when traced, follow
+# in a record of their own with NaN for the phases it did not see
+BATCH_SIZE = 16
+RECORD = struct.Struct('<Hqii?d')
+TIMINGS = struct.Struct(f'<{len(PHASES)}d')
+_FAILED = RECORD.pack(0, -1, -1, -1, False, 0.)
+# Retry-After, Location and patterns found, sent apart as they are rare
+_NO_EXTRA = (None, None, None)
 
-class _HttpRequest:
-    def __init__(self, req: rq.Request, timeout: float, word: str, redirect):
-        self.req = req.prepare()
-        self.timeout = timeout
-        self.word = word
-        self.redirect = redirect
+# per-worker state, set up once by _init_worker in every pool process
+_session = None
+_adapter = None
+_stats = None
+_template = None
+_timeout = None
+_redirect = None
+_matcher = None
+_trace = False
+_probe = None
+_probe_size = None
+
+
+def _init_worker(stats, template, timeout, redirect, matcher, trace, targets, probe, probe_size):
+    global _session, _adapter, _stats, _template, _timeout, _redirect, _matcher, _trace, _probe, _probe_size
+    # with several targets, a pool per target stays open and each one is
+    # resolved once
+    if targets:
+        cache_dns()
+    if trace:
+        _adapter = TimedAdapter(pool_connections=POOL_HOSTS + targets,
+                                pool_maxsize=POOL_MAXSIZE)
+    else:
+        _adapter = HTTPAdapter(pool_connections=POOL_HOSTS + targets,
+                               pool_maxsize=POOL_MAXSIZE)
+    _session = rq.sessions.Session()
+    _session.mount('http://', _adapter)
+    _session.mount('https://', _adapter)
+    _stats = stats
+    _template = template
+    _timeout = timeout
+    _redirect = redirect
+    _matcher = matcher
+    _trace = trace
+    _probe = probe
+    _probe_size = probe_size
+
+
+def _opened_connections():
+    pools = _adapter.poolmanager.pools
+    return sum(pools[key].num_connections for key in pools.keys())
+
+
+def _count_connection(new):
+    counter = _stats['new' if new else 'reused']
+    with counter.get_lock():
+        counter.value += 1
+
+
+def _send(req):
+    # every attempt counts, a failed one too: it was sent on a connection
+    # opened for it or on one kept alive
+    opened = _opened_connections()
+    try:
+        return _session.send(req, timeout=_timeout,
+                             allow_redirects=_redirect, stream=True)
+    finally:
+        _count_connection(_opened_connections() > opened)
+
+
+def _request(words):
+    # only the payload crosses the process boundary; the request is rendered
+    # from the template every worker received at start-up
+    req = _template.render(words)
+    timings = None
+    if _trace:
+        timings = _adapter.timings = new_timings()
+        t = perf_counter()
+    if _probe == 'head':
+        res = _send(rq.Request(**dict(req, method='HEAD')).prepare())
+        status = res.status_code
+        if status not in HEAD_UNSUPPORTED and not _matcher.needs_body(status, res.headers, True):
+            latency = res.elapsed.total_seconds()
+            res.raw.drain_conn()
+            if timings:
+                body_read(timings, t, latency)
+            size = content_length(res.headers)
+            return status, size, None, None, _matcher.is_match(status, size, None, None), latency, \
+                (res.headers.get('Retry-After'), res.headers.get('Location'), None), timings, \
+                content_length(res.headers, wire=True) or 0
+        # the body is needed after all
+        res.raw.drain_conn()
+        if timings:
+            timings = _adapter.timings = new_timings()
+            t = perf_counter()
+    res = _send(rq.Request(**req).prepare())
+
+    status = res.status_code
+    # time to response headers and the throttling hint, for the limiter
+    latency = res.elapsed.total_seconds()
+    retry_after, location = res.headers.get('Retry-After'), res.headers.get('Location')
+    if not _matcher.needs_body(status, res.headers, _probe is not None):
+        size = content_length(res.headers)
+        word = line = None
+        if _probe and _matcher.is_match(status, size, None, None):
+            size, word, line, saved = _probe_body(res, size)
+        else:
+            saved = _discard(res)
+        if timings:
+            body_read(timings, t, latency)
+        return status, size, word, line, _matcher.is_match(status, size, word, line), \
+            latency, (retry_after, location, None), timings, saved
+
+    m = Metrics(_matcher.needs_digest)
+    scan = _matcher.scan(res.headers)
+    for chunk in res.iter_content(CHUNK_SIZE):
+        m.feed(chunk)
+        if scan:
+            scan.feed(chunk)
+    if timings:
+        body_read(timings, t, latency)
+    matched = _matcher.is_match(status, m.size, m.words, m.lines, m.digest, scan)
+    found = scan.found() if scan and matched else None
+    return status, m.size, m.words, m.lines, matched, \
+        latency, (retry_after, location, found), timings, 0
 
-    def request(self):
-        with rq.sessions.Session() as session:
-            res = session.send(self.req, timeout=self.timeout,
-                               allow_redirects=self.redirect)
-        return res, self.word
+
+def _request_batch(batch):
+    '''Send the requests of a batch, returning their results packed as
+    records, then by position the headers and patterns found the parent
+    needs and the errors, then the timings and the body bytes not
+    downloaded.'''
+    records = bytearray()
+    timings = bytearray() if _trace else None
+    extras = {}
+    errors = {}
+    saved = 0
+    for pos, words in enumerate(batch):
+        try:
+            status, size, word, line, matched, latency, extra, t, skipped = _request(words)
+        except Exception as e:
+            errors[pos] = (isinstance(e, rq.exceptions.Timeout), describe(e))
+            records += _FAILED
+            if _trace:
+                timings += TIMINGS.pack(*[math.nan] * len(PHASES))
+            continue
+        records += RECORD.pack(status, _count(size), _count(word), _count(line), matched, latency)
+        saved += skipped
+        if extra != _NO_EXTRA:
+            extras[pos] = extra
+        if _trace:
+            timings += TIMINGS.pack(*(math.nan if v is None else v for v in t))
+    return bytes(records), extras, errors, timings and bytes(timings), saved
+
+
+def _count(value):
+    return -1 if value is None else value
+
+
+def _uncount(value):
+    return None if value == -1 else value
+
+
+def unpack_batch(records, extras, errors, timings):
+    '''The results of a batch, in order: `(status, size, words, lines, matched,
+    latency, retry_after, location, timings, found)` for a request that went
+    through, `(timeout, error)` for one that failed.'''
+    for pos, (status, size, word, line, matched, latency) in enumerate(RECORD.iter_unpack(records)):
+        if pos in errors:
+            yield errors[pos]
+            continue
+        retry_after, location, found = extras.get(pos, _NO_EXTRA)
+        request_timings = None
+        if timings:
+            request_timings = [None if math.isnan(v) else v
+                               for v in TIMINGS.unpack_from(timings, pos * TIMINGS.size)]
+        yield status, _uncount(size), _uncount(word), _uncount(line), matched, \
+            latency, retry_after, location, request_timings, found
+
+
+def _discard(res):
+    '''Drop the body of `res`, returning how many of its bytes were not downloaded.'''
+    size = content_length(res.headers, wire=True)
+    if size is not None and size <= DRAIN_LIMIT:
+        res.raw.drain_conn()
+        return 0
+    res.close()
+    return size or 0
+
+
+def _probe_body(res, size):
+    '''Read the body of `res` up to the probe size. Returns its size, words
+    and lines if it ends there, else `size` and no counts, and the bytes
+    not downloaded.'''
+    m = Metrics()
+    for chunk in res.iter_content(CHUNK_SIZE):
+        m.feed(chunk)
+        if m.size > _probe_size:
+            read = res.raw.tell()
+            res.close()
+            return size, None, None, max(0, (content_length(res.headers, wire=True) or 0) - read)
+    return m.size, m.words, m.lines, 0
 
 
 class HttpRequester:
-    def __init__(self, worker_num, timeout, redirect) -> None:
-        self.pool = mp.Pool(processes=worker_num)
+    def __init__(self, worker_num, timeout, redirect, template: RequestTemplate, matcher: Matcher, trace=False, targets=0, probe=None, probe_size=None) -> None:
+        self.conn_stats = {'new': mp.Value('L', 0), 'reused': mp.Value('L', 0)}
+        self.pool = mp.Pool(processes=worker_num, initializer=_init_worker,
+                            initargs=(self.conn_stats, template, timeout, redirect, matcher, trace, targets,
+                                      probe, probe_size))
         self.results = []
         self.timeout = timeout
         self.redirect = redirect
 
-    def request(self, r: rq.Request, word: str, callback: Callable[[rq.Response], None], err_callback):
-        req = _HttpRequest(r, self.timeout, word, self.redirect)
-        self.pool.apply_async(
-            req.request, (), callback=callback, error_callback=err_callback)
-
-    def batch_request(self, rs: List[rq.Request], words: List[str], callback: Callable[[List[rq.Response]], None], err_callback):
-        reqs = [_HttpRequest(rs[i], self.timeout, words[i], self.redirect)
-                for i in range(len(rs))]
-        self.pool.map_async(_HttpRequest.request, reqs,
-                            callback=callback, error_callback=err_callback)
+    def batch_request(self, payloads: List[Tuple[str, ...]], callback: Callable[[tuple], None], err_callback):
+        '''Send the payloads as one task; the callback gets the packed results,
+        see unpack_batch().'''
+        self.pool.apply_async(_request_batch, (payloads,),
+                              callback=callback, error_callback=err_callback)
 
     def wait(self):
         self.pool.close()
         self.pool.join()
 
+    def terminate(self):
+        '''Stop the workers now, dropping the requests in flight.'''
+        self.pool.terminate()
 
-def default_callback(res):
-    for r, word in res:
-        print(f'{word}, {r.status_code}')
-
-
-if __name__ == '__main__':
-    url = 'https://ice1187.github.io'
-    requester = HttpRequester(worker_num=16, timeout=10.)
+    def stats(self):
+        return {key: val.value for key, val in self.conn_stats.items()}
 
-    t0 = perf_counter()
-    rs = []
-    for _ in range(100):
-        r = rq.Request(method='GET', url=url)
-        rs.append(r)
-    requester.batch_request(rs, default_callback, [i for i in range(100)])
-    requester.get_results()
-    print(f'Elapsed time: {perf_counter() - t0:.4f}')
@@ -1,18 +1,75 @@
 #!/usr/bin/env python3
 import argparse
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fuzzer import Fuzzer
+from common.payloads import MODES
+from common.mutations import comma_list
+from common.generators import parse_bounds
+from common.output import FORMATS
+from common.metrics import PROBES, PROBE_SIZE
 
 parser = argparse.ArgumentParser(
     description='A simple multi-processes Web Fuzzer.\
-        Use keyword `FUZZ` in URL `-u`, post data `-d`, or header `-H` to define the fuzzing point.')
+        Use keyword `FUZZ` in URL `-u`, post data `-d`, header `-H`, or cookie `-b` to define the fuzzing point.\
+        Run `web-fuzzer.py query STORE_FILE` to explore the results saved with `--store`.')
 parser.add_argument('-u', '--url', action='store',
-                    required=True, help='Target URL (required)')
-parser.add_argument('-w', '--wordlist', action='store',
-                    required=True, help='Wordlist file path (required)')
+                    help='Target URL (required unless `-U` is given)')
+parser.add_argument('-U', '--targets', action='store', metavar='TARGETS_FILE',
+                    help='Fuzz every base URL of this file, one per line, taking turns; each fills the keyword `TARGET` (or `path:KEYWORD`), and `-u` defaults to `TARGET/FUZZ`')
+parser.add_argument('--host-concurrency', action='store', type=int, default=10,
+                    help='Maximum payloads out at a time per target with `-U`, so a slow target only holds back itself (default: 10)')
+parser.add_argument('-w', '--wordlist', action='append',
+                    help='Wordlist file path and optional keyword `path:KEYWORD` (default keyword: FUZZ), use `-w users.txt:USER -w pass.txt:PASS` to fuzz multiple keywords (required unless `--range`, `--charset` or `--mask` is given)')
+parser.add_argument('--mode', action='store', choices=MODES, default='clusterbomb',
+                    help='How to combine multiple wordlists: every combination (clusterbomb) or the same line of each (pitchfork) (default: clusterbomb)')
 parser.add_argument('-e', '--encoding', action='store', default='utf-8',
                     help='Encoding for the wordlist, referring to Python Codecs (default: utf-8)')
 parser.add_argument('-p', '--proc', action='store', type=int,
-                    default=100, help='Number of concurrent processes (default: 100)')
+                    help='Number of concurrent processes (default: 100, or one per CPU core with `--hybrid`)')
+parser.add_argument('--hybrid', action='store_true',
+                    help='Run an asyncio event loop in each process, each fuzzing its own part of the wordlist (requires aiohttp)')
+parser.add_argument('-c', '--concurrency', action='store', type=int, default=100,
+                    help='Number of in-flight requests per process with `--hybrid` (default: 100)')
+parser.add_argument('--recursion', action='store_true',
+                    help='Fuzz directories found (redirects to a trailing slash, 401 and 403) with the same wordlist, the URL must end with the keyword (default: false)')
+parser.add_argument('--depth', action='store', type=int, default=2,
+                    help='Maximum recursion depth with `--recursion` (default: 2)')
+parser.add_argument('--coordinator', action='store', metavar='[HOST:]PORT',
+                    help='Listen on this address and hand out the wordlist in leases to `--worker` processes, which may run on other hosts; the connection is not authenticated, so only listen on a trusted network')
+parser.add_argument('--worker', action='store', metavar='HOST:PORT',
+                    help='Fuzz the leases of the coordinator at this address with `-p` processes, all other options come from the coordinator')
+parser.add_argument('--lease-size', action='store', type=int, default=5000,
+                    help='Number of payloads per lease with `--coordinator` (default: 5000)')
+parser.add_argument('--probe', action='store', choices=PROBES,
+                    help='Only download the bodies the match and filter options need: send HEAD first and GET only those (head), or read at most `--probe-size` bytes of the others (get); responses matched on status alone are shown with the size announced by Content-Length (default: off)')
+parser.add_argument('--probe-size', action='store', type=int, default=PROBE_SIZE,
+                    help='Bytes of a body read with `--probe get`, a body ending within them is measured in full (default: 65536)')
+parser.add_argument('--resume', action='store', metavar='STATE_FILE',
+                    help='Save progress to this file and resume from it if it exists')
+parser.add_argument('--retries', action='store', type=int, default=2,
+                    help='Send a payload whose request failed (connection error, timeout) again up to this many times, after a jittered exponential backoff (default: 2)')
+parser.add_argument('--errors', action='store', metavar='ERRORS_FILE',
+                    help='Write the payloads still failing after `--retries` to this file as JSON lines')
+parser.add_argument('--replay', action='store', metavar='ERRORS_FILE',
+                    help='Only send the payloads listed in the errors file of an earlier run with the same wordlists')
+parser.add_argument('--store', action='store', metavar='STORE_FILE',
+                    help='Save the status, size, words, lines and latency of every response to this file in compact columns, to filter, group and diff with `web-fuzzer.py query STORE_FILE`; added to with `--resume`')
+parser.add_argument('--control', action='store', metavar='SOCKET_PATH',
+                    help='Listen for `stats`, `pause`, `resume`, `drain`, `concurrency N` and `rate R|off` on this unix socket while fuzzing, one command per line, each answered with the live statistics as JSON; `drain` lets the requests in flight finish, saves the results and progress and exits')
+parser.add_argument('--adaptive', action='store_true',
+                    help='Adapt the number of in-flight requests to latency, timeouts, 429/503 responses and Retry-After (default: false)')
+parser.add_argument('--rate', action='store', type=float,
+                    help='Maximum requests per second (default: no limit)')
+parser.add_argument('-o', '--output', action='store',
+                    help='Write matched results to this file')
+parser.add_argument('-of', '--output-format', action='store', choices=FORMATS,
+                    help='Output file format (default: csv for a `.csv` file, jsonl otherwise)')
+parser.add_argument('--stats', action='store', metavar='STATS_FILE',
+                    help='Write latency histograms of each request phase to this file as JSON, every 5 seconds and on exit')
+parser.add_argument('--profile', action='store', metavar='PROFILE_FILE',
+                    help='Sample the stacks of the fuzzer itself and write them to this file as collapsed stacks for flame graphs')
 parser.add_argument('-t', '--timeout', action='store', type=float,
                     default=10.0, help='HTTP request timeout in seconds (default: 10.0)')
 http_arg_group = parser.add_argument_group('HTTP arguments')
@@ -26,6 +83,28 @@ http_arg_group.add_argument('-H', '--headers', action='store', nargs='+',
                             help='HTTP headers `"Key: Value"`, use `-H "Key1: Value1" "Key2: Value2" to set multiple headers')
 http_arg_group.add_argument('-r', '--redirect', action='store_true',
                             help='Follow redirects, add `-r` to follow (default: false)')
+generator_arg_group = parser.add_argument_group('Generator arguments')
+generator_arg_group.add_argument('--range', action='append', dest='ranges', metavar='START-END[:FORMAT][:KEYWORD]',
+                                 help='Numbers from START to END inclusive, formatted with a Python format spec, use `--range 0-999999:06d` for zero-padded IDs or `--range 1-100::ID` to set a keyword')
+generator_arg_group.add_argument('--charset', action='append', dest='charsets', metavar='CHARSET[:KEYWORD]',
+                                 help='Every string of `--len` characters from this charset, use `--charset abc0-9` for a, b, c and the digits')
+generator_arg_group.add_argument('--len', action='store', type=parse_bounds, default='1-4', dest='length', metavar='MIN-MAX',
+                                 help='Length of the strings of `--charset` (default: 1-4)')
+generator_arg_group.add_argument('--mask', action='append', dest='masks', metavar='MASK[:KEYWORD]',
+                                 help='Every string matching a mask of ?l (lowercase), ?u (uppercase), ?d (digit), ?h/?H (hex), ?s (symbol), ?a (any of these) and literal characters, use `--mask ?d?d?l?l`')
+mutation_arg_group = parser.add_argument_group('Mutation arguments')
+mutation_arg_group.add_argument('-x', '--extensions', action='store', type=comma_list,
+                                help='Also try each word with these extensions, use `-x php,html,bak` to set multiple extensions')
+mutation_arg_group.add_argument('--case', action='store', type=comma_list,
+                                help='Also try each word in these cases: lower, upper, title, use `--case lower,upper` to set multiple cases')
+mutation_arg_group.add_argument('--prefix', action='store', type=comma_list,
+                                help='Also try each word with these prefixes, use `--prefix .,_` to set multiple prefixes')
+mutation_arg_group.add_argument('--suffix', action='store', type=comma_list,
+                                help='Also try each word with these suffixes, use `--suffix ~,.old` to set multiple suffixes')
+mutation_arg_group.add_argument('--encode', action='store', type=comma_list,
+                                help='Also try each variant encoded with these: url, double (URL-encoded twice), base64')
+mutation_arg_group.add_argument('--dedup', action='store_true',
+                                help='Skip payloads already sent, keeping a hashed set of them (default: false)')
 match_arg_group = parser.add_argument_group('Match arguments')
 match_arg_group.add_argument('-mc', action='store', nargs='+', default=[200, 204, 301, 302, 307, 401, 403, 405, 500],
                              help='Match status codes, use `-mc 200 403 404` to match multiple codes, or use `-mc all` for all codes (default: 200,204,301,302,307,401,403,405,500)')
@@ -35,9 +114,67 @@ match_arg_group.add_argument('-mw', action='store', nargs='+', type=int,
                              help='Match the number of words in response, use `-mw 100 305` to match multiple number of words')
 match_arg_group.add_argument('-ml', action='store', nargs='+', type=int,
                              help='Match the number of lines in response, use `-ml 200 305` to match multiple number of lines')
+match_arg_group.add_argument('-mr', action='store', nargs='+',
+                             help='Match a regex in response headers or content, use `-mr "SQL syntax" "root:.*:0:0"` to match multiple regexes')
+match_arg_group.add_argument('--signatures', action='store', metavar='SIGNATURES_FILE',
+                             help='Match the regexes of this file, one per line as `NAME<TAB>REGEX` or `REGEX`, and show the names found; all of them are looked for in one pass')
+match_arg_group.add_argument('--extract', action='append', metavar='REGEX',
+                             help='Show the named groups of this regex found in matched responses and add them to the JSONL output, use `--extract "version (?P<version>[0-9.]+)"`')
+filter_arg_group = parser.add_argument_group('Filter arguments')
+filter_arg_group.add_argument('-fc', action='store', nargs='+', type=int,
+                              help='Filter out status codes, use `-fc 404 500` to filter multiple codes')
+filter_arg_group.add_argument('-fs', action='store', nargs='+', type=int,
+                              help='Filter out the size of response content, use `-fs 200 305` to filter multiple size')
+filter_arg_group.add_argument('-fw', action='store', nargs='+', type=int,
+                              help='Filter out the number of words in response, use `-fw 100 305` to filter multiple number of words')
+filter_arg_group.add_argument('-fl', action='store', nargs='+', type=int,
+                              help='Filter out the number of lines in response, use `-fl 200 305` to filter multiple number of lines')
+filter_arg_group.add_argument('-fr', action='store', nargs='+',
+                              help='Filter out a regex in response headers or content, use `-fr "Not Found" "Access denied"` to filter multiple regexes')
+filter_arg_group.add_argument('-ac', action='store_true',
+                              help='Auto-calibrate: send a few random requests first and filter out responses that look like them (default: false)')
 
 if __name__ == '__main__':
-    args = parser.parse_args()
+    if sys.argv[1:2] == ['query']:
+        from common.query import main
+        main(sys.argv[2:])
+        parser.exit()
+    args = vars(parser.parse_args())
+    if args['worker']:
+        from distributed import run_worker, parse_address
+        run_worker(parse_address(args['worker']), args['proc'] or 100)
+        parser.exit()
+    if not (args['url'] or args['targets']):
+        parser.error('one of -u/--url or -U/--targets is required')
+    if args['targets'] and (args['recursion'] or args['ac']):
+        parser.error('-U cannot be combined with --recursion or -ac')
+    if not (args['wordlist'] or args['ranges'] or args['charsets'] or args['masks']):
+        parser.error('one of -w, --range, --charset or --mask is required')
+    if args['probe'] == 'head' and (args['data'] or args['method'] != 'GET'):
+        parser.error('--probe head only applies to GET requests')
+    if args['replay'] and args['resume']:
+        parser.error('--replay cannot be combined with --resume')
+    if args['recursion'] and (args['hybrid'] or args['resume']):
+        parser.error('--recursion cannot be combined with --hybrid or --resume')
+    if args['coordinator'] and (args['hybrid'] or args['recursion'] or args['stats']):
+        parser.error('--coordinator cannot be combined with --hybrid, --recursion or --stats')
+    if args['coordinator'] and args['control']:
+        parser.error('--control cannot be combined with --coordinator')
 
-    fuzzer = Fuzzer(**vars(args))
+    args.pop('worker')
+    coordinator = args.pop('coordinator')
+    lease_size = args.pop('lease_size')
+    if coordinator:
+        from distributed import Coordinator, parse_address
+        args.pop('hybrid')
+        args.pop('concurrency')
+        fuzzer = Coordinator(parse_address(coordinator), lease_size, **args)
+    elif args.pop('hybrid'):
+        from hybrid import HybridFuzzer
+        fuzzer = HybridFuzzer(**args)
+    else:
+        args.pop('concurrency')
+        if args['proc'] is None:
+            args['proc'] = 100
+        fuzzer = Fuzzer(**args)
     fuzzer.fuzz()
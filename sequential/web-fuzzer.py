@@ -1,18 +1,59 @@
 #!/usr/bin/env python3
 import requests as rq
-from time import perf_counter
+from requests.adapters import HTTPAdapter
+from time import perf_counter, sleep
 import argparse
-from copy import deepcopy
-from re import split
+import os
+import sys
+from functools import partial
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.template import RequestTemplate
+from common.metrics import Metrics, CHUNK_SIZE, PROBES, PROBE_SIZE, HEAD_UNSUPPORTED, measure, content_length
+from common.wordlist import Progress
+from common.payloads import Payloads, MODES, parse_sources, parse_wordlist_arg
+from common.mutations import Mutator, comma_list
+from common.generators import parse_bounds
+from common.output import FORMATS, Console, open_writer, format_result, format_error, format_bytes
+from common.stats import Stats, Sampler, new_timings, PROCESS, TOTAL
+from common.retry import RetryQueue, ErrorWriter, load_errors, describe
+from common.targets import TARGET_KEYWORD, cache_dns
+from common.store import ResultStore, scan_meta
 
 parser = argparse.ArgumentParser(description='A simple sequential Web Fuzzer.\
-        Use keyword `FUZZ` in URL `-u`, post data `-d`, or header `-H` to define the fuzzing point.')
+        Use keyword `FUZZ` in URL `-u`, post data `-d`, header `-H`, or cookie `-b` to define the fuzzing point.\
+        Run `web-fuzzer.py query STORE_FILE` to explore the results saved with `--store`.')
 parser.add_argument('-u', '--url', action='store',
-                    required=True, help='Target URL (required)')
-parser.add_argument('-w', '--wordlist', action='store',
-                    required=True, help='Wordlist file path (required)')
+                    help='Target URL (required unless `-U` is given)')
+parser.add_argument('-U', '--targets', action='store', metavar='TARGETS_FILE',
+                    help='Fuzz every base URL of this file, one per line, taking turns; each fills the keyword `TARGET` (or `path:KEYWORD`), and `-u` defaults to `TARGET/FUZZ`')
+parser.add_argument('-w', '--wordlist', action='append',
+                    help='Wordlist file path and optional keyword `path:KEYWORD` (default keyword: FUZZ), use `-w users.txt:USER -w pass.txt:PASS` to fuzz multiple keywords (required unless `--range`, `--charset` or `--mask` is given)')
+parser.add_argument('--mode', action='store', choices=MODES, default='clusterbomb',
+                    help='How to combine multiple wordlists: every combination (clusterbomb) or the same line of each (pitchfork) (default: clusterbomb)')
 parser.add_argument('-e', '--encoding', action='store', default='utf-8',
                     help='Encoding for the wordlist, referring to Python Codecs (default: utf-8)')
+parser.add_argument('--probe', action='store', choices=PROBES,
+                    help='Download as little of the bodies as possible: send HEAD instead of GET (head), or read at most `--probe-size` bytes of each body (get); responses are shown with the size announced by Content-Length and no word or line counts, unless their body ends within `--probe-size` bytes (default: off)')
+parser.add_argument('--probe-size', action='store', type=int, default=PROBE_SIZE,
+                    help='Bytes of a body read with `--probe get`, a body ending within them is measured in full (default: 65536)')
+parser.add_argument('--resume', action='store', metavar='STATE_FILE',
+                    help='Save progress to this file and resume from it if it exists')
+parser.add_argument('--retries', action='store', type=int, default=2,
+                    help='Send a payload whose request failed (connection error, timeout) again up to this many times, after a jittered exponential backoff (default: 2)')
+parser.add_argument('--errors', action='store', metavar='ERRORS_FILE',
+                    help='Write the payloads still failing after `--retries` to this file as JSON lines')
+parser.add_argument('--replay', action='store', metavar='ERRORS_FILE',
+                    help='Only send the payloads listed in the errors file of an earlier run with the same wordlists')
+parser.add_argument('--store', action='store', metavar='STORE_FILE',
+                    help='Save the status, size, words, lines and latency of every response to this file in compact columns, to filter, group and diff with `web-fuzzer.py query STORE_FILE`; added to with `--resume`')
+parser.add_argument('-o', '--output', action='store',
+                    help='Write results to this file')
+parser.add_argument('-of', '--output-format', action='store', choices=FORMATS,
+                    help='Output file format (default: csv for a `.csv` file, jsonl otherwise)')
+parser.add_argument('--stats', action='store', metavar='STATS_FILE',
+                    help='Write latency histograms of each request phase to this file as JSON, every 5 seconds and on exit')
+parser.add_argument('--profile', action='store', metavar='PROFILE_FILE',
+                    help='Sample the stacks of the fuzzer itself and write them to this file as collapsed stacks for flame graphs')
 parser.add_argument('-t', '--timeout', action='store', type=float,
                     default=10.0, help='HTTP request timeout in seconds (default: 10.0)')
 http_arg_group = parser.add_argument_group('HTTP arguments')
@@ -26,27 +67,44 @@ http_arg_group.add_argument('-H', '--headers', action='store', nargs='+',
                             help='HTTP headers `"Key: Value"`, use `-H "Key1: Value1" "Key2: Value2" to set multiple headers')
 http_arg_group.add_argument('-r', '--redirect', action='store_true',
                             help='Follow redirects, add `-r` to follow (default: false)')
+generator_arg_group = parser.add_argument_group('Generator arguments')
+generator_arg_group.add_argument('--range', action='append', dest='ranges', metavar='START-END[:FORMAT][:KEYWORD]',
+                                 help='Numbers from START to END inclusive, formatted with a Python format spec, use `--range 0-999999:06d` for zero-padded IDs or `--range 1-100::ID` to set a keyword')
+generator_arg_group.add_argument('--charset', action='append', dest='charsets', metavar='CHARSET[:KEYWORD]',
+                                 help='Every string of `--len` characters from this charset, use `--charset abc0-9` for a, b, c and the digits')
+generator_arg_group.add_argument('--len', action='store', type=parse_bounds, default='1-4', dest='length', metavar='MIN-MAX',
+                                 help='Length of the strings of `--charset` (default: 1-4)')
+generator_arg_group.add_argument('--mask', action='append', dest='masks', metavar='MASK[:KEYWORD]',
+                                 help='Every string matching a mask of ?l (lowercase), ?u (uppercase), ?d (digit), ?h/?H (hex), ?s (symbol), ?a (any of these) and literal characters, use `--mask ?d?d?l?l`')
+mutation_arg_group = parser.add_argument_group('Mutation arguments')
+mutation_arg_group.add_argument('-x', '--extensions', action='store', type=comma_list,
+                                help='Also try each word with these extensions, use `-x php,html,bak` to set multiple extensions')
+mutation_arg_group.add_argument('--case', action='store', type=comma_list,
+                                help='Also try each word in these cases: lower, upper, title, use `--case lower,upper` to set multiple cases')
+mutation_arg_group.add_argument('--prefix', action='store', type=comma_list,
+                                help='Also try each word with these prefixes, use `--prefix .,_` to set multiple prefixes')
+mutation_arg_group.add_argument('--suffix', action='store', type=comma_list,
+                                help='Also try each word with these suffixes, use `--suffix ~,.old` to set multiple suffixes')
+mutation_arg_group.add_argument('--encode', action='store', type=comma_list,
+                                help='Also try each variant encoded with these: url, double (URL-encoded twice), base64')
+mutation_arg_group.add_argument('--dedup', action='store_true',
+                                help='Skip payloads already sent, keeping a hashed set of them (default: false)')
 
 keyword = 'FUZZ'
-batch_size = 256
 total_req = 0
 success_req = 0
 error_req = 0
+saved_bytes = 0  # of the bodies not downloaded, as announced
 t0 = None
-
-
-def get_fuzz_func(keyword, url, data, headers):
-    if keyword in url:
-        return fuzz_URL
-    elif data and keyword in data:
-        return fuzz_data
-    elif headers and any(keyword in key for key in headers.keys()):
-        return fuzz_header_key
-    elif headers and any(keyword in val for val in headers.values()):
-        return fuzz_header_value
-    else:
-        raise KeyError(
-            f'keyword {keyword} not found in URL, post data, and headers')
+console = None
+writer = None
+errors = None
+store = None
+retry = None
+stats = None
+adapter = None
+probe = None
+probe_size = PROBE_SIZE
 
 
 def _get_method(method, data):
@@ -77,107 +135,190 @@ def _get_dict_cookies(cookies):
     return ret
 
 
-def _build_request(method, url, headers, data, cookies):
+def _build_request(keywords, method, url, headers, data, cookies):
     method = _get_method(method, data)
     headers = _get_dict_headers(headers)
     cookies = _get_dict_cookies(cookies)
-    base_req = rq.Request(
-        method, url, headers, data=data, cookies=cookies)
-    return base_req
-
-
-def fuzz_URL(s, keyword, base_req, words, timeout, redirect):
-    for i, word in enumerate(words):
-        req = deepcopy(base_req)
-        req.url = req.url.replace(keyword, word)
-        req = req.prepare()
-
-        res = s.send(req, timeout=timeout, allow_redirects=redirect)
-        print_res(res, word)
-
-
-def fuzz_data(s, keyword, base_req, words, timeout, redirect):
-    for i, word in enumerate(words):
-        req = deepcopy(base_req)
-        req.data = req.data.replace(keyword, word)
-        req = req.prepare()
-
-        res = s.send(req, timeout=timeout, allow_redirects=redirect)
-        print_res(res, word)
-
-
-def fuzz_header_key(s, keyword, base_req, words, timeout, redirect):
-    key_to_replace = []
-    for key in base_req.headers.keys():
-        if keyword in key:
-            key_to_replace.append(key)
-    for i, word in enumerate(words):
-        req = deepcopy(base_req)
-        for key in key_to_replace:
-            req.headers[key.replace(keyword, word)
-                        ] = req.headers.pop(key)
-        req = req.prepare()
-        res = s.send(req, timeout=timeout, allow_redirects=redirect)
-        print_res(res, word)
-
-
-def fuzz_header_value(s, keyword, base_req, words, timeout, redirect):
-    for i, word in enumerate(words):
-        req = deepcopy(base_req)
-        for key in req.headers.keys():
-            req.headers[key] = req.headers[key].replace(keyword, word)
-        req = req.prepare()
-        res = s.send(req, timeout=timeout, allow_redirects=redirect)
-        print_res(res, word)
-
-
-def print_res(r, fuzz):
+    return RequestTemplate(keywords, method, url, headers, data, cookies)
+
+
+def skip(progress, i):
+    # a duplicate payload is never sent
+    global total_req
+    total_req -= 1
+    progress.complete(i)
+
+
+def fuzz(s, template, payloads, progress, timeout, redirect):
+    for item in payloads.words(*progress.pending(), duplicate=partial(skip, progress)):
+        send(s, template, payloads, progress, timeout, redirect, item)
+        for retried in retry.due():
+            send(s, template, payloads, progress, timeout, redirect, retried)
+    # the payloads still waiting for a retry
+    while len(retry):
+        sleep(retry.wait_time())
+        for item in retry.due():
+            send(s, template, payloads, progress, timeout, redirect, item)
+
+
+def send(s, template, payloads, progress, timeout, redirect, item):
+    i, words = item
+    req = template.render(words)
+    try:
+        if stats is None:
+            res = request(s, req, timeout, redirect)
+            print_res(res, i, payloads.label(words))
+        else:
+            timings = adapter.timings = new_timings()
+            t = perf_counter()
+            res = request(s, req, timeout, redirect)
+            t_read = body_read(timings, t, res.elapsed.total_seconds())
+            print_res(res, i, payloads.label(words))
+            timings[PROCESS] = perf_counter() - t_read
+            timings[TOTAL] = perf_counter() - t
+            stats.record(timings)
+    except rq.RequestException as e:
+        fail(progress, item, payloads.label(words), e)
+        return
+    retry.done(item)
+    progress.complete(i)
+
+
+def request(s, req, timeout, redirect):
+    '''Send `req`, as HEAD if it will do with `--probe head`.'''
+    if probe == 'head':
+        res = s.send(rq.Request(**dict(req, method='HEAD')).prepare(),
+                     timeout=timeout, allow_redirects=redirect)
+        if res.status_code not in HEAD_UNSUPPORTED:
+            return res
+    return s.send(rq.Request(**req).prepare(), timeout=timeout,
+                  allow_redirects=redirect, stream=probe is not None)
+
+
+def probe_body(r):
+    '''The size, words and lines of a response with `--probe`: those of its
+    body if it ends within `--probe-size` bytes, else the announced size.'''
+    global saved_bytes
+    if r.request.method == 'HEAD':
+        saved_bytes += content_length(r.headers, wire=True) or 0
+        return content_length(r.headers), None, None
+    m = Metrics()
+    for chunk in r.iter_content(CHUNK_SIZE):
+        m.feed(chunk)
+        if m.size > probe_size:
+            saved_bytes += max(0, (content_length(r.headers, wire=True) or 0) - r.raw.tell())
+            r.close()
+            return content_length(r.headers), None, None
+    return tuple(m)
+
+
+def fail(progress, item, label, err):
+    global error_req
+    if retry.push(item):
+        return
+    error_req += 1
+    console.result(format_error(label, describe(err)))
+    if errors:
+        errors.write(item[0], label, describe(err))
+    progress.complete(item[0])
+
+
+def print_res(r, i, fuzz):
     global success_req
-    success_req += 1
-
-    duration = perf_counter() - t0
     status = r.status_code
-    size = len(r.content)
-    word = len(split(r'[^\S\n\t]', r.text))
-    line = len(r.text.split('\n'))
+    latency = r.elapsed.total_seconds()
+    size, word, line = measure(r.content) if probe is None else probe_body(r)
+    success_req += 1
 
-    print(
-        f'\033[1A{fuzz: <60} [Status: {status}, Size: {size}, Word: {word}, Line: {line}]')
-    print_status('\033[1B', duration)
+    console.result(format_result(fuzz, status, size, word, line))
+    if store is not None:
+        store.add(i, status, size, word, line, latency)
+    if writer:
+        writer.write({'fuzz': fuzz, 'status': status,
+                      'size': size, 'words': word, 'lines': line, 'latency': latency})
 
 
-def print_status(prefix, duration):
+def status_line():
+    duration = perf_counter() - t0
     rate = 0.
     if success_req != 0:
         rate = success_req / duration
 
-    msg = prefix
-    msg += f'====== Duration: {duration:.4f} sec, Rate: {rate:.4f} req/sec, Success: {success_req}, Error: {error_req}, Total: {success_req+error_req}/{total_req} ======'
-    print(msg)
+    saved = f', Saved: {format_bytes(saved_bytes)}' if probe else ''
+    return f'====== Duration: {duration:.4f} sec, Rate: {rate:.4f} req/sec, Success: {success_req}, Error: {error_req}, Total: {success_req+error_req}/{total_req}{saved} ======'
 
 
 if __name__ == '__main__':
+    if sys.argv[1:2] == ['query']:
+        from common.query import main
+        main(sys.argv[2:])
+        parser.exit()
     args = parser.parse_args()
-
-    session = rq.sessions.Session()
-
-    headers = _get_dict_headers(args.headers)
-    fuzz_func = get_fuzz_func(keyword, args.url, args.data, headers)
-    base_req = _build_request(args.method, args.url,
+    if not (args.url or args.targets):
+        parser.error('one of -u/--url or -U/--targets is required')
+    if not (args.wordlist or args.ranges or args.charsets or args.masks):
+        parser.error('one of -w, --range, --charset or --mask is required')
+    if args.probe == 'head' and (args.data or args.method != 'GET'):
+        parser.error('--probe head only applies to GET requests')
+    if args.replay and args.resume:
+        parser.error('--replay cannot be combined with --resume')
+
+    # consecutive payloads go to different targets, which takes turns
+    targets = parse_wordlist_arg(args.targets, TARGET_KEYWORD) if args.targets else None
+    url = args.url or (targets and f'{targets[1]}/{keyword}')
+    mutator = Mutator(args.extensions, args.case, args.prefix, args.suffix, args.encode)
+    sources = parse_sources(args.wordlist, args.ranges, args.charsets, args.length, args.masks, keyword)
+    payloads = Payloads.open(sources, args.encoding, args.mode, mutator, args.dedup, targets)
+    template = _build_request(payloads.keywords, args.method, url,
                               args.headers, args.data, args.cookies)
 
-    print('')  # allocate 1 line for printing
+    session = rq.sessions.Session()
+    pools = {}
+    if targets:
+        # keep a connection open to every target, each resolved once
+        cache_dns()
+        pools['pool_connections'] = len(payloads.targets)
+    if args.stats:
+        from common.tracing import TimedAdapter, body_read
+        adapter = TimedAdapter(**pools)
+        stats = Stats(args.stats)
+    elif pools:
+        adapter = HTTPAdapter(**pools)
+    if adapter:
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    sampler = Sampler(args.profile).start() if args.profile else None
+
+    progress = Progress(args.resume, payloads)
+    if args.replay:
+        progress.only(load_errors(args.replay))
+    total_req = len(progress)
+    retry = RetryQueue(args.retries)
+    probe, probe_size = args.probe, args.probe_size
+
+    console = Console(status_line)
+    writer = open_writer(args.output, args.output_format)
+    if args.errors:
+        errors = ErrorWriter(args.errors)
+    if args.store:
+        store = ResultStore.open(args.store, scan_meta(
+            url, _get_method(args.method, args.data), sources, args.encoding, args.mode, mutator,
+            targets, payloads), resume=bool(args.resume))
     t0 = perf_counter()
-    words = []
-    with open(args.wordlist, 'r', encoding=args.encoding) as wordlist:
-        for i, word in enumerate(wordlist):
-            words.append(word[:-1])  # [:-1] remove newline
-            total_req += 1
-            if i % batch_size == batch_size - 1:
-                fuzz_func(session, keyword, base_req, words,
-                          args.timeout, args.redirect)
-                words = []
-        fuzz_func(session, keyword, base_req,
-                  words, args.timeout, args.redirect)
-
-    session.close()
+    try:
+        fuzz(session, template, payloads, progress,
+             args.timeout, args.redirect)
+    finally:
+        progress.save()
+        session.close()
+        console.close()
+        if writer:
+            writer.close()
+        if errors:
+            errors.close()
+        if store is not None:
+            store.save()
+        if stats:
+            stats.dump()
+        if sampler:
+            sampler.stop()
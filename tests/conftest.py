@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the engines import common as a package and their own modules by name
+for path in (ROOT, os.path.join(ROOT, 'async'), os.path.join(ROOT, 'multi-processing')):
+    sys.path.insert(0, path)
@@ -0,0 +1,128 @@
+import socket
+import threading
+from collections import deque
+import pytest
+from common.generators import NumberRange
+from common.wordlist import Progress
+from distributed import Channel, Coordinator, Lease, parse_address
+
+
+class _Console:
+    def __init__(self):
+        self.lines = []
+
+    def result(self, line):
+        self.lines.append(line)
+
+    def update(self):
+        pass
+
+
+@pytest.fixture
+def coordinator():
+    words = NumberRange(0, 11)
+    coord = Coordinator.__new__(Coordinator)
+    coord.config = {}
+    coord.store_path = None
+    coord.store = None
+    coord.payloads = words
+    coord.progress = Progress(None, words)
+    coord.console = _Console()
+    coord.lease_size = 5
+    coord.pending = deque(coord._split(*coord.progress.pending()))
+    coord.active = coord.workers = 0
+    coord.success_req = coord.error_req = coord.saved_bytes = 0
+    coord.total_req = len(words)
+    coord.lock = threading.Lock()
+    coord.finished = threading.Event()
+    return coord
+
+
+class _Worker:
+    '''A worker's end of a connection served by the coordinator.'''
+
+    def __init__(self, coord, name):
+        ours, theirs = socket.socketpair()
+        self.thread = threading.Thread(target=coord._serve, args=(theirs, (name, 1)), daemon=True)
+        self.thread.start()
+        self.channel = Channel(ours)
+        self.channel.send({'type': 'hello'})
+        assert self.channel.recv()['type'] == 'config'
+        self.channel.send({'type': 'ready', 'words': len(coord.payloads)})
+
+    def lease(self):
+        self.channel.send({'type': 'lease'})
+        return self.channel.recv()
+
+    def complete(self, *ranges):
+        self.channel.send({'type': 'results', 'completed': ranges, 'success': sum(e - s for s, e in ranges),
+                           'error': 0, 'saved': 0, 'skipped': 0, 'matched': [], 'failed': []})
+
+    def leave(self):
+        self.channel.close()
+        self.thread.join(5)
+        assert not self.thread.is_alive()
+
+
+def test_split_keeps_done_indexes():
+    coord = Coordinator.__new__(Coordinator)
+    coord.lease_size = 4
+    leases = list(coord._split([(2, 7), (9, 11)], {3, 10}))
+    assert [(l.id, l.ranges, l.done, l.left) for l in leases] == [
+        (0, [[2, 6]], {3}, 3), (1, [[6, 7]], set(), 1), (2, [[9, 11]], {10}, 1)]
+
+
+def test_lease_complete_counts_once():
+    lease = Lease(0, [[0, 3]], {1})
+    assert 2 in lease and 3 not in lease
+    assert lease.complete(0) and not lease.complete(0) and not lease.complete(1)
+    assert lease.left == 1
+
+
+def test_lost_lease_is_handed_out_again(coordinator):
+    first = _Worker(coordinator, 'first')
+    assert first.lease() == {'type': 'lease', 'id': 0, 'ranges': [[0, 5]], 'done': []}
+    first.complete([0, 3])
+    first.leave()
+    assert coordinator.workers == coordinator.active == 0
+    assert coordinator.console.lines == ['Worker first:1 lost, handing out its 2 payloads again']
+
+    second = _Worker(coordinator, 'second')
+    # the lost lease comes first, minus what was completed
+    assert second.lease() == {'type': 'lease', 'id': 0, 'ranges': [[0, 5]], 'done': [0, 1, 2]}
+    assert second.lease()['id'] == 1
+    assert second.lease()['id'] == 2
+    second.complete([3, 12])
+    assert second.lease() == {'type': 'end'}
+    second.leave()
+    assert coordinator.finished.is_set()
+    assert coordinator.success_req == 12
+    assert coordinator.progress.pending() == ([], set())
+
+
+def test_worker_waits_for_leases_out_elsewhere(coordinator):
+    first, second = _Worker(coordinator, 'first'), _Worker(coordinator, 'second')
+    assert [first.lease()['id'] for _ in range(3)] == [0, 1, 2]
+    assert second.lease() == {'type': 'wait'}
+    first.leave()
+    assert second.lease()['id'] in (0, 1, 2)
+    second.leave()
+
+
+def test_worker_with_other_wordlists_is_rejected(coordinator):
+    ours, theirs = socket.socketpair()
+    thread = threading.Thread(target=coordinator._serve, args=(theirs, ('other', 1)), daemon=True)
+    thread.start()
+    channel = Channel(ours)
+    channel.send({'type': 'hello'})
+    channel.recv()
+    channel.send({'type': 'ready', 'words': 3})
+    assert channel.recv()['type'] == 'error'
+    thread.join(5)
+    assert coordinator.workers == 0
+
+
+def test_parse_address():
+    assert parse_address('8000') == ('', 8000)
+    assert parse_address('10.0.0.1:8000') == ('10.0.0.1', 8000)
+    assert parse_address('8000', 'localhost') == ('localhost', 8000)
@@ -0,0 +1,163 @@
+import asyncio
+import pytest
+from h2.config import H2Configuration
+from h2.connection import H2Connection
+from h2.errors import ErrorCodes
+from h2.events import DataReceived, RequestReceived, StreamEnded
+from h2.settings import SettingCodes
+from h2http import Http2Client, Http2Connection
+from rawhttp import Unsupported
+
+
+class Server:
+    '''An h2c server answering `/<status>` paths, at most `max_streams`
+    streams at a time, each response after `delay` seconds.'''
+
+    def __init__(self, max_streams=100, delay=0.):
+        self.max_streams = max_streams
+        self.delay = delay
+        self.open = self.most_open = 0
+        self.bodies = []
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', 0)
+        self.origin = '127.0.0.1:%d' % self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+
+    async def serve(self, reader, writer):
+        conn = H2Connection(H2Configuration(client_side=False, header_encoding='utf-8'))
+        conn.initiate_connection()
+        conn.update_settings({SettingCodes.MAX_CONCURRENT_STREAMS: self.max_streams})
+        writer.write(conn.data_to_send())
+        requests = {}
+        while data := await reader.read(65536):
+            for event in conn.receive_data(data):
+                if isinstance(event, RequestReceived):
+                    requests[event.stream_id] = [dict(event.headers), b'']
+                    self.open += 1
+                    self.most_open = max(self.most_open, self.open)
+                elif isinstance(event, DataReceived):
+                    requests[event.stream_id][1] += event.data
+                    conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                elif isinstance(event, StreamEnded):
+                    asyncio.ensure_future(self.respond(conn, writer, event.stream_id, *requests[event.stream_id]))
+            writer.write(conn.data_to_send())
+        writer.close()
+
+    async def respond(self, conn, writer, stream_id, headers, body):
+        await asyncio.sleep(self.delay)
+        self.open -= 1
+        self.bodies.append(body)
+        status = headers[':path'].strip('/')
+        if status == 'reset':
+            conn.reset_stream(stream_id, ErrorCodes.REFUSED_STREAM)
+        elif status == 'gzip':
+            conn.send_headers(stream_id, [(':status', '200'), ('content-encoding', 'gzip')], end_stream=True)
+        else:
+            conn.send_headers(stream_id, [(':status', status), ('server', 'test')])
+            conn.send_data(stream_id, b'one two\n', end_stream=False)
+            conn.send_data(stream_id, b'three\n', end_stream=True)
+        writer.write(conn.data_to_send())
+
+
+def request(origin, path, method='GET'):
+    return [(':method', method), (':scheme', 'http'), (':authority', origin), (':path', path)]
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 10))
+
+
+def test_response_is_counted():
+    async def test():
+        async with Server() as server:
+            conn = Http2Connection(f'http://{server.origin}')
+            await conn.open()
+            r = await conn.request(request(server.origin, '/404'))
+            conn.close()
+            return r
+    r = run(test())
+    assert (r.status, r.size, r.words, r.lines) == (404, 14, 2, 3)
+    assert r.headers == {'server': 'test'}
+
+
+def test_request_body_is_sent():
+    async def test():
+        async with Server() as server:
+            conn = Http2Connection(f'http://{server.origin}')
+            await conn.open()
+            body = b'x' * 100_000  # more than one frame, and than the initial window
+            r = await conn.request(request(server.origin, '/200', 'POST') + [('content-length', str(len(body)))], body)
+            conn.close()
+            return r, server.bodies
+    r, bodies = run(test())
+    assert r.status == 200
+    assert bodies == [b'x' * 100_000]
+
+
+def test_streams_are_capped_by_the_server_setting():
+    async def test():
+        async with Server(max_streams=2, delay=0.02) as server:
+            conn = Http2Connection(f'http://{server.origin}')
+            await conn.open()
+            responses = await asyncio.gather(*(conn.request(request(server.origin, '/200')) for _ in range(7)))
+            conn.close()
+            return responses, server.most_open
+    responses, most_open = run(test())
+    assert [r.status for r in responses] == [200] * 7
+    assert most_open == 2
+
+
+def test_stream_errors():
+    async def test():
+        async with Server() as server:
+            conn = Http2Connection(f'http://{server.origin}')
+            await conn.open()
+            with pytest.raises(ConnectionResetError, match='REFUSED_STREAM'):
+                await conn.request(request(server.origin, '/reset'))
+            with pytest.raises(Unsupported, match='compressed'):
+                await conn.request(request(server.origin, '/gzip'))
+            # the connection is still usable
+            r = await conn.request(request(server.origin, '/200'))
+            conn.close()
+            return r
+    assert run(test()).status == 200
+
+
+def test_cancelled_request_frees_its_stream():
+    async def test():
+        async with Server(max_streams=1, delay=0.5) as server:
+            conn = Http2Connection(f'http://{server.origin}')
+            await conn.open()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(conn.request(request(server.origin, '/200')), 0.05)
+            server.delay = 0.
+            r = await conn.request(request(server.origin, '/200'))
+            conn.close()
+            return r
+    assert run(test()).status == 200
+
+
+def test_http1_server_is_unsupported():
+    async def http1(reader, writer):
+        await reader.read(65536)
+        writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+        writer.close()
+
+    async def test():
+        server = await asyncio.start_server(http1, '127.0.0.1', 0)
+        origin = '127.0.0.1:%d' % server.sockets[0].getsockname()[1]
+        client = Http2Client()
+        try:
+            for _ in range(2):
+                with pytest.raises(Unsupported):
+                    await client.request(request(origin, '/'))
+            # the origin is remembered, and not tried again
+            assert client.unsupported == {('http', origin)}
+        finally:
+            client.close()
+            server.close()
+    run(test())
@@ -0,0 +1,65 @@
+from matcher import Matcher
+
+SIZED = {'Content-Length': '120'}
+UNSIZED = {'Transfer-Encoding': 'chunked'}
+
+
+def test_status_match_needs_the_body_unless_probing():
+    matcher = Matcher(mc=['200'])
+    assert matcher.needs_body(200, SIZED)
+    assert not matcher.needs_body(200, SIZED, probe=True)
+    assert not matcher.needs_body(404, SIZED)
+    assert not matcher.needs_body(404, SIZED, probe=True)
+
+
+def test_size_match_reads_only_unsized_bodies():
+    matcher = Matcher(ms=[120])
+    assert matcher.needs_body(200, SIZED)
+    assert not matcher.needs_body(200, {'Content-Length': '99'})
+    assert matcher.needs_body(200, UNSIZED)
+    assert not matcher.needs_body(200, SIZED, probe=True)
+    # the decoded size of a compressed body is only known once read
+    assert matcher.needs_body(200, {'Content-Length': '120', 'Content-Encoding': 'gzip'})
+
+
+def test_word_and_line_matches_need_the_body():
+    assert Matcher(mw=[10]).needs_body(200, SIZED, probe=True)
+    assert Matcher(ml=[3]).needs_body(200, SIZED, probe=True)
+
+
+def test_filters_that_need_the_body_when_probing():
+    assert Matcher(mc=['all'], fw=[5]).needs_body(200, SIZED, probe=True)
+    assert Matcher(mc=['all'], fl=[5]).needs_body(200, SIZED, probe=True)
+    assert Matcher(mc=['all'], mr=['root:']).needs_body(200, SIZED, probe=True)
+    # a size filter only needs the body when there is no Content-Length
+    assert not Matcher(mc=['all'], fs=[99]).needs_body(200, SIZED, probe=True)
+    assert Matcher(mc=['all'], fs=[99]).needs_body(200, UNSIZED, probe=True)
+
+
+def test_filtered_responses_are_dropped_unread():
+    matcher = Matcher(mc=['all'], fc=[404], fs=[120])
+    assert not matcher.needs_body(404, UNSIZED)
+    assert not matcher.needs_body(200, SIZED)
+    assert matcher.needs_body(200, {'Content-Length': '7'})
+
+
+def test_calibrated_fingerprints():
+    matcher = Matcher(mc=['all'])
+    # junk always gets a 404 of the same size, and 302s of varying sizes
+    matcher.calibrate([(404, 120, 10, 3, 1), (404, 120, 11, 4, 2), (302, 0, 1, 1, 8), (302, 5, 1, 1, 9)])
+    assert not matcher.needs_body(404, SIZED, probe=True)
+    # the 302 fingerprint is in words and lines
+    assert matcher.needs_body(404, UNSIZED, probe=True)
+    assert not matcher.needs_digest
+    assert matcher.is_filtered(404, 120, 50, 9)
+    assert not matcher.is_filtered(404, 121, 10, 3)
+    assert matcher.is_filtered(302, 77, 1, 1)
+    assert matcher.is_match(404, 121, 10, 3)
+
+
+def test_is_match():
+    matcher = Matcher(mc=['200', '301'], mw=[42], fs=[0])
+    assert matcher.is_match(200, 10, 1, 1)
+    assert matcher.is_match(500, 10, 42, 1)
+    assert not matcher.is_match(200, 0, 1, 1)
+    assert not matcher.is_match(404, 10, 1, 1)
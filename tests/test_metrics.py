@@ -0,0 +1,48 @@
+import re
+import pytest
+from common.metrics import CHUNK_SIZE, Metrics, WIDE_SEPARATORS, content_length, measure
+
+
+def expected(content):
+    text = content.decode('utf-8')
+    return len(content), len(re.split(r'[^\S\n\t]', text)), len(text.split('\n'))
+
+
+@pytest.mark.parametrize('content', [
+    b'',
+    b'one',
+    b'lorem ipsum dolor\tsit amet,\r\nconsectetur adipiscing elit\n',
+    b'a\x0bb\x0cc\x1cd\x1de\x1ff  g\n\n',
+    'café naïve 中文'.encode(),
+    ' '.join(sep.decode() for sep in WIDE_SEPARATORS).encode(),
+])
+def test_counts_match_the_regex(content):
+    assert tuple(measure(content)) == expected(content)
+
+
+def test_wide_separators_cut_across_chunks():
+    content = ('x　y z ' * 3).encode()
+    for n in range(1, 8):
+        m = Metrics()
+        for i in range(0, len(content), n):
+            m.feed(content[i:i + n])
+        assert tuple(m) == expected(content)
+
+
+def test_large_body():
+    content = b'word ' * (CHUNK_SIZE // 2)
+    assert tuple(measure(content)) == expected(content)
+
+
+def test_digest():
+    assert measure(b'abc').digest is None
+    assert measure(b'abc', digest=True).digest == measure(b'abc', digest=True).digest != \
+        measure(b'abd', digest=True).digest
+
+
+def test_content_length():
+    assert content_length({'Content-Length': '42'}) == 42
+    assert content_length({'Content-Length': 'x'}) is None
+    assert content_length({}) is None
+    assert content_length({'Content-Length': '42', 'Content-Encoding': 'gzip'}) is None
+    assert content_length({'Content-Length': '42', 'Content-Encoding': 'gzip'}, wire=True) == 42
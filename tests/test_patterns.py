@@ -0,0 +1,54 @@
+import pytest
+from patterns import Patterns, OVERLAP, required_literal, load_signatures
+
+
+def scan(patterns, *chunks, headers=None):
+    s = patterns.scan(headers or {})
+    for chunk in chunks:
+        s.feed(chunk)
+    return s
+
+
+def test_required_literal():
+    assert required_literal('root:.*:0:0') == 'root:'
+    assert required_literal('(admin|user)_panel') == '_panel'
+    assert required_literal('a+b') == 'a'
+
+
+def test_prefilter_is_case_insensitive_like_the_regex():
+    patterns = Patterns(match=['(?i)sql syntax'])
+    assert patterns.by_literal
+    assert scan(patterns, b'You have an error in your SQL Syntax near').matched
+    assert not scan(patterns, b'nothing here').matched
+
+
+def test_non_ascii_literal_matches():
+    patterns = Patterns(match=['Ärger'], filter=['Straße'])
+    assert scan(patterns, 'viel Ärger hier'.encode()).matched
+    assert scan(patterns, 'die STRAßE und die Straße'.encode()).filtered
+    assert not scan(patterns, 'ärger'.encode()).matched
+
+
+def test_match_across_chunks_but_not_from_the_headers():
+    patterns = Patterns(match=['secret-token'])
+    assert scan(patterns, b'x' * 100 + b'secret-', b'token').matched
+    assert not scan(patterns, b'-token', headers={'X-Id': 'secret'}).matched
+    assert scan(patterns, b'', headers={'X-Id': 'secret-token'}).matched
+    assert not scan(patterns, b'secret-', b'x' * OVERLAP, b'token').matched
+
+
+def test_signatures_and_extraction(tmp_path):
+    path = tmp_path / 'signatures.txt'
+    path.write_text('# comment\nphp\tX-Powered-By: PHP/[0-9.]+\n\nnginx/[0-9]+\n')
+    signatures = load_signatures(str(path))
+    assert signatures == [('php', 'X-Powered-By: PHP/[0-9.]+'), ('nginx/[0-9]+', 'nginx/[0-9]+')]
+    patterns = Patterns(signatures=signatures, extract=['version (?P<version>[0-9.]+)'])
+    s = scan(patterns, b'nginx/1 version 2.4', headers={'X-Powered-By': 'PHP/8.1'})
+    assert s.found() == {'signatures': ['nginx/[0-9]+', 'php'], 'extract': {'version': '2.4'}}
+
+
+def test_invalid_regexes():
+    with pytest.raises(ValueError, match='invalid regex'):
+        Patterns(match=['(unclosed'])
+    with pytest.raises(ValueError, match='named group'):
+        Patterns(extract=['version [0-9]+'])
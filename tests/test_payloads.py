@@ -0,0 +1,62 @@
+import pytest
+from common.generators import NumberRange, Charset, Mask, parse_bounds, expand_charset
+from common.payloads import Payloads, parse_range_arg, parse_sources, parse_wordlist_arg
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('1-100', ('1-100', 'FUZZ')),
+    ('0-999:06d', ('0-999:06d', 'FUZZ')),
+    ('0-255:x', ('0-255:x', 'FUZZ')),
+    ('1-100:ID', ('1-100', 'ID')),
+    ('1-100:X', ('1-100', 'X')),
+    ('1-100:E', ('1-100', 'E')),
+    ('1-100:F', ('1-100', 'F')),
+    ('1-100:Id', ('1-100', 'Id')),
+    ('1-100::ID', ('1-100', 'ID')),
+    ('0-255:X:', ('0-255:X', 'FUZZ')),
+    ('0-255:04X:N', ('0-255:04X', 'N')),
+])
+def test_parse_range_arg(spec, expected):
+    assert parse_range_arg(spec, 'FUZZ') == expected
+
+
+def test_range_keyword_is_not_a_format():
+    (kind, spec, keyword), = parse_sources(ranges=['1-3:X'])
+    assert keyword == 'X'
+    assert [NumberRange.parse(spec).word(i) for i in range(3)] == ['1', '2', '3']
+    (kind, spec, keyword), = parse_sources(ranges=['10-12:X:'])
+    assert [NumberRange.parse(spec).word(i) for i in range(3)] == ['A', 'B', 'C']
+
+
+def test_parse_wordlist_arg():
+    assert parse_wordlist_arg('users.txt', 'FUZZ') == ('users.txt', 'FUZZ')
+    assert parse_wordlist_arg('users.txt:USER', 'FUZZ') == ('users.txt', 'USER')
+
+
+def test_bounds():
+    assert parse_bounds('3') == (3, 3)
+    assert parse_bounds('1-4') == (1, 4)
+    for spec in ('4-1', '-1', 'a-b'):
+        with pytest.raises(ValueError, match='invalid bounds'):
+            parse_bounds(spec)
+    assert expand_charset('a-cx0-2a') == 'abcx012'
+
+
+def test_generators_index_their_words():
+    charset = Charset.parse('ab:1-2')
+    assert [charset.word(i) for i in range(len(charset))] == ['a', 'b', 'aa', 'ab', 'ba', 'bb']
+    mask = Mask('?d?l')
+    assert len(mask) == 260
+    assert (mask.word(0), mask.word(27), mask.word(259)) == ('0a', '1b', '9z')
+
+
+def test_clusterbomb_and_pitchfork():
+    users, ids = NumberRange(1, 2), NumberRange(7, 9)
+    clusterbomb = Payloads([users, ids], ['USER', 'ID'])
+    assert list(clusterbomb.words()) == [
+        (0, ('1', '7')), (1, ('1', '8')), (2, ('1', '9')), (3, ('2', '7')), (4, ('2', '8')), (5, ('2', '9'))]
+    assert list(clusterbomb.words([(4, 6)], skip={4})) == [(5, ('2', '9'))]
+    pitchfork = Payloads([users, ids], ['USER', 'ID'], 'pitchfork')
+    assert list(pitchfork.words()) == [(0, ('1', '7')), (1, ('2', '8'))]
+    with pytest.raises(ValueError, match='own keyword'):
+        Payloads([users, ids], ['FUZZ', 'FUZZ'])
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from rawhttp import RawConnection, Unsupported
+
+
+def read(data, responses=1):
+    '''The responses parsed from `data`, as sent by a server that then closes.'''
+    async def run():
+        conn = RawConnection('http://127.0.0.1:8080')
+        conn.reader = asyncio.StreamReader()
+        conn.reader.feed_data(data)
+        conn.reader.feed_eof()
+        return [await conn.read_response() for _ in range(responses)]
+    return asyncio.run(run())
+
+
+def test_pipelined_responses():
+    first, second = read(b'HTTP/1.1 200 OK\r\nContent-Length: 11\r\nServer: x\r\n\r\nhello world'
+                         b'HTTP/1.1 404 Not Found\r\ncontent-length: 6\r\n\r\na\nb c\n', 2)
+    assert (first.status, first.size, first.words, first.lines) == (200, 11, 2, 1)
+    assert first.headers == {'content-length': '11', 'server': 'x'}
+    assert first.keep_alive
+    assert (second.status, second.size, second.words, second.lines) == (404, 6, 2, 3)
+
+
+def test_chunked_body_with_trailers():
+    r, = read(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+              b'5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n')
+    assert (r.size, r.words, r.lines) == (11, 2, 1)
+
+
+def test_interim_responses_are_skipped():
+    r, = read(b'HTTP/1.1 100 Continue\r\n\r\nHTTP/1.1 201 Created\r\nContent-Length: 0\r\n\r\n')
+    assert (r.status, r.size) == (201, 0)
+
+
+def test_no_body_statuses():
+    r, = read(b'HTTP/1.1 304 Not Modified\r\nContent-Length: 100\r\n\r\n')
+    assert (r.status, r.size) == (304, 0)
+
+
+def test_keep_alive():
+    r, = read(b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: 0\r\n\r\n')
+    assert not r.keep_alive
+    r, = read(b'HTTP/1.0 200 OK\r\nConnection: Keep-Alive\r\nContent-Length: 0\r\n\r\n')
+    assert r.keep_alive
+    r, = read(b'HTTP/1.0 200 OK\r\nContent-Length: 0\r\n\r\n')
+    assert not r.keep_alive
+
+
+def test_body_up_to_the_end_of_the_connection():
+    r, = read(b'HTTP/1.1 200 OK\r\n\r\nno framing')
+    assert (r.size, r.words, r.keep_alive) == (10, 2, False)
+
+
+def test_truncated_body():
+    with pytest.raises(asyncio.IncompleteReadError):
+        read(b'HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nshort')
+
+
+@pytest.mark.parametrize('data', [
+    b'HTTP/1.1 200 OK\r\nContent-Encoding: gzip\r\nContent-Length: 0\r\n\r\n',
+    b'HTTP/1.1 101 Switching Protocols\r\nUpgrade: h2c\r\n\r\n',
+    b'\x00\x00\x12\x04\x00\x00\x00\x00\x00\r\n\r\n',
+])
+def test_unsupported(data):
+    with pytest.raises(Unsupported):
+        read(data)
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from common.wordlist import Progress
+from fuzzer import Fuzzer
+from recursion import WorkQueue, is_directory
+
+
+def test_is_directory():
+    assert is_directory('admin', 403, None)
+    assert is_directory('admin', 301, 'http://host/admin/')
+    assert is_directory('admin', 302, '/base/admin/?next=1')
+    assert not is_directory('admin', 301, 'http://host/login')
+    assert not is_directory('admin', 302, None)
+    assert not is_directory('admin', 200, None)
+
+
+def test_shallowest_first():
+    jobs = WorkQueue()
+    jobs.push(2, 'a/b/')
+    jobs.push(1, 'c/')
+    jobs.push(1, 'd/')
+    assert jobs.waiting() == 3
+    assert [jobs.pop() for _ in range(4)] == [(1, 'c/'), (1, 'd/'), (2, 'a/b/'), None]
+
+
+def test_pop_waits_for_requests_in_flight():
+    jobs = WorkQueue()
+    jobs.sent()
+    jobs.sent()
+    with ThreadPoolExecutor(1) as pool:
+        popped = pool.submit(jobs.pop)
+        jobs.done()
+        assert not popped.done()
+        # the last request in flight finds a directory before it is done
+        jobs.push(1, 'admin/')
+        assert popped.result(timeout=5) == (1, 'admin/')
+        popped = pool.submit(jobs.pop)
+        jobs.done()
+        assert popped.result(timeout=5) is None
+
+
+class _Progress(Progress):
+    def __init__(self):
+        self.completed = []
+
+    def complete(self, i):
+        self.completed.append(i)
+
+
+def test_skipped_payload_is_not_in_flight():
+    fuzzer = Fuzzer.__new__(Fuzzer)
+    fuzzer.total_req = 10
+    fuzzer.progress = _Progress()
+    fuzzer.jobs = WorkQueue()
+    fuzzer.jobs.sent()
+    fuzzer._skip(3, depth=1)
+    fuzzer._skip(4)
+    assert fuzzer.total_req == 8
+    assert fuzzer.progress.completed == [4]
+    # the request sent is still in flight, so pop() keeps waiting for it
+    popped = threading.Thread(target=fuzzer.jobs.pop, daemon=True)
+    popped.start()
+    popped.join(0.1)
+    assert popped.is_alive()
+    fuzzer.jobs.done()
+    popped.join(5)
+    assert not popped.is_alive()
@@ -0,0 +1,96 @@
+import asyncio
+import pytest
+from common import retry as retry_module
+from common.retry import RetryQueue, ErrorWriter, backoff, drain_retries, load_errors, BACKOFF_MAX
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''A clock moved by hand, with the longest backoff every time.'''
+    now = [100.]
+    monkeypatch.setattr(retry_module, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(retry_module.random, 'uniform', lambda low, high: high)
+    return now
+
+
+def test_backoff_doubles_up_to_the_cap(clock):
+    assert [backoff(n) for n in range(1, 9)] == [0.5, 1., 2., 4., 8., 16., BACKOFF_MAX, BACKOFF_MAX]
+    assert backoff(3, base=1., cap=3.) == 3.
+
+
+def test_backoff_is_jittered():
+    waits = [backoff(4) for _ in range(200)]
+    assert all(0 <= w <= 4. for w in waits)
+    assert len(set(waits)) > 1
+
+
+def test_retries_run_out(clock):
+    retry = RetryQueue(2)
+    assert retry.push('a') and retry.push('a')
+    assert not retry.push('a')
+    # a payload that ran out starts over if it fails again later
+    assert retry.push('a')
+    assert len(retry) == 3
+
+
+def test_done_forgets_the_retries(clock):
+    retry = RetryQueue(1)
+    assert retry.push('a')
+    retry.done('a')
+    assert retry.push('a')
+
+
+def test_due_in_time_order(clock):
+    retry = RetryQueue(3)
+    retry.push('a')
+    retry.push('a')  # second retry, 1s
+    retry.push('b')  # first retry, 0.5s
+    assert retry.wait_time() == 0.5
+    assert retry.due() == []
+    clock[0] += 0.5
+    assert retry.due() == ['a', 'b']
+    assert retry.wait_time() == 0.5
+    clock[0] += 5
+    assert retry.due() == ['a']
+    assert retry.wait_time() is None
+
+
+def test_drain_retries_until_everything_went_through(monkeypatch):
+    monkeypatch.setattr(retry_module, 'backoff', lambda attempt: 0.01)
+
+    async def run():
+        retry = RetryQueue(5)
+        queue = asyncio.Queue()
+        sent = []
+
+        async def consume():
+            while True:
+                item = await queue.get()
+                sent.append(item)
+                # each payload fails twice before it goes through
+                if sent.count(item) < 3:
+                    retry.push(item)
+                else:
+                    retry.done(item)
+                queue.task_done()
+
+        consumer = asyncio.create_task(consume())
+        for item in 'ab':
+            await queue.put(item)
+        await drain_retries(retry, queue)
+        consumer.cancel()
+        return sent, retry
+    sent, retry = asyncio.run(asyncio.wait_for(run(), 10))
+    assert sorted(sent) == ['a'] * 3 + ['b'] * 3
+    assert not len(retry)
+
+
+def test_errors_file_round_trip(tmp_path):
+    path = str(tmp_path / 'errors.jsonl')
+    writer = ErrorWriter(path)
+    writer.write(7, 'admin', 'timeout')
+    writer.write(None, 'admin/x', 'reset')
+    writer.write(2, 'index', 'reset')
+    writer.write(7, 'admin', 'timeout')
+    writer.close()
+    assert load_errors(path) == [2, 7]
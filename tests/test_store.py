@@ -0,0 +1,58 @@
+import math
+import pytest
+from common.store import ResultStore
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / 'scan.store')
+    store = ResultStore(path, {'url': 'http://host/FUZZ', 'payloads': 3})
+    store.add(0, 200, 1024, 150, 17, 0.25)
+    store.add(2, 404, None, None, None, None)
+    store.add(None, 301, 0, 1, 1, 0.5)  # a recursion pass
+    store.save()
+    loaded = ResultStore.load(path)
+    assert loaded.meta == {'url': 'http://host/FUZZ', 'payloads': 3}
+    assert len(loaded) == 3
+    assert loaded.row(0) == (0, 200, 1024, 150, 17, 0.25)
+    assert loaded.row(1) == (2, 404, None, None, None, None)
+    assert loaded.row(2) == (None, 301, 0, 1, 1, 0.5)
+
+
+def test_partial_rows_are_not_saved(tmp_path):
+    store = ResultStore(str(tmp_path / 'scan.store'))
+    store.add(0, 200, 1, 1, 1, 0.1)
+    store.columns['index'].append(1)  # a row being added by another thread
+    store.save()
+    assert len(ResultStore.load(store.path)) == 1
+
+
+def test_resume_keeps_the_results(tmp_path):
+    path = str(tmp_path / 'scan.store')
+    first = ResultStore.open(path, {'run': 1})
+    first.add(0, 200, 1, 1, 1, 0.1)
+    first.save()
+    resumed = ResultStore.open(path, {'run': 2}, resume=True)
+    resumed.add(1, 404, 2, 2, 2, 0.2)
+    assert (resumed.meta, len(resumed)) == ({'run': 2}, 2)
+    assert len(ResultStore.open(path, {'run': 3})) == 0
+
+
+def test_take_and_extend():
+    worker = ResultStore()
+    worker.add(5, 500, 10, 2, 1, 1.5)
+    worker.add(6, 200, None, None, None, None)
+    data = worker.take()
+    assert len(worker) == 0
+    coordinator = ResultStore()
+    coordinator.add(4, 200, 1, 1, 1, 0.5)
+    coordinator.extend(data)
+    assert coordinator.row(1) == (5, 500, 10, 2, 1, 1.5)
+    assert coordinator.row(2) == (6, 200, None, None, None, None)
+    assert math.isnan(coordinator.columns['latency'][2])
+
+
+def test_not_a_store(tmp_path):
+    path = tmp_path / 'results.json'
+    path.write_text('{}')
+    with pytest.raises(ValueError, match='not a result store'):
+        ResultStore.load(str(path))
@@ -0,0 +1,52 @@
+import pytest
+from common.template import RequestTemplate
+
+
+def test_render():
+    template = RequestTemplate(['FUZZ', 'ID'], 'POST', 'http://host/FUZZ?id=ID', {'X-Test': 'FUZZ-ID'},
+                               'name=FUZZ', {'session': 'ID'})
+    assert template.positions == ['url', 'data', 'header', 'cookie']
+    assert template.render(('admin', '7')) == {
+        'method': 'POST', 'url': 'http://host/admin?id=7', 'headers': {'X-Test': 'admin-7'},
+        'data': 'name=admin', 'cookies': {'session': '7'}}
+
+
+def test_unfuzzed_parts_are_shared():
+    template = RequestTemplate(['FUZZ'], 'GET', 'http://host/FUZZ', {'Accept': '*/*'})
+    first, second = template.render(('a',)), template.render(('b',))
+    assert first['headers'] is second['headers']
+    assert (first['url'], second['url']) == ('http://host/a', 'http://host/b')
+
+
+def test_keyword_must_be_used():
+    with pytest.raises(KeyError, match='keyword USER not found'):
+        RequestTemplate(['FUZZ', 'USER'], 'GET', 'http://host/FUZZ')
+
+
+def test_render_bytes():
+    template = RequestTemplate(['FUZZ'], 'POST', 'http://host:8080/a/FUZZ?q=1', {'User-Agent': 'FUZZ'},
+                               'x=FUZZ', {'k': 'v'})
+    assert template.render_bytes(('a b',)) == (
+        b'POST /a/a%20b?q=1 HTTP/1.1\r\nHost: host:8080\r\nUser-Agent: a b\r\nCookie: k=v\r\n'
+        b'Content-Length: 5\r\n\r\nx=a b')
+    assert (template.scheme, template.netloc) == ('http', 'host:8080')
+    get = RequestTemplate(['FUZZ'], 'GET', 'http://host/FUZZ')
+    assert get.render_bytes(('x',)) == b'GET /x HTTP/1.1\r\nHost: host\r\n\r\n'
+
+
+def test_render_bytes_with_a_host_header():
+    template = RequestTemplate(['FUZZ'], 'GET', 'http://10.0.0.1/', {'host': 'FUZZ.example.com', 'Accept': '*/*'})
+    assert template.render_bytes(('dev',)) == \
+        b'GET / HTTP/1.1\r\nHost: dev.example.com\r\nAccept: */*\r\n\r\n'
+    # the connection still goes to the URL's host
+    assert template.netloc == '10.0.0.1'
+
+
+def test_render_h2():
+    template = RequestTemplate(['FUZZ'], 'POST', 'https://host/FUZZ?a=1',
+                               {'Host': 'FUZZ.example.com', 'Connection': 'keep-alive', 'X-A': 'b'},
+                               'q=FUZZ', {'k': 'v'})
+    headers, body = template.render_h2(('dev',))
+    assert headers == [(':method', 'POST'), (':scheme', 'https'), (':authority', 'dev.example.com'),
+                       (':path', '/dev?a=1'), ('x-a', 'b'), ('cookie', 'k=v'), ('content-length', '5')]
+    assert body == b'q=dev'
@@ -0,0 +1,94 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from common import throttle
+from common.throttle import AIMD, Limiter, TokenBucket, parse_retry_after
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    '''A clock moved by hand; sleeps are recorded instead of slept.'''
+    clock = SimpleNamespace(now=0., sleeps=[], lock=threading.Lock())
+
+    def sleep(seconds):
+        with clock.lock:
+            clock.sleeps.append(seconds)
+    monkeypatch.setattr(throttle, 'time', SimpleNamespace(monotonic=lambda: clock.now, sleep=sleep,
+                                                          time=throttle.time.time))
+    return clock
+
+
+def test_bucket_reserve_spaces_requests(clock):
+    bucket = TokenBucket(10)
+    assert [bucket.reserve() for _ in range(3)] == [0., 0.1, 0.2]
+    clock.now = 1.
+    # the debt is paid back, and no more than the burst is saved up
+    assert bucket.reserve() == 0.
+    assert bucket.reserve() == pytest.approx(0.1)
+
+
+def test_bucket_try_take(clock):
+    bucket = TokenBucket(4)
+    assert bucket.try_take()
+    assert not bucket.try_take()
+    clock.now = 0.25
+    assert bucket.try_take()
+
+
+def test_rate_holds_across_threads(clock):
+    limiter = Limiter(1000, rate=100)
+
+    def send():
+        for _ in range(50):
+            limiter.acquire()
+            limiter.release()
+    threads = [threading.Thread(target=send) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # every request reserved its own slot, none shared one
+    assert sorted(clock.sleeps) == pytest.approx([i / 100 for i in range(400)])
+
+
+def test_pause_and_configure():
+    limiter = Limiter(2)
+    assert limiter.try_acquire() and limiter.try_acquire()
+    assert not limiter.try_acquire()
+    limiter.configure(concurrency=3)
+    assert limiter.try_acquire()
+    limiter.release()
+    limiter.configure(paused=True)
+    assert limiter.limit == 0 and not limiter.try_acquire()
+    limiter.configure(paused=False, rate=5)
+    assert limiter.settings() == {'paused': False, 'inflight': 2, 'concurrency': 3, 'rate_limit': 5}
+    limiter.configure(rate=0)
+    assert limiter.settings()['rate_limit'] is None
+
+
+def test_aimd():
+    aimd = AIMD(10, maximum=12)
+    for _ in range(20):
+        aimd.record(latency=0.1)
+    assert aimd.limit == 11
+    for _ in range(20):
+        aimd.record(latency=0.1, status=429)
+    assert aimd.limit == 5
+    for _ in range(20):
+        aimd.record(latency=1.)  # p95 ten times the baseline
+    assert aimd.limit == 2
+    for _ in range(40):
+        aimd.record(timeout=True)
+    assert aimd.limit == 1
+
+
+def test_retry_after():
+    assert parse_retry_after('2.5') == 2.5
+    assert parse_retry_after('-1') == 0.
+    assert parse_retry_after('100000') == throttle.MAX_RETRY_AFTER
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0.
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
+    aimd = AIMD(4)
+    aimd.record(status=503, retry_after='3')
+    assert 2.9 < aimd.pause() <= 3
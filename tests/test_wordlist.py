@@ -0,0 +1,109 @@
+import os
+import pickle
+import pytest
+from common.wordlist import Wordlist, Progress, index_path, to_ranges, split_ranges
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'cache'))
+
+
+@pytest.fixture
+def wordlist(tmp_path):
+    path = tmp_path / 'words.txt'
+    path.write_bytes(b''.join(b'w%d\n' % i for i in range(10)))
+    return Wordlist(str(path))
+
+
+def test_words_and_line_endings(tmp_path):
+    path = tmp_path / 'words.txt'
+    path.write_bytes(b'index\r\nadmin\n\nlast')
+    words = Wordlist(str(path))
+    assert len(words) == 4
+    assert list(words.words()) == [(0, 'index'), (1, 'admin'), (2, ''), (3, 'last')]
+    assert list(words.words([(1, 4)], skip={2})) == [(1, 'admin'), (3, 'last')]
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.txt'
+    path.write_bytes(b'')
+    assert list(Wordlist(str(path)).words()) == []
+
+
+def test_index_cached_outside_the_wordlist_directory(tmp_path, wordlist):
+    assert sorted(os.listdir(tmp_path)) == ['cache', 'words.txt']
+    assert os.path.exists(index_path(wordlist.path))
+    assert list(Wordlist(wordlist.path).words()) == list(wordlist.words())
+
+
+def test_stale_index_is_rebuilt(wordlist):
+    with open(wordlist.path, 'ab') as f:
+        f.write(b'more\n')
+    assert Wordlist(wordlist.path).word(10) == 'more'
+
+
+def test_unwritable_cache_is_ignored(tmp_path, monkeypatch, wordlist):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path / 'words.txt'))  # a file, not a directory
+    assert len(Wordlist(wordlist.path)) == 10
+
+
+def test_pipe_is_read_into_memory():
+    r, w = os.pipe()
+    os.write(w, b'index\nadmin\n')
+    os.close(w)
+    try:
+        words = Wordlist(f'/dev/fd/{r}')
+    finally:
+        os.close(r)
+    assert list(words.words()) == [(0, 'index'), (1, 'admin')]
+    assert not os.path.exists(index_path(words.path))
+    # worker processes get the contents, the pipe can't be read again
+    assert list(pickle.loads(pickle.dumps(words)).words()) == [(0, 'index'), (1, 'admin')]
+
+
+def test_progress_completes_out_of_order(wordlist):
+    progress = Progress(None, wordlist)
+    for i in (0, 2, 3, 5):
+        progress.complete(i)
+    assert progress.pending() == ([(1, 10)], {2, 3, 5})
+    assert len(progress) == 6
+    progress.complete(1)
+    assert progress.pending() == ([(4, 10)], {5})
+    progress.complete(42)  # not part of the run
+    assert len(progress) == 5
+
+
+def test_progress_resumes_from_state_file(tmp_path, wordlist):
+    state = str(tmp_path / 'state.json')
+    progress = Progress(state, wordlist)
+    for i in (0, 1, 4, 9):
+        progress.complete(i)
+    progress.save()
+    resumed = Progress(state, wordlist)
+    assert resumed.pending() == ([(2, 10)], {4, 9})
+    assert len(resumed) == 6
+
+
+def test_progress_rejects_another_wordlist(tmp_path, wordlist):
+    state = str(tmp_path / 'state.json')
+    Progress(state, wordlist).save()
+    other = tmp_path / 'other.txt'
+    other.write_bytes(b'a\nb\n')
+    with pytest.raises(ValueError, match='does not match'):
+        Progress(state, Wordlist(str(other)))
+
+
+def test_progress_only(wordlist):
+    progress = Progress(None, wordlist)
+    progress.only([7, 2, 3])
+    assert progress.pending() == ([(2, 4), (7, 8)], set())
+    with pytest.raises(ValueError, match='out of range'):
+        progress.only([3, 10])
+
+
+def test_ranges():
+    assert to_ranges([1, 2, 3, 7, 9, 10]) == [[1, 4], [7, 8], [9, 11]]
+    parts = split_ranges([(0, 5), (10, 17)], 3)
+    assert parts == [[(0, 4)], [(4, 5), (10, 13)], [(13, 17)]]
+    assert split_ranges([(0, 2)], 4) == [[(0, 1)], [(1, 2)]]